@@ -0,0 +1,8 @@
+
+def refresh(*args, **kwargs) -> dict:
+    """
+    Re-scripts specific objects and/or agent jobs without a full extraction;
+    see versioner.extractors.refresh.refresh for the arguments.
+    """
+    from .extractors.refresh import refresh as _refresh
+    return _refresh(*args, **kwargs)
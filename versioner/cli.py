@@ -3,17 +3,514 @@ import argparse
 import sys
 import os
 import yaml
+from contextlib import ExitStack
 from .core.utils import load_dotenv
+from .core.tracking import SOURCE_TYPES
 from .extractors.fabric import run_fabric_extraction
 from .extractors.onprem import run_onprem_extraction
 
+def find_config(path: str = "config.yaml") -> str:
+    """The given config path, or the config.yaml next to the package when that path does not exist."""
+    if not os.path.exists(path):
+        potential = os.path.join(os.path.dirname(os.path.dirname(__file__)), "config.yaml")
+        if os.path.exists(potential):
+            return potential
+    return path
+
 def load_config(path: str = "config.yaml") -> dict:
     if os.path.exists(path):
         with open(path, "r", encoding="utf-8") as f:
             return yaml.safe_load(f) or {}
     return {}
 
-def main():
+def run_deps(argv):
+    """Answers 'what depends on X' from the dependency indexes written during extraction."""
+    from .core.dependencies import DependencyGraph
+
+    parser = argparse.ArgumentParser(prog="versioner deps", description="Query object dependencies across all extracted databases.")
+    parser.add_argument("object", help="Object as TYPE/db.schema.name, db.schema.name, schema.name or name.")
+    parser.add_argument("--repo-root", default=".", help="Root directory holding extracted files.")
+    parser.add_argument("--type", help="Restrict to one source folder (e.g. Fabric, OnPrem).")
+    parser.add_argument("--uses", action="store_true", help="List what the object depends on instead of its dependents.")
+    parser.add_argument("--direct", action="store_true", help="Only direct (depth 1) relationships.")
+    args = parser.parse_args(argv)
+
+    graph = DependencyGraph.load(args.repo_root, args.type)
+    keys = graph.resolve(args.object)
+    if not keys:
+        print(f"No dependency information found for {args.object}")
+        return 1
+
+    for key in keys:
+        if args.uses:
+            results = graph.dependencies(key, transitive=not args.direct)
+            print(f"{key} depends on {len(results)} object(s):")
+        else:
+            results = graph.dependents(key, transitive=not args.direct)
+            print(f"{len(results)} object(s) depend on {key}:")
+        for name, depth in results:
+            print(f"{'  ' * depth}{name}")
+    return 0
+
+def _add_target_args(parser):
+    """Connection arguments shared by commands that talk to a target server."""
+    parser.add_argument("--type", choices=["fabric", "onprem"], default="onprem", help="Authentication style of the target.")
+    parser.add_argument("--driver", default="ODBC Driver 17 for SQL Server", help="ODBC Driver to use.")
+    parser.add_argument("--ad-interactive", action="store_true", help="Use Active Directory Interactive auth (Fabric).")
+
+def _add_output_args(parser):
+    """Output sink arguments (see core.sinks.open_sink) shared by extraction and refresh."""
+    parser.add_argument("--output", choices=["files", "bundle", "store"], default="files", help="Write one file per object, a single SQLite bundle, or a content-addressed store.")
+    parser.add_argument("--bundle", help="Bundle path (default: <repo-root>/.versioner/<type>/bundle.sqlite).")
+    parser.add_argument("--store-refs", action="store_true", help="With --output store: write per-database _refs.json instead of hard-linked trees.")
+    parser.add_argument("--history", action="store_true", help="Record every written version in the history index.")
+    parser.add_argument("--history-db", help="History index path (default: <repo-root>/.versioner/<type>/history.sqlite).")
+    parser.add_argument("--search-index", action="store_true", help="Maintain the full-text search index of written objects.")
+    parser.add_argument("--search-db", help="Search index path (default: <repo-root>/.versioner/<type>/search.sqlite).")
+    parser.add_argument("--compare-normalized", action="store_true", help="Treat files differing only in line endings/trailing whitespace/BOM as unchanged.")
+
+def _target_conn(args, server: str):
+    """Returns (connection_string, auth_manager) for a target server."""
+    from .core.auth import AuthManager
+    from .core.connection import build_connection_string, build_onprem_connection_string
+
+    if args.type == "fabric":
+        conn_str = build_connection_string(server=server, driver=args.driver, auth_interactive=args.ad_interactive)
+        return conn_str, None if args.ad_interactive else AuthManager()
+    return build_onprem_connection_string(server, args.driver), None
+
+def run_deploy(argv):
+    """Applies versioned objects back to a target server in dependency order."""
+    from .core.sinks import is_bundle, bundle_tree
+
+    parser = argparse.ArgumentParser(prog="versioner deploy", description="Deploy versioned objects to a target database.")
+    parser.add_argument("source", help="Extracted database folder, e.g. src/OnPrem/AppDB, or a bundle file with --prefix.")
+    parser.add_argument("--prefix", help="Database folder inside a bundle source, e.g. src/OnPrem/AppDB.")
+    parser.add_argument("--server", help="Target SQL Server hostname.")
+    parser.add_argument("--database", help="Target database (default: the source database recorded in the folder).")
+    parser.add_argument("--conn", help="ODBC connection string for the target (overrides --server).")
+    _add_target_args(parser)
+    parser.add_argument("--since", help="Only deploy files changed since this git revision.")
+    parser.add_argument("--files", nargs="+", help="Only deploy these object files.")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel connections per dependency level (default: 4).")
+    parser.add_argument("--transaction", action="store_true", help="Run each object in its own transaction.")
+    parser.add_argument("--create-or-alter", action="store_true", help="Rewrite CREATE into CREATE OR ALTER.")
+    parser.add_argument("--dry-run", action="store_true", help="Show the deployment plan without connecting.")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Enable verbose logging.")
+    args = parser.parse_args(argv)
+
+    if is_bundle(args.source):
+        if not args.prefix:
+            print("ERROR: A bundle source needs --prefix naming the database folder, e.g. src/OnPrem/AppDB.")
+            return 1
+        if args.since or args.files:
+            print("ERROR: --since and --files select files of an extracted folder; export the bundle first.")
+            return 1
+        prefix = args.prefix.replace(os.sep, "/").strip("/")
+        with bundle_tree(args.source, prefix) as root:
+            return _deploy(args, os.path.join(root, *prefix.split("/")))
+    return _deploy(args, os.path.normpath(args.source))
+
+def _deploy(args, source: str):
+    from .core.connection import replace_db_in_conn, open_connection
+    from .core.deploy import source_database, collect_objects, order_levels, split_batches, create_or_alter, git_changed_files, ConnectionPool, deploy_levels
+
+    if not os.path.isdir(source):
+        print(f"ERROR: Source folder {source} does not exist.")
+        return 1
+    # Objects are keyed by the source database, as in its dependency index; the target may differ
+    source_db = source_database(source) or args.database
+    if not source_db:
+        print(f"ERROR: {source} has no _dependencies.json or _manifest.json naming its database; pass --database.")
+        return 1
+    db_name = args.database or source_db
+
+    paths = None
+    if args.files:
+        paths = args.files
+    elif args.since:
+        paths = git_changed_files(source, args.since)
+
+    objects = collect_objects(source, source_db, paths)
+    if not objects:
+        print("No objects to deploy.")
+        return 0
+    for obj in objects:
+        with open(obj.path, "r", encoding="utf-8-sig") as f:
+            obj.batches = split_batches(f.read())
+        if args.create_or_alter:
+            obj.batches = [create_or_alter(b) for b in obj.batches]
+
+    levels = order_levels(objects)
+    print(f"Deploying {len(objects)} object(s) in {len(levels)} level(s) to {db_name}")
+
+    pool = None
+    if not args.dry_run:
+        auth = None
+        if args.conn:
+            conn_str = args.conn
+        elif not args.server:
+            print("ERROR: No target specified. Use --server or --conn.")
+            return 1
+        else:
+            conn_str, auth = _target_conn(args, args.server)
+        conn_str = replace_db_in_conn(conn_str, db_name)
+        pool = ConnectionPool(lambda: open_connection(conn_str, auth_manager=auth), args.workers)
+
+    try:
+        deployed, failed, skipped = deploy_levels(
+            levels, pool, workers=args.workers, transaction=args.transaction, dry_run=args.dry_run, verbose=args.verbose
+        )
+    finally:
+        if pool:
+            pool.close()
+
+    print(f"Total deployed: {deployed}, failed: {failed}, skipped: {skipped}")
+    return 1 if failed else 0
+
+def run_drift(argv):
+    """Compares per-object definition hashes between two servers, databases, extracted folders or bundles."""
+    parser = argparse.ArgumentParser(prog="versioner drift", description="Report objects whose definitions differ between two sources.")
+    parser.add_argument("left", help="SERVER, SERVER/DATABASE, an extracted folder (src/<type> or src/<type>/<db>) or a bundle file.")
+    parser.add_argument("right", help="Same forms as left.")
+    parser.add_argument("--database", help="Database to compare when a side is given as SERVER only.")
+    parser.add_argument("--show-diff", action="store_true", help="Fetch full text of differing objects and print a diff.")
+    parser.add_argument("--config", default="config.yaml", help="Path to config.yaml; its filters for --type apply to both sides (default: config.yaml).")
+    _add_target_args(parser)
+    parser.add_argument("--verbose", "-v", action="store_true", help="Enable verbose logging.")
+    args = parser.parse_args(argv)
+
+    # Bundles are exported to temporary folders for the duration of the comparison
+    with ExitStack() as stack:
+        try:
+            return _drift(args, stack)
+        except ValueError as e:
+            print(f"ERROR: {e}")
+            return 1
+
+def _drift(args, stack):
+    from .core.connection import replace_db_in_conn, open_connection, list_databases
+    from .core.drift import manifest_hashes, manifest_databases, server_hashes, compare_hashes, fetch_definitions, read_definitions, unified_diff
+    from .core.manifest import MANIFEST_FILE
+    from .core.sinks import is_bundle, bundle_tree
+    from .core.filters import resolve_filters, filter_databases
+
+    # The extraction filters of the environment: excluded objects are neither compared nor hashed
+    env_config = (load_config(find_config(args.config)).get("environments") or {}).get(args.type) or {}
+
+    def bundle_folder(path):
+        # A bundle holds src/<type>/...; its exported tree is read like an extracted folder
+        src = os.path.join(stack.enter_context(bundle_tree(path)), "src")
+        types = sorted(os.listdir(src)) if os.path.isdir(src) else []
+        if len(types) != 1:
+            raise ValueError(f"Bundle {path} holds {len(types)} source folders below src/; expected one")
+        return os.path.join(src, types[0])
+
+    class Side:
+        """One side of the comparison: an extracted folder (or bundle) or a live server."""
+        def __init__(self, spec):
+            self.spec = spec
+            self.folder = spec if os.path.isdir(spec) else bundle_folder(spec) if is_bundle(spec) else None
+            self.server, _, self.database = ("" if self.folder else spec).partition("/")
+            self.database = self.database or args.database
+            if not self.folder:
+                self.conn_str, self.auth = _target_conn(args, self.server)
+
+        def databases(self):
+            if self.folder:
+                if os.path.exists(os.path.join(self.folder, MANIFEST_FILE)):
+                    return {os.path.basename(os.path.normpath(self.folder)): self.folder}
+                found = manifest_databases(self.folder)
+                return {d: found[d] for d in filter_databases(resolve_filters(env_config, live_server), list(found))}
+            if self.database:
+                return {self.database: self.database}
+            filters = resolve_filters(env_config, self.server)
+            return {d: d for d in list_databases(self.conn_str, auth_manager=self.auth, verbose=args.verbose, filters=filters)}
+
+        def _connect(self, db):
+            return open_connection(replace_db_in_conn(self.conn_str, db), auth_manager=self.auth)
+
+        def hashes(self, db, filters):
+            if self.folder:
+                return manifest_hashes(db, filters)
+            with self._connect(db) as conn:
+                return server_hashes(conn, filters)
+
+        def definitions(self, db, keys):
+            if self.folder:
+                return read_definitions(db, keys)
+            with self._connect(db) as conn:
+                return fetch_definitions(conn, keys)
+
+    left, right = Side(args.left), Side(args.right)
+    # Both sides use the filters of the first live server, so an object is either compared on both or on neither
+    live_server = left.server or right.server or None
+    ldbs, rdbs = left.databases(), right.databases()
+
+    # Single databases are compared directly; sets of databases are paired by name
+    if len(ldbs) == 1 and len(rdbs) == 1:
+        pairs = [(next(iter(ldbs)), next(iter(ldbs.values())), next(iter(rdbs.values())))]
+    else:
+        rlow = {k.lower(): k for k in rdbs}
+        pairs = []
+        for db in sorted(ldbs):
+            if db.lower() in rlow:
+                pairs.append((db, ldbs[db], rdbs[rlow.pop(db.lower())]))
+            else:
+                print(f"[{db}] database only in {args.left}")
+        for db in sorted(rlow.values()):
+            print(f"[{db}] database only in {args.right}")
+
+    labels = {"different": "DIFFERENT", "left_only": f"ONLY IN {args.left}", "right_only": f"ONLY IN {args.right}"}
+    total = 0
+    drifted = 0
+    for db, lsrc, rsrc in pairs:
+        try:
+            filters = resolve_filters(env_config, live_server, db)
+            lh, rh = left.hashes(lsrc, filters), right.hashes(rsrc, filters)
+        except Exception as e:
+            print(f"ERROR: [{db}] Failed to read hashes: {e}")
+            drifted += 1
+            continue
+        results = compare_hashes(lh, rh)
+        total += len(set(k.lower() for k in lh) | set(k.lower() for k in rh))
+        drifted += len(results)
+        for key, status in results:
+            print(f"[{db}] {labels[status]}: {key}")
+
+        differing = [k for k, status in results if status == "different"]
+        if args.show_diff and differing:
+            ldefs, rdefs = left.definitions(lsrc, differing), right.definitions(rsrc, differing)
+            for key in differing:
+                print(unified_diff(key, ldefs.get(key), rdefs.get(key), args.left, args.right))
+
+    print(f"Total compared: {total}, differing: {drifted}")
+    return 1 if drifted else 0
+
+def run_merge_state(argv):
+    """Combines shard state fragments into last_run.yaml."""
+    from .core.sharding import merge_state, COSTS_FILE
+    from .core.tracking import LAST_RUN_KEYS
+
+    parser = argparse.ArgumentParser(prog="versioner merge-state", description="Merge shard state fragments into last_run.yaml.")
+    parser.add_argument("--type", choices=["fabric", "onprem"], required=True, help="Type of environment: fabric or onprem")
+    parser.add_argument("--state-dir", default=".", help="Directory holding the shard fragments (default: .).")
+    parser.add_argument("--last-run", default="last_run.yaml", help="State file to update (default: last_run.yaml).")
+    parser.add_argument("--costs", default=COSTS_FILE, help=f"Cost history file to update (default: {COSTS_FILE}).")
+    parser.add_argument("--run-id", help="Run whose fragments to merge (default: GITHUB_RUN_ID; required when fragments of several runs are present).")
+    parser.add_argument("--keep", action="store_true", help="Keep the fragments after merging.")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Enable verbose logging.")
+    args = parser.parse_args(argv)
+
+    ok = merge_state(args.state_dir, LAST_RUN_KEYS[args.type], args.last_run, args.costs, keep=args.keep, verbose=args.verbose, run_id=args.run_id)
+    return 0 if ok else 1
+
+def run_export(argv):
+    """Materialises the classic file tree from a bundle or a content-addressed store."""
+    from .core.filesystem import write_if_changed, is_different
+    from .core.sinks import iter_bundle, iter_store
+
+    parser = argparse.ArgumentParser(prog="versioner export", description="Write the objects of a bundle or store out as files.")
+    parser.add_argument("bundle", help="Bundle file written with --output bundle, or src/<type> written with --output store --store-refs.")
+    parser.add_argument("--repo-root", default=".", help="Root directory to write the tree into.")
+    parser.add_argument("--prefix", help="Only export paths below this prefix (e.g. src/OnPrem/AppDB).")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the files that would change.")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Enable verbose logging.")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.bundle):
+        print(f"ERROR: Bundle {args.bundle} does not exist.")
+        return 1
+
+    changed = 0
+    skipped = 0
+    if os.path.isdir(args.bundle):
+        prefix = (args.prefix or "").replace(os.sep, "/").rstrip("/")
+        items = ((p, c) for p, c in iter_store(args.bundle) if not prefix or p.startswith(prefix + "/"))
+    else:
+        items = iter_bundle(args.bundle, args.prefix)
+
+    for rel_path, content in items:
+        dest_file = os.path.join(args.repo_root, *rel_path.split("/"))
+        if args.dry_run:
+            written = is_different(dest_file, content)
+        else:
+            written = write_if_changed(dest_file, content)
+        if written:
+            changed += 1
+            if args.verbose or args.dry_run:
+                print(f"{'WOULD WRITE' if args.dry_run else 'WROTE'}: {dest_file}")
+        else:
+            skipped += 1
+
+    print(f"Total changed: {changed}, skipped: {skipped}")
+    return 0
+
+def run_history(argv):
+    """Timelines and point-in-time versions from the history index written with --history."""
+    from .core.history import HISTORY_FILE, timeline, version_at, snapshot
+    from .core.filesystem import index_path
+    from .core.filesystem import write_if_changed
+
+    parser = argparse.ArgumentParser(prog="versioner history", description="Query the version history of extracted objects.")
+    parser.add_argument("--type", choices=["fabric", "onprem"], default="onprem", help="Extraction type (default: onprem).")
+    parser.add_argument("--repo-root", default=".", help="Root directory holding extracted files.")
+    parser.add_argument("--db", help="History index (default: <repo-root>/.versioner/<type>/history.sqlite).")
+    sub = parser.add_subparsers(dest="action", required=True)
+    p_timeline = sub.add_parser("timeline", help="List every recorded version of an object.")
+    p_timeline.add_argument("object", help="Object key (TYPE/db.schema.name, server/SQL_AGENT_JOBS/job) or tree path; db.schema.name works when only one type has that name.")
+    p_show = sub.add_parser("show", help="Print an object as it was at a point in time.")
+    p_show.add_argument("object", help="Object key or tree path.")
+    p_show.add_argument("--at", help="Point in time (ISO date/time, UTC); default: latest.")
+    p_checkout = sub.add_parser("checkout", help="Write the tree as it was at a point in time.")
+    p_checkout.add_argument("--at", required=True, help="Point in time (ISO date/time, UTC).")
+    p_checkout.add_argument("--prefix", help="Only paths below this prefix (e.g. src/OnPrem/AppDB).")
+    p_checkout.add_argument("--dest", required=True, help="Directory to write the tree into.")
+    args = parser.parse_args(argv)
+
+    db_path = args.db or index_path(args.repo_root, SOURCE_TYPES[args.type], HISTORY_FILE)
+    if not os.path.exists(db_path):
+        print(f"ERROR: History index {db_path} does not exist; extract with --history first.")
+        return 1
+
+    try:
+        if args.action == "timeline":
+            versions = timeline(db_path, args.object)
+        elif args.action == "show":
+            found = version_at(db_path, args.object, args.at)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        return 1
+
+    if args.action == "timeline":
+        if not versions:
+            print(f"No history for {args.object}")
+            return 1
+        for v in versions:
+            print(f"{v['modified'] or '-':<26} {v['hash'][:12]}  run {v['run_id']}  recorded {v['recorded_at'][:19]}  {v['path']}")
+        return 0
+
+    if args.action == "show":
+        if not found:
+            print(f"No version of {args.object}{' at ' + args.at if args.at else ''}")
+            return 1
+        info, content = found
+        print(f"-- {info['key']} as of {info['modified'] or info['recorded_at']} (run {info['run_id']})")
+        print(content, end="")
+        return 0
+
+    written = 0
+    for rel_path, content in snapshot(db_path, args.at, args.prefix):
+        if write_if_changed(os.path.join(args.dest, *rel_path.split("/")), content):
+            written += 1
+    print(f"Wrote {written} files to {args.dest}")
+    return 0
+
+def run_search(argv):
+    """Full-text search over definitions and agent jobs, from the index written with --search-index."""
+    from .core.search import SEARCH_FILE, search, phrase_query
+    from .core.filesystem import index_path
+
+    parser = argparse.ArgumentParser(prog="versioner search", description="Search extracted definitions and agent job commands.")
+    parser.add_argument("query", help="Text to find, matched as a phrase of whole tokens (e.g. dbo.FactSales, LINKEDSRV).")
+    parser.add_argument("--fts", action="store_true", help="Pass the query to FTS5 as is (AND/OR/NEAR, prefix*).")
+    parser.add_argument("--type", choices=["fabric", "onprem"], default="onprem", help="Extraction type (default: onprem).")
+    parser.add_argument("--repo-root", default=".", help="Root directory holding extracted files.")
+    parser.add_argument("--db", help="Search index (default: <repo-root>/.versioner/<type>/search.sqlite).")
+    parser.add_argument("--server", help="Only objects from this server.")
+    parser.add_argument("--database", help="Only objects from this database.")
+    parser.add_argument("--schema", help="Only objects in this schema.")
+    parser.add_argument("--object-type", help="Only this object type (V, P, JOB).")
+    parser.add_argument("--limit", type=int, default=50, help="Maximum number of results (default: 50).")
+    args = parser.parse_args(argv)
+
+    db_path = args.db or index_path(args.repo_root, SOURCE_TYPES[args.type], SEARCH_FILE)
+    if not os.path.exists(db_path):
+        print(f"ERROR: Search index {db_path} does not exist; extract with --search-index first.")
+        return 1
+
+    import sqlite3
+    try:
+        results = search(
+            db_path, args.query if args.fts else phrase_query(args.query),
+            server=args.server, database=args.database, schema=args.schema,
+            object_type=args.object_type.upper() if args.object_type else None, limit=args.limit
+        )
+    except sqlite3.OperationalError as e:
+        print(f"ERROR: Invalid search query: {e}")
+        return 1
+
+    for r in results:
+        print(f"{r['path']}  [{r['type']}]")
+        print(f"    {' '.join(r['snippet'].split())}")
+    print(f"{len(results)} result(s){' (limit reached)' if len(results) == args.limit else ''}")
+    return 0 if results else 1
+
+def run_refresh(argv):
+    """Re-scripts specific objects or agent jobs, e.g. right after a deployment; last_run.yaml is left alone."""
+    from .extractors.refresh import refresh
+    from .core.sinks import open_sink
+
+    parser = argparse.ArgumentParser(prog="versioner refresh", description="Re-script specific objects or agent jobs.")
+    parser.add_argument("--server", required=True, help="SQL Server hostname.")
+    parser.add_argument("--database", help="Database of the objects.")
+    parser.add_argument("--objects", nargs="+", default=[], help="Objects as name, schema.name or db.schema.name.")
+    parser.add_argument("--objects-file", help="File with one object per line (e.g. written by a deployment pipeline).")
+    parser.add_argument("--jobs", nargs="+", default=[], help="SQL Agent job names (OnPrem).")
+    parser.add_argument("--conn", help="ODBC connection string (overrides the built connection).")
+    _add_target_args(parser)
+    parser.add_argument("--repo-root", default=".", help="Root directory holding extracted files.")
+    parser.add_argument("--include-drop", action="store_true", help="Include DROP statements in SQL.")
+    parser.add_argument("--header", action="store_true", help="Include header comments in SQL.")
+    parser.add_argument("--include-dependencies", action="store_true", help="Update the dependency index of the re-scripted objects.")
+    parser.add_argument("--dry-run", action="store_true", help="Simulate writes.")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Enable verbose logging.")
+    _add_output_args(parser)
+    args = parser.parse_args(argv)
+
+    objects = list(args.objects)
+    if args.objects_file:
+        with open(args.objects_file, "r", encoding="utf-8") as f:
+            objects.extend(ln.strip() for ln in f if ln.strip() and not ln.lstrip().startswith("#"))
+    if not objects and not args.jobs:
+        parser.error("nothing to refresh; give --objects, --objects-file or --jobs")
+
+    conn_str, auth = (args.conn, None) if args.conn else _target_conn(args, args.server)
+    sink = open_sink(args, args.repo_root, SOURCE_TYPES[args.type])
+    try:
+        result = refresh(
+            args.server, args.database, objects=objects, jobs=args.jobs, source=args.type, repo_root=args.repo_root,
+            conn_str=conn_str, auth_manager=auth, driver=args.driver, include_drop=args.include_drop,
+            include_header=args.header, include_dependencies=args.include_dependencies,
+            dry_run=args.dry_run, verbose=args.verbose, sink=sink
+        )
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        return 1
+    finally:
+        sink.close()
+
+    print(f"Total changed: {result['changed']}, skipped: {result['skipped']}, missing: {len(result['missing'])}")
+    return 1 if result["missing"] else 0
+
+# Subcommands; anything else is treated as the classic extraction invocation.
+COMMANDS = {
+    "deps": run_deps,
+    "deploy": run_deploy,
+    "drift": run_drift,
+    "merge-state": run_merge_state,
+    "export": run_export,
+    "history": run_history,
+    "search": run_search,
+    "refresh": run_refresh,
+}
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in COMMANDS:
+        load_dotenv()
+        sys.exit(COMMANDS[argv[0]](argv[1:]))
+
     parser = argparse.ArgumentParser(description="Extract SQL Server objects for version control.")
     
     # Core arguments
@@ -39,38 +536,86 @@ def main():
     parser.add_argument("--sp-client-id", help="Service Principal Client ID.")
     parser.add_argument("--sp-client-secret", help="Service Principal Client Secret.")
     parser.add_argument("--sp-fallback", action="store_true", help="Fallback to legacy UID/PWD for SP auth.")
+
+    # Discovery
+    parser.add_argument("--discovery-cache", default="discovery_cache.json", help="Cache of resolved driver and database lists (default: discovery_cache.json).")
+    parser.add_argument("--discovery-ttl", type=float, default=86400, help="Seconds a cached database list is reused while its probe matches (default: 86400).")
+    parser.add_argument("--refresh-discovery", action="store_true", help="Ignore the discovery cache contents and list every server again.")
+    parser.add_argument("--no-discovery-cache", action="store_true", help="Do not read or write the discovery cache.")
     
     # Extraction flags
     parser.add_argument("--include-drop", action="store_true", help="Include DROP statements in SQL.")
     parser.add_argument("--header", action="store_true", help="Include header comments in SQL.")
     parser.add_argument("--include-sql-agent-jobs", action="store_true", help="Extract SQL Agent Jobs (OnPrem).")
+    parser.add_argument("--include-dependencies", action="store_true", help="Maintain the object dependency index.")
+    parser.add_argument("--server-wide", action="store_true", help="Fetch all database catalogs of a server in one batch (OnPrem).")
+
+    # Load
+    parser.add_argument("--workers", type=int, help="Databases extracted in parallel per server (OnPrem, default: 1).")
+    parser.add_argument("--low-impact", action="store_true", help="Lock timeout, low deadlock priority and load-adaptive concurrency (OnPrem).")
+
+    # Output
+    _add_output_args(parser)
+
+    # Sharding
+    parser.add_argument("--shard", help="Only process shard i of n (e.g. 2/4) of the server/database work units.")
+    parser.add_argument("--shard-by", choices=["hash", "cost"], default="hash", help="Partition units by stable hash or by cost history (run_costs.yaml).")
+    parser.add_argument("--state-dir", default=".", help="Directory for shard state fragments (default: .).")
+    parser.add_argument("--run-id", help="Identifies the run the shard belongs to (default: GITHUB_RUN_ID).")
+
+    # Profiling
+    parser.add_argument("--profile", action="store_true", help="Profile the run per phase (hot functions, allocations, flamegraph stacks).")
+    parser.add_argument("--profile-dir", default="profile", help="Directory for profiling reports (default: profile).")
     
     # Legacy flag support
     parser.add_argument("--export-env", action="store_true", help="Update .env with current DB (Fabric).")
     parser.add_argument("--include-second-server", action="store_true", help="Process secondary server (Fabric).")
     parser.add_argument("--all-servers", action="store_true", help="No-op flag for compatibility (use config for list).")
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+
+    if args.shard:
+        from .core.sharding import parse_shard, resolve_run_id
+        try:
+            parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+        if not resolve_run_id(args.run_id):
+            parser.error("--shard needs --run-id (or GITHUB_RUN_ID) so merge-state only combines fragments of one run")
     
     # Load .env
     load_dotenv()
     
-    config_path = args.config
-    if not os.path.exists(config_path):
-         package_dir = os.path.dirname(os.path.dirname(__file__))
-         potential = os.path.join(package_dir, "config.yaml")
-         if os.path.exists(potential):
-             config_path = potential
-             
+    config_path = find_config(args.config)
     config = load_config(config_path)
     
     if args.verbose:
         print(f"Using configuration from: {config_path if os.path.exists(config_path) else 'Defaults (empty)'}")
-        
-    if args.type.lower() == "fabric":
-        run_fabric_extraction(args, config)
-    elif args.type.lower() == "onprem":
-        run_onprem_extraction(args, config)
+
+    if args.profile:
+        from .core.profiling import start_profiling, stop_profiling
+        # cProfile only sees the thread that enters a phase
+        if (args.workers or 1) > 1 or args.low_impact:
+            print("WARN: --profile runs databases one at a time.")
+        args.workers = 1
+        start_profiling(args.profile_dir, verbose=args.verbose)
+
+    if not args.no_discovery_cache:
+        from .core.discovery import open_discovery_cache
+        open_discovery_cache(args.discovery_cache, ttl=args.discovery_ttl, refresh=args.refresh_discovery)
+
+    try:
+        # Looked up at call time, so the profiler's instrumented versions are used
+        if args.type.lower() == "fabric":
+            run_fabric_extraction(args, config)
+        elif args.type.lower() == "onprem":
+            run_onprem_extraction(args, config)
+    finally:
+        if not args.no_discovery_cache:
+            from .core.discovery import close_discovery_cache
+            close_discovery_cache()
+        if args.profile:
+            print(f"WROTE: {stop_profiling()}")
         
 if __name__ == "__main__":
     main()
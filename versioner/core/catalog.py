@@ -0,0 +1,70 @@
+
+import os
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from .filters import apply_filters
+from .utils import bracket_ident
+
+# Object type code -> folder / DDL keyword; one entry per object class of queries/sql_objects.sql
+TYPE_FOLDERS = {
+    "V": "VIEW",
+    "P": "PROCEDURE",
+    "FN": "FUNCTION",
+    "IF": "FUNCTION",
+    "TF": "FUNCTION",
+    "TR": "TRIGGER",
+    "DT": "DATABASE_TRIGGER",
+    "SN": "SYNONYM",
+    "SO": "SEQUENCE",
+    "TT": "TYPE",
+}
+
+# Marker line in sql_object_hashes.sql replaced by the catalog query
+CATALOG_MARKER = "-- @catalog"
+
+# Column expressions of the catalog query for core.filters.build_filter_sql
+CATALOG_FILTER_EXPRS = {"schema_expr": "c.SchemaName", "name_expr": "c.ObjectName", "type_expr": "c.ObjectType"}
+
+# VALUES row constructors are limited to 1000 rows
+KEY_LOOKUP_CHUNK = 1000
+
+@lru_cache(maxsize=None)
+def _template() -> str:
+    query_path = os.path.join(os.path.dirname(__file__), "..", "queries", "sql_objects.sql")
+    with open(query_path, "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+def catalog_query(database: Optional[str] = None) -> str:
+    """
+    The combined catalog query (queries/sql_objects.sql): every object class of a database in one pass.
+    Runs against the current database, or with three-part names against the given one (server-wide batches).
+    """
+    template = _template()
+    if database is None:
+        return template.replace("@database_name", "DB_NAME()").replace("@database.", "")
+    template = template.replace("@database_name", "N'" + database.replace("'", "''") + "'")
+    return template.replace("@database.", bracket_ident(database) + ".")
+
+def catalog_hash_query(filter_sql: str = "") -> str:
+    """
+    Server-side HASHBYTES over the definitions of the catalog query, as stored in the manifest.
+    filter_sql (see core.filters.build_filter_sql with CATALOG_FILTER_EXPRS) restricts the objects hashed.
+    """
+    query_path = os.path.join(os.path.dirname(__file__), "..", "queries", "sql_object_hashes.sql")
+    with open(query_path, "r", encoding="utf-8") as f:
+        query_sql = f.read()
+    return query_sql.replace(CATALOG_MARKER, apply_filters(catalog_query(), filter_sql), 1)
+
+def key_filter_sql(objects: List[Tuple[str, str]]) -> Tuple[str, list]:
+    """
+    Restricts the catalog query to (schema, name) pairs (at most KEY_LOOKUP_CHUNK per query),
+    as a predicate for the filter marker with bound parameters.
+    """
+    params = []
+    for schema, name in objects:
+        params.extend((schema, name))
+    values = ", ".join(["(?, ?)"] * len(objects))
+    return (
+        f"AND EXISTS (SELECT 1 FROM (VALUES {values}) k (SchemaName, ObjectName) "
+        f"WHERE k.SchemaName = c.SchemaName AND k.ObjectName = c.ObjectName)"
+    ), params
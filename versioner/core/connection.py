@@ -1,11 +1,26 @@
 
 import pyodbc
 import re
+import traceback
 from typing import List, Optional
 from .auth import AuthManager
+from .filters import build_filter_sql, apply_filters, filter_databases
+from .discovery import active_cache, load_query, probe_values, user_databases
 
 def ensure_driver_available(driver_name: str) -> str:
     """Checks if the requested driver is available, or finds a suitable fallback."""
+    cache = active_cache()
+    if cache:
+        # A cached driver may have been uninstalled since; only trust it while it is still listed
+        cached = cache.driver(driver_name)
+        if cached and cached in pyodbc.drivers():
+            return cached
+        resolved = _resolve_driver(driver_name)
+        cache.set_driver(driver_name, resolved)
+        return resolved
+    return _resolve_driver(driver_name)
+
+def _resolve_driver(driver_name: str) -> str:
     installed = pyodbc.drivers()
     if driver_name in installed:
         return driver_name
@@ -84,8 +99,21 @@ def build_connection_string(
         pass
     return base
 
-def list_databases(conn_str: str, auth_manager: AuthManager = None, verbose: bool = False) -> List[str]:
-    """Lists user databases from the server."""
+def build_onprem_connection_string(server: str, driver: str = "ODBC Driver 17 for SQL Server") -> str:
+    """Builds a Windows Authentication connection string for an on-prem server."""
+    return f"DRIVER={{{driver}}};SERVER={server};Trusted_Connection=yes;Encrypt=yes;TrustServerCertificate=yes;"
+
+def open_connection(conn_str: str, auth_manager: AuthManager = None, autocommit: bool = True) -> pyodbc.Connection:
+    """Opens a connection, injecting the Service Principal access token when available."""
+    connect_args = {"autocommit": autocommit}
+    if auth_manager and auth_manager.get_token_credential():
+        token_bytes = auth_manager.get_access_token()
+        if token_bytes:
+            connect_args["attrs_before"] = {1256: token_bytes}
+    return pyodbc.connect(conn_str, **connect_args)
+
+def list_databases(conn_str: str, auth_manager: AuthManager = None, verbose: bool = False, filters: Optional[dict] = None) -> List[str]:
+    """Lists user databases from the server, applying include/exclude_databases from filters in the query."""
     master_conn = replace_db_in_conn(conn_str, "master")
     dbs = []
     
@@ -93,23 +121,21 @@ def list_databases(conn_str: str, auth_manager: AuthManager = None, verbose: boo
         masked = re.sub(r'(?i)\b(pwd|password)=[^;]+', r'\1=***', master_conn)
         print(f"DEBUG: Listing databases using connection string: {masked}")
 
+    cache = active_cache()
     try:
-        connect_args = {"autocommit": True}
-        if auth_manager and auth_manager.get_token_credential():
-            token_bytes = auth_manager.get_access_token()
-            if token_bytes:
-                connect_args["attrs_before"] = {1256: token_bytes}
-        
-        with pyodbc.connect(master_conn, **connect_args) as conn:
+        with open_connection(master_conn, auth_manager=auth_manager) as conn:
             cur = conn.cursor()
-            cur.execute(r"""
-                SELECT name
-                FROM sys.databases
-                WHERE database_id > 4 --- skips system databases 
-                    AND state = 0 --- skips offline databases
-                ORDER BY name;
-            """)
-            rows = cur.fetchall()
+            rows = []
+            if cache:
+                server = get_server_name_from_conn(conn_str)
+                try:
+                    dbs = _discover_databases(cur, server, cache, verbose)
+                except Exception as e:
+                    # The discovery cache is an optimisation; never skip a server over it
+                    print(f"WARN: [Server: {server}] Discovery failed, listing sys.databases directly: {e}")
+                    rows = _query_databases(conn.cursor(), filters)
+            else:
+                rows = _query_databases(cur, filters)
             
         for row in rows:
             try:
@@ -122,6 +148,45 @@ def list_databases(conn_str: str, auth_manager: AuthManager = None, verbose: boo
             traceback.print_exc()
         print(f"WARN: Failed to list databases: {e}")
         
+    if filters:
+        dbs = filter_databases(filters, dbs, verbose=verbose)
+
     if verbose:
         print(f"DEBUG: Found {len(dbs)} databases: {', '.join(dbs)}")
     return dbs
+
+def _query_databases(cur, filters: Optional[dict]) -> list:
+    """Lists online user databases, with the database filters applied in the query."""
+    filter_sql, params = build_filter_sql(
+        filters or {}, name_expr="name", name_keys=("include_databases", "exclude_databases")
+    )
+    cur.execute(apply_filters(r"""
+        SELECT name
+        FROM sys.databases
+        WHERE database_id > 4 --- skips system databases 
+            AND state = 0 --- skips offline databases
+            -- @filters
+        ORDER BY name;
+    """, filter_sql), *params)
+    return cur.fetchall()
+
+def _discover_databases(cur, server: str, cache, verbose: bool = False) -> List[str]:
+    """
+    Online user databases of a server through the discovery cache: a cached list within the TTL
+    is reused if the one-row probe still matches, otherwise sys.databases is listed and cached again.
+    """
+    entry = cache.server(server)
+    if entry:
+        row = cur.execute(load_query("discovery_probe.sql")).fetchone()
+        if row is not None and probe_values(row) == entry.get("probe"):
+            if verbose:
+                print(f"DEBUG: [Server: {server}] database list unchanged since {entry['checked_at']} (discovery cache)")
+            cache.confirm_server(server)
+            return user_databases(entry)
+        if verbose:
+            print(f"DEBUG: [Server: {server}] databases changed, listing again")
+    cur.execute(load_query("discovery_databases.sql"))
+    entry = cache.set_server(server, cur.fetchall())
+    if verbose:
+        print(f"DEBUG: [Server: {server}] {entry['edition']} {entry['product_version']}, {len(entry['databases'])} databases listed")
+    return user_databases(entry)
@@ -0,0 +1,193 @@
+
+import os
+import json
+import glob
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+from .catalog import TYPE_FOLDERS
+from .filesystem import json_text, write_json
+
+# Index file stored alongside the object folders of each database:
+# <repo-root>/src/<type>/<sanitised-db-name>/_dependencies.json
+DEPENDENCY_INDEX = "_dependencies.json"
+
+# Bumped when the key format changes; older indexes are rebuilt in full on the next run
+DEPENDENCY_INDEX_VERSION = 2
+
+def object_key(database: str, schema: str, name: str, server: Optional[str] = None, type_folder: Optional[str] = None) -> str:
+    """
+    Builds the dotted key used for objects in the dependency index.
+    With type_folder it becomes TYPE/db.schema.name, as a table type and a procedure may share schema and name.
+    """
+    parts = [server] if server else []
+    parts.extend([database or "", schema or "dbo", name or ""])
+    key = ".".join(parts)
+    return f"{type_folder}/{key}" if type_folder else key
+
+def split_object_key(key: str) -> Tuple[Optional[str], str]:
+    """Returns (type_folder or None, dotted name) of an object key."""
+    type_folder, sep, rest = key.partition("/")
+    return (type_folder, rest) if sep else (None, key)
+
+def typed_key(database: str, schema: str, name: str, type_code: Optional[str], server: Optional[str] = None) -> str:
+    """object_key qualified by the folder of a sys.objects type code; types without a folder (tables) stay untyped."""
+    return object_key(database, schema, name, server=server, type_folder=TYPE_FOLDERS.get((type_code or "").strip()))
+
+def load_dependency_index(path: str, sink=None) -> Optional[dict]:
+    """
+    Loads a per-database dependency index, or None if it does not exist.
+    With a sink (core.sinks), path is relative to its root and read through it, e.g. from a bundle.
+    """
+    try:
+        if sink is not None:
+            text = sink.read_state(path)
+            if text is None:
+                return None
+            data = json.loads(text) or {}
+        else:
+            if not os.path.exists(path):
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f) or {}
+    except Exception as e:
+        print(f"WARN: Failed to read dependency index {path}: {e}")
+        return None
+    if data.get("objects") and data.get("version") != DEPENDENCY_INDEX_VERSION:
+        print(f"WARN: Dependency index {path} predates type-qualified keys; it is rebuilt by the next extraction.")
+        return None
+    data["version"] = DEPENDENCY_INDEX_VERSION
+    data.setdefault("objects", {})
+    return data
+
+def save_dependency_index(path: str, data: dict, sink=None) -> None:
+    """Atomically writes a per-database dependency index, through the sink when given."""
+    if sink is not None:
+        sink.write_state(path, json_text(data))
+    else:
+        write_json(path, data)
+
+def update_dependency_index(
+    data: Optional[dict],
+    db_name: str,
+    rows: Iterable[tuple],
+    objects: Optional[Iterable[Tuple[str, str]]] = None
+) -> Tuple[dict, int]:
+    """
+    Merges dependency rows into an index.
+    rows: (schema, name, type, ref_server, ref_database, ref_schema, ref_name, ref_type)
+    objects: (schema, name) pairs to refresh, whatever their type; None rebuilds the whole index.
+    Keys carry the object's type folder; references carry it when the server resolved the referenced object.
+    Returns (index, updated_object_count).
+    """
+    full = data is None or objects is None
+    if data is None:
+        data = {"version": DEPENDENCY_INDEX_VERSION, "database": db_name, "objects": {}}
+    entries = {} if full else data["objects"]
+
+    wanted = None
+    if not full:
+        wanted = {object_key(db_name, s, n).lower() for s, n in objects}
+        # Re-scripted objects lose their old edges even if they no longer reference anything
+        for key in [k for k in entries if split_object_key(k)[1].lower() in wanted]:
+            del entries[key]
+
+    updated = set()
+    for schema, name, obj_type, ref_server, ref_db, ref_schema, ref_name, ref_type in rows:
+        key = typed_key(db_name, schema, name, obj_type)
+        if wanted is not None and split_object_key(key)[1].lower() not in wanted:
+            continue
+        entry = entries.setdefault(key, {"type": (obj_type or "").strip(), "references": []})
+        ref = typed_key(ref_db, ref_schema, ref_name, ref_type, server=ref_server)
+        if ref != key and ref not in entry["references"]:
+            entry["references"].append(ref)
+        updated.add(key)
+
+    for entry in entries.values():
+        entry["references"].sort()
+    data["database"] = db_name
+    data["objects"] = entries
+    return data, len(updated)
+
+
+class DependencyGraph:
+    """
+    In-memory view over every dependency index in a repository.
+    Keys are matched case-insensitively, as SQL Server does by default. A reference without a type
+    (e.g. across databases) stands for every typed object of that name.
+    """
+
+    def __init__(self):
+        self.references: Dict[str, set] = {}
+        self.referenced_by: Dict[str, set] = {}
+        self.names: Dict[str, str] = {}
+        self.typed: Dict[str, set] = {}
+
+    @classmethod
+    def load(cls, repo_root: str = ".", type_str: Optional[str] = None) -> "DependencyGraph":
+        pattern = os.path.join(repo_root, "src", type_str or "*", "*", DEPENDENCY_INDEX)
+        graph = cls()
+        for path in glob.glob(pattern):
+            data = load_dependency_index(path)
+            if data:
+                graph.add_index(data)
+        return graph
+
+    def _intern(self, key: str) -> str:
+        low = key.lower()
+        self.names.setdefault(low, key)
+        type_folder, dotted = split_object_key(low)
+        if type_folder:
+            self.typed.setdefault(dotted, set()).add(low)
+        return low
+
+    def add_index(self, data: dict) -> None:
+        for key, entry in data.get("objects", {}).items():
+            src = self._intern(key)
+            for ref in entry.get("references", []):
+                dst = self._intern(ref)
+                self.references.setdefault(src, set()).add(dst)
+                self.referenced_by.setdefault(dst, set()).add(src)
+
+    def resolve(self, name: str) -> List[str]:
+        """
+        Resolves 'TYPE/db.schema.name', 'db.schema.name', 'schema.name' or 'name' to known keys.
+        Partial names match across all databases and types.
+        """
+        low = name.lower()
+        if low in self.typed:
+            return sorted(self.names[k] for k in self.typed[low])
+        if low in self.names:
+            return [self.names[low]]
+        suffix = "." + low
+        return sorted(self.names[k] for k in self.names if k.endswith(suffix) and k not in self.typed)
+
+    def _expand(self, key: str) -> List[str]:
+        """An untyped key stands for the typed keys of that name, when there are any."""
+        return sorted(self.typed.get(key, ())) or [key]
+
+    def _walk(self, edges: Dict[str, set], key: str, transitive: bool) -> List[Tuple[str, int]]:
+        start = key.lower()
+        seen = {start}
+        out = []
+        queue = deque([(start, 0)])
+        while queue:
+            node, depth = queue.popleft()
+            # Edges recorded against the untyped name (references without a type) apply to the typed node too
+            dotted = split_object_key(node)[1]
+            nexts = set(edges.get(node, ())) | (edges.get(dotted, set()) if dotted != node else set())
+            for nxt in sorted({k for n in nexts for k in self._expand(n)}):
+                if nxt in seen:
+                    continue
+                seen.add(nxt)
+                out.append((self.names[nxt], depth + 1))
+                if transitive:
+                    queue.append((nxt, depth + 1))
+        return out
+
+    def dependents(self, key: str, transitive: bool = True) -> List[Tuple[str, int]]:
+        """Returns (key, depth) for objects that depend on key."""
+        return self._walk(self.referenced_by, key, transitive)
+
+    def dependencies(self, key: str, transitive: bool = True) -> List[Tuple[str, int]]:
+        """Returns (key, depth) for objects that key depends on."""
+        return self._walk(self.references, key, transitive)
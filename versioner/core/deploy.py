@@ -0,0 +1,262 @@
+
+import os
+import re
+import glob
+import queue
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from .filesystem import sanitise_filename
+from .dependencies import DEPENDENCY_INDEX, object_key, split_object_key, load_dependency_index
+from .manifest import MANIFEST_FILE, load_manifest, split_manifest_key
+
+# Batch separator as understood by sqlcmd/SSMS: "GO" alone on a line, optionally with a repeat count
+GO_PATTERN = re.compile(r"^[ \t]*GO(?:[ \t]+(\d+))?[ \t]*(?:--.*)?$", re.IGNORECASE)
+CREATE_PATTERN = re.compile(
+    r"^(\s*(?:--[^\n]*\n\s*|/\*.*?\*/\s*)*)CREATE\s+(?!OR\s+ALTER\b)(VIEW|PROC|PROCEDURE|FUNCTION|TRIGGER)\b",
+    re.IGNORECASE | re.DOTALL
+)
+
+class DeployObject:
+    """A versioned object file scheduled for deployment."""
+    __slots__ = ("key", "path", "depends_on", "batches")
+
+    def __init__(self, key: str, path: str):
+        self.key = key
+        self.path = path
+        self.depends_on = set()
+        self.batches = []
+
+def split_batches(sql: str) -> List[str]:
+    """Splits a script on GO separators. 'GO n' repeats the preceding batch n times."""
+    batches = []
+    current = []
+    for line in sql.replace("\r\n", "\n").split("\n"):
+        m = GO_PATTERN.match(line)
+        if not m:
+            current.append(line)
+            continue
+        batch = "\n".join(current).strip()
+        if batch:
+            batches.extend([batch] * int(m.group(1) or 1))
+        current = []
+    batch = "\n".join(current).strip()
+    if batch:
+        batches.append(batch)
+    return batches
+
+def create_or_alter(batch: str) -> str:
+    """Rewrites a leading CREATE VIEW/PROCEDURE/FUNCTION/TRIGGER into CREATE OR ALTER."""
+    return CREATE_PATTERN.sub(lambda m: f"{m.group(1)}CREATE OR ALTER {m.group(2)}", batch, count=1)
+
+def git_changed_files(source_dir: str, since: str) -> List[str]:
+    """Lists files under source_dir changed since the given git revision."""
+    out = subprocess.run(
+        ["git", "diff", "--name-only", "--diff-filter=ACMR", since, "--", "."],
+        cwd=source_dir, capture_output=True, text=True, check=True
+    ).stdout
+    top = subprocess.run(
+        ["git", "rev-parse", "--show-toplevel"], cwd=source_dir, capture_output=True, text=True, check=True
+    ).stdout.strip()
+    return [os.path.normpath(os.path.join(top, p)) for p in out.splitlines() if p.strip()]
+
+def source_database(source_dir: str) -> Optional[str]:
+    """The name of the extracted database as recorded in its dependency index or manifest."""
+    index = load_dependency_index(os.path.join(source_dir, DEPENDENCY_INDEX))
+    if index and index.get("database"):
+        return index["database"]
+    manifest_path = os.path.join(source_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        return load_manifest(manifest_path).get("database")
+    return None
+
+def collect_objects(source_dir: str, db_name: str, paths: Optional[List[str]] = None) -> List[DeployObject]:
+    """
+    Collects object scripts below src/<type>/<db> (<ObjectType>/<Schema>/<Object>.sql).
+    Objects are keyed like the dependency index, TYPE/db.schema.name (db_name must be the source database);
+    dependencies come from that index, when present.
+    """
+    files = sorted(glob.glob(os.path.join(source_dir, "*", "*", "*.sql")))
+    if paths is not None:
+        wanted = {os.path.normcase(os.path.abspath(p)) for p in paths}
+        files = [f for f in files if os.path.normcase(os.path.abspath(f)) in wanted]
+
+    index = load_dependency_index(os.path.join(source_dir, DEPENDENCY_INDEX)) or {"objects": {}}
+    entries = {k.lower(): (k, e) for k, e in index["objects"].items()}
+
+    # File names are sanitised: real names come from the manifest, else from index keys mapped through the same sanitiser
+    by_path = {}
+    manifest_path = os.path.join(source_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        for mkey, entry in load_manifest(manifest_path)["objects"].items():
+            if entry.get("path") and entry.get("schema") and entry.get("name"):
+                type_folder = split_manifest_key(mkey)[0]
+                by_path[entry["path"].lower()] = object_key(db_name, entry["schema"], entry["name"], type_folder=type_folder)
+    by_file = {}
+    prefix = f"{db_name}.".lower()
+    for key in index["objects"]:
+        type_folder, dotted = split_object_key(key)
+        rest = dotted[len(prefix):] if dotted.lower().startswith(prefix) else dotted.split(".", 1)[-1]
+        schema, _, name = rest.partition(".")
+        by_file[((type_folder or "").lower(), sanitise_filename(schema).lower(), sanitise_filename(name).lower())] = key
+
+    objects = []
+    for f in files:
+        type_dir, schema_dir, file_name = os.path.relpath(f, source_dir).split(os.sep)
+        stem = os.path.splitext(file_name)[0]
+        rel = "/".join((type_dir, schema_dir, file_name)).lower()
+        key = (by_path.get(rel) or by_file.get((type_dir.lower(), schema_dir.lower(), stem.lower()))
+               or object_key(db_name, schema_dir, stem, type_folder=type_dir))
+        key, entry = entries.get(key.lower(), (key, {}))
+        obj = DeployObject(key, f)
+        obj.depends_on = {r.lower() for r in entry.get("references", [])}
+        objects.append(obj)
+
+    # References the server could not type (e.g. deferred name resolution) point at every object of that name
+    typed = {}
+    for obj in objects:
+        type_folder, dotted = split_object_key(obj.key.lower())
+        if type_folder:
+            typed.setdefault(dotted, set()).add(obj.key.lower())
+    for obj in objects:
+        obj.depends_on = {k for d in obj.depends_on for k in (typed.get(d) or {d})}
+    return objects
+
+def order_levels(objects: List[DeployObject]) -> List[List[DeployObject]]:
+    """
+    Topologically sorts objects into levels; every object only depends on objects in earlier levels.
+    Dependencies outside the deployment set are assumed to exist on the target.
+    Objects sharing a key (which should not happen) are deployed together rather than dropped.
+    """
+    by_key = {}
+    for o in objects:
+        by_key.setdefault(o.key.lower(), []).append(o)
+    pending = {k: {d for o in objs for d in o.depends_on if d in by_key and d != k} for k, objs in by_key.items()}
+    levels = []
+    while pending:
+        ready = sorted(k for k, deps in pending.items() if not deps)
+        if not ready:
+            # Cycle: deploy the remainder together and let the server report what fails
+            print(f"WARN: Dependency cycle between {len(pending)} objects; deploying them in one level.")
+            ready = sorted(pending)
+        levels.append([o for k in ready for o in by_key[k]])
+        for k in ready:
+            del pending[k]
+        for deps in pending.values():
+            deps.difference_update(ready)
+    return levels
+
+class ConnectionPool:
+    """A fixed-size pool of lazily opened connections shared by the deployment workers."""
+
+    def __init__(self, factory: Callable, size: int):
+        self.factory = factory
+        self.size = size
+        self.created = []
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if len(self.created) < self.size:
+                conn = self.factory()
+                self.created.append(conn)
+                return conn
+        return self.idle.get()
+
+    def release(self, conn) -> None:
+        self.idle.put(conn)
+
+    def close(self) -> None:
+        for conn in self.created:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+def deploy_object(pool: ConnectionPool, obj: DeployObject, transaction: bool = False) -> None:
+    """Runs the batches of one object on a pooled connection."""
+    conn = pool.acquire()
+    try:
+        conn.autocommit = not transaction
+        cur = conn.cursor()
+        try:
+            for batch in obj.batches:
+                cur.execute(batch)
+                while cur.nextset():
+                    pass
+            if transaction:
+                conn.commit()
+        except Exception:
+            if transaction:
+                conn.rollback()
+            raise
+    finally:
+        pool.release(conn)
+
+def deploy_levels(
+    levels: List[List[DeployObject]],
+    pool: Optional[ConnectionPool],
+    workers: int = 4,
+    transaction: bool = False,
+    dry_run: bool = False,
+    verbose: bool = False
+) -> Tuple[int, int, int]:
+    """
+    Deploys each level in parallel, waiting for the whole level before starting the next.
+    Objects depending on a failed object are skipped.
+    Returns (deployed_count, failed_count, skipped_count).
+    """
+    deployed = 0
+    broken = set()
+    failed = 0
+    skipped = 0
+
+    for n, level in enumerate(levels, 1):
+        runnable = []
+        for obj in level:
+            if obj.depends_on & broken:
+                print(f"SKIP: {obj.key} - depends on a failed object")
+                broken.add(obj.key.lower())
+                skipped += 1
+            else:
+                runnable.append(obj)
+
+        if verbose or dry_run:
+            print(f"Level {n}: {len(runnable)} object(s)")
+        if dry_run:
+            for obj in runnable:
+                print(f"WOULD DEPLOY: {obj.key} ({len(obj.batches)} batch(es)) from {obj.path}")
+            deployed += len(runnable)
+            continue
+
+        results: Dict[str, Optional[Exception]] = {}
+
+        def run(obj):
+            try:
+                deploy_object(pool, obj, transaction=transaction)
+                results[obj.path] = None
+            except Exception as e:
+                results[obj.path] = e
+
+        # Leaving the executor is the per-level barrier
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            list(executor.map(run, runnable))
+
+        for obj in runnable:
+            err = results.get(obj.path)
+            if err is None:
+                deployed += 1
+                if verbose:
+                    print(f"DEPLOYED: {obj.key}")
+            else:
+                failed += 1
+                broken.add(obj.key.lower())
+                print(f"ERROR: Failed to deploy {obj.key}: {err}")
+
+    return deployed, failed, skipped
@@ -0,0 +1,144 @@
+
+import os
+import json
+import threading
+from datetime import datetime, timezone
+from typing import List, Optional
+from .filesystem import write_json
+from .tracking import _parse_datetime_to_utc
+
+# Persisted next to last_run.yaml unless --discovery-cache says otherwise
+DISCOVERY_FILE = "discovery_cache.json"
+
+# Seconds a cached database list is trusted as long as the probe still matches; older entries are re-listed
+DEFAULT_TTL = 86400
+
+# Columns of discovery_databases.sql kept per database, and the probe columns kept per server
+DATABASE_COLUMNS = ("name", "database_id", "state", "state_desc", "create_date", "compatibility_level", "is_read_only")
+PROBE_COLUMNS = ("DatabaseCount", "MaxCreateDate", "Signature")
+
+_active: Optional["DiscoveryCache"] = None
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return _parse_datetime_to_utc(value).isoformat()
+    if isinstance(value, bool) or value is None or isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+def probe_values(row) -> list:
+    """The probe columns of a row of discovery_probe.sql or discovery_databases.sql, in comparable form."""
+    return [_json_value(getattr(row, c)) for c in PROBE_COLUMNS]
+
+def load_query(name: str) -> str:
+    query_path = os.path.join(os.path.dirname(__file__), "..", "queries", name)
+    with open(query_path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+class DiscoveryCache:
+    """
+    Persisted results of server discovery: the resolved ODBC driver per requested name, and per server
+    the full sys.databases list (state, create_date, compatibility level) with edition and version.
+    A server entry younger than the TTL is reused when the one-row probe (database count, latest
+    create_date, checksum over name/state/compatibility level) still returns the same values;
+    each match renews the entry.
+    """
+
+    def __init__(self, path: str, ttl: float = DEFAULT_TTL, refresh: bool = False):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.data = {"drivers": {}, "servers": {}}
+        if os.path.exists(path) and not refresh:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    loaded = json.load(f)
+                self.data["drivers"] = loaded.get("drivers") or {}
+                self.data["servers"] = loaded.get("servers") or {}
+            except Exception as e:
+                print(f"WARN: Ignoring unreadable discovery cache {path}: {e}")
+
+    def _fresh(self, entry: Optional[dict]) -> bool:
+        if not entry or not entry.get("checked_at"):
+            return False
+        try:
+            age = (_now() - _parse_datetime_to_utc(entry["checked_at"])).total_seconds()
+        except Exception:
+            return False
+        return 0 <= age < self.ttl
+
+    def driver(self, requested: str) -> Optional[str]:
+        with self.lock:
+            entry = self.data["drivers"].get(requested or "")
+            return entry["resolved"] if self._fresh(entry) else None
+
+    def set_driver(self, requested: str, resolved: str) -> None:
+        with self.lock:
+            self.data["drivers"][requested or ""] = {"resolved": resolved, "checked_at": _now().isoformat()}
+            self.dirty = True
+
+    def server(self, key: str) -> Optional[dict]:
+        """The cached entry of a server if it is within the TTL (still to be confirmed by the probe)."""
+        with self.lock:
+            entry = self.data["servers"].get(key.lower())
+            return entry if self._fresh(entry) else None
+
+    def confirm_server(self, key: str) -> None:
+        """Records that the probe still matched, so the entry is trusted for another TTL."""
+        with self.lock:
+            entry = self.data["servers"].get(key.lower())
+            if entry:
+                entry["checked_at"] = _now().isoformat()
+                self.dirty = True
+
+    def set_server(self, key: str, rows: list) -> dict:
+        """Stores the rows of discovery_databases.sql for a server; returns the new entry."""
+        first = rows[0] if rows else None
+        entry = {
+            "checked_at": _now().isoformat(),
+            "probe": probe_values(first) if first else None,
+            "edition": getattr(first, "Edition", None) if first else None,
+            "engine_edition": getattr(first, "EngineEdition", None) if first else None,
+            "product_version": getattr(first, "ProductVersion", None) if first else None,
+            "databases": [{c: _json_value(getattr(r, c)) for c in DATABASE_COLUMNS} for r in rows],
+        }
+        with self.lock:
+            self.data["servers"][key.lower()] = entry
+            self.dirty = True
+        return entry
+
+    def save(self) -> None:
+        with self.lock:
+            if self.dirty:
+                write_json(self.path, self.data)
+                self.dirty = False
+
+
+def user_databases(entry: dict) -> List[str]:
+    """Online user databases of a cached server entry, as list_databases returns them."""
+    return [d["name"] for d in entry["databases"] if (d.get("database_id") or 0) > 4 and d.get("state") == 0]
+
+def active_cache() -> Optional[DiscoveryCache]:
+    return _active
+
+def open_discovery_cache(path: str, ttl: float = DEFAULT_TTL, refresh: bool = False) -> DiscoveryCache:
+    """Makes a discovery cache the one used by core.connection for the rest of the run."""
+    global _active
+    _active = DiscoveryCache(path, ttl=ttl, refresh=refresh)
+    return _active
+
+def close_discovery_cache() -> None:
+    """Saves and detaches the active discovery cache."""
+    global _active
+    if _active is None:
+        return
+    cache, _active = _active, None
+    try:
+        cache.save()
+    except Exception as e:
+        print(f"WARN: Failed to save discovery cache {cache.path}: {e}")
@@ -0,0 +1,100 @@
+
+import os
+import glob
+import difflib
+from typing import Dict, List, Optional, Tuple
+from .manifest import MANIFEST_FILE, manifest_key, split_manifest_key, load_manifest
+from .filters import apply_filters, build_filter_sql, object_allowed
+from .catalog import CATALOG_FILTER_EXPRS, KEY_LOOKUP_CHUNK, TYPE_FOLDERS, catalog_query, catalog_hash_query, key_filter_sql
+from .rendering import normalize_definition, strip_rendering
+
+# Keys per definition lookup (two parameters each; SQL Server allows 2100 per request)
+DEFINITION_CHUNK = KEY_LOOKUP_CHUNK
+
+def manifest_hashes(source_dir: str, filters: Optional[dict] = None) -> Dict[str, str]:
+    """
+    Returns {TYPE/schema.name: hash} from the manifest of an extracted database folder,
+    leaving out objects excluded by filters (see core.filters.resolve_filters).
+    """
+    data = load_manifest(os.path.join(source_dir, MANIFEST_FILE))
+    return {
+        k: v.get("hash") for k, v in data["objects"].items()
+        if object_allowed(filters or {}, v.get("schema"), v.get("name"), v.get("type"))
+    }
+
+def manifest_databases(type_dir: str) -> Dict[str, str]:
+    """Returns {database: folder} for every database folder with a manifest below src/<type>."""
+    out = {}
+    for path in sorted(glob.glob(os.path.join(type_dir, "*", MANIFEST_FILE))):
+        folder = os.path.dirname(path)
+        db_name = load_manifest(path).get("database") or os.path.basename(folder)
+        out[db_name] = folder
+    return out
+
+def server_hashes(conn, filters: Optional[dict] = None) -> Dict[str, str]:
+    """
+    Returns {TYPE/schema.name: hash} computed server-side with HASHBYTES; no definitions are transferred.
+    Encrypted objects have no definition and are left out, as the extractor cannot script them either.
+    Objects excluded by filters are left out in the query itself, so their hashes never leave the server.
+    """
+    filter_sql, params = build_filter_sql(filters or {}, **CATALOG_FILTER_EXPRS)
+    cur = conn.cursor()
+    cur.execute(catalog_hash_query(filter_sql), *params)
+    out = {}
+    for row in cur.fetchall():
+        folder = TYPE_FOLDERS.get((row.ObjectType or "").strip())
+        if row.DefinitionHash is not None and folder:
+            out[manifest_key(row.SchemaName, row.ObjectName, folder)] = bytes(row.DefinitionHash).hex()
+    return out
+
+def compare_hashes(left: Dict[str, str], right: Dict[str, str]) -> List[Tuple[str, str]]:
+    """
+    Compares two {key: hash} maps (keys case-insensitive).
+    Returns sorted (key, status) with status 'different', 'left_only' or 'right_only'.
+    """
+    lmap = {k.lower(): k for k in left}
+    rmap = {k.lower(): k for k in right}
+    out = []
+    for low in sorted(set(lmap) | set(rmap)):
+        if low not in rmap:
+            out.append((lmap[low], "left_only"))
+        elif low not in lmap:
+            out.append((rmap[low], "right_only"))
+        elif left[lmap[low]] != right[rmap[low]]:
+            out.append((lmap[low], "different"))
+    return out
+
+def fetch_definitions(conn, keys: List[str]) -> Dict[str, str]:
+    """Fetches the definitions of the given TYPE/schema.name keys through the catalog query, with parameterised lookups."""
+    out = {}
+    cur = conn.cursor()
+    for i in range(0, len(keys), DEFINITION_CHUNK):
+        filter_sql, params = key_filter_sql([split_manifest_key(k)[1:] for k in keys[i:i + DEFINITION_CHUNK]])
+        cur.execute(apply_filters(catalog_query(), filter_sql), *params)
+        for row in cur.fetchall():
+            folder = TYPE_FOLDERS.get((row.ObjectType or "").strip())
+            if folder:
+                out[manifest_key(row.SchemaName, row.ObjectName, folder).lower()] = row.ObjectDefinition or ""
+    return {k: out.get(k.lower(), "") for k in keys}
+
+def read_definitions(source_dir: str, keys: List[str]) -> Dict[str, str]:
+    """
+    Reads the definitions of the given keys from an extracted database folder,
+    without the --header block and DROP the files may have been rendered with.
+    """
+    objects = {k.lower(): v for k, v in load_manifest(os.path.join(source_dir, MANIFEST_FILE))["objects"].items()}
+    out = {}
+    for key in keys:
+        entry = objects.get(key.lower())
+        path = os.path.join(source_dir, entry["path"]) if entry and entry.get("path") else None
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                out[key] = strip_rendering(f.read())
+        else:
+            out[key] = ""
+    return out
+
+def unified_diff(key: str, left: Optional[str], right: Optional[str], left_label: str, right_label: str) -> str:
+    a = normalize_definition(left).splitlines(keepends=True) if left else []
+    b = normalize_definition(right).splitlines(keepends=True) if right else []
+    return "".join(difflib.unified_diff(a, b, f"{left_label}/{key}", f"{right_label}/{key}"))
@@ -1,9 +1,10 @@
 
 import os
 import re
+import json
 import hashlib
 import tempfile
-from typing import Optional
+from typing import Callable, Optional
 
 def sanitise_filename(name: str) -> str:
     """Sanitises a string to be safe for filenames."""
@@ -11,18 +12,32 @@ def sanitise_filename(name: str) -> str:
     name = re.sub(r"__+", "_", name).strip("_")
     return name or "unnamed"
 
-def is_different(path: str, content: str) -> bool:
-    """Checks if the content is different from the file at path."""
+# Local SQLite indexes (history, search) live here, outside src/ which the scheduled jobs stage for commit:
+# <repo-root>/.versioner/<type>/<file>
+INDEX_DIR = ".versioner"
+
+def index_path(repo_root: str, type_str: str, file_name: str) -> str:
+    """Default location of a local index of one extraction type."""
+    return os.path.join(repo_root, INDEX_DIR, type_str or "", file_name)
+
+def is_different(path: str, content: str, normalize: Optional[Callable[[str], str]] = None) -> bool:
+    """
+    Checks if the content is different from the file at path.
+    With normalize, both sides are compared in normalised form (e.g. ignoring CRLF checkouts).
+    """
     content_bytes = content.encode("utf-8")
     if os.path.exists(path):
         with open(path, "rb") as f:
             existing_content = f.read()
+        if normalize is not None:
+            existing_content = normalize(existing_content.decode("utf-8", errors="replace")).encode("utf-8")
+            content_bytes = normalize(content).encode("utf-8")
         return hashlib.sha256(existing_content).hexdigest() != hashlib.sha256(content_bytes).hexdigest()
     return True
 
-def write_if_changed(path: str, content: str) -> bool:
+def write_if_changed(path: str, content: str, normalize: Optional[Callable[[str], str]] = None) -> bool:
     """Writes content to path only if it has changed. Returns True if written."""
-    if not is_different(path, content):
+    if not is_different(path, content, normalize):
         return False
     
     os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
@@ -44,3 +59,23 @@ def write_if_changed(path: str, content: str) -> bool:
             except Exception:
                 pass
         raise
+
+def json_text(data) -> str:
+    """JSON as written by write_json."""
+    return json.dumps(data, indent=1, sort_keys=True)
+
+def write_json(path: str, data) -> None:
+    """Atomically writes data as JSON to path."""
+    dirn = os.path.dirname(path) or "."
+    os.makedirs(dirn, exist_ok=True)
+    fd, tmppath = tempfile.mkstemp(dir=dirn, prefix=".tmp_")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(json_text(data))
+        os.replace(tmppath, path)
+    finally:
+        if os.path.exists(tmppath):
+            try:
+                os.remove(tmppath)
+            except Exception:
+                pass
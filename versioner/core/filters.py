@@ -0,0 +1,141 @@
+
+import re
+from typing import List, Optional, Tuple
+
+# Marker line in the query files replaced by the compiled filter predicates
+FILTER_MARKER = "-- @filters"
+
+# Exclude lists add up from environment to server to database; include lists and types are overridden
+EXCLUDE_KEYS = ("exclude_databases", "exclude_schemas", "exclude_names", "exclude_jobs")
+OVERRIDE_KEYS = ("include_databases", "include_schemas", "include_names", "include_jobs", "object_types")
+
+def _to_like(pattern: str) -> str:
+    """Turns a name pattern into a LIKE pattern; '*' and '?' are accepted alongside '%' and '_'."""
+    return str(pattern).replace("*", "%").replace("?", "_")
+
+def _like_regex(pattern: str):
+    out = []
+    for ch in _to_like(pattern):
+        if ch == "%":
+            out.append(".*")
+        elif ch == "_":
+            out.append(".")
+        else:
+            out.append(re.escape(ch))
+    return re.compile("^" + "".join(out) + "$", re.IGNORECASE | re.DOTALL)
+
+def matches_any(name: str, patterns: List[str]) -> bool:
+    """Python-side equivalent of name LIKE any pattern (case-insensitive, like the default collations)."""
+    return any(_like_regex(p).match(name or "") for p in patterns)
+
+def _merge(out: dict, level: Optional[dict]) -> None:
+    if not level:
+        return
+    for key in EXCLUDE_KEYS:
+        if level.get(key):
+            out[key] = out.get(key, []) + list(level[key])
+    for key in OVERRIDE_KEYS:
+        if level.get(key):
+            out[key] = list(level[key])
+
+def _find(mapping: Optional[dict], name: str) -> Optional[dict]:
+    if not mapping or not name:
+        return None
+    for k, v in mapping.items():
+        if str(k).lower() == name.lower():
+            return v
+    return None
+
+def resolve_filters(env_config: dict, server: Optional[str] = None, db_name: Optional[str] = None) -> dict:
+    """
+    Resolves the filters section of an environment for a server and optionally a database:
+
+    filters:
+      exclude_names: ["tmp_%", "sp_MS%"]
+      servers:
+        sql-prod-01:
+          exclude_databases: ["Scratch*"]
+          databases:
+            AppDB:
+              include_schemas: [dbo, etl]
+    """
+    root = (env_config or {}).get("filters") or {}
+    out = {}
+    _merge(out, root)
+    server_cfg = _find(root.get("servers"), server)
+    _merge(out, server_cfg)
+    _merge(out, _find((root.get("databases") or {}), db_name))
+    if server_cfg:
+        _merge(out, _find(server_cfg.get("databases"), db_name))
+    return out
+
+def database_allowed(filters: dict, db_name: str) -> bool:
+    if filters.get("include_databases") and not matches_any(db_name, filters["include_databases"]):
+        return False
+    return not matches_any(db_name, filters.get("exclude_databases", []))
+
+def object_allowed(filters: dict, schema: str, name: str, type_code: Optional[str] = None) -> bool:
+    """Python-side equivalent of the object predicates of build_filter_sql, e.g. for manifest entries."""
+    for key, value, include in (
+        ("include_schemas", schema, True), ("exclude_schemas", schema, False),
+        ("include_names", name, True), ("exclude_names", name, False)
+    ):
+        if filters.get(key) and matches_any(value, filters[key]) != include:
+            return False
+    if filters.get("object_types") and type_code is not None:
+        if type_code.strip().upper() not in {str(t).strip().upper() for t in filters["object_types"]}:
+            return False
+    return True
+
+def filter_databases(filters: dict, dbs: List[str], verbose: bool = False) -> List[str]:
+    """Drops excluded databases before any connection is made to them."""
+    out = []
+    for db in dbs:
+        if database_allowed(filters, db):
+            out.append(db)
+        elif verbose:
+            print(f"SKIP: database {db} - excluded by filters")
+    return out
+
+def _like_clause(expr: str, patterns: List[str], negate: bool, params: list) -> str:
+    params.extend(_to_like(p) for p in patterns)
+    clause = " OR ".join(f"{expr} LIKE ?" for _ in patterns)
+    return f"AND {'NOT ' if negate else ''}({clause})"
+
+def build_filter_sql(
+    filters: dict,
+    schema_expr: Optional[str] = None,
+    name_expr: Optional[str] = None,
+    type_expr: Optional[str] = None,
+    name_keys: Tuple[str, str] = ("include_names", "exclude_names")
+) -> Tuple[str, list]:
+    """
+    Compiles filters into AND-ed predicates with bound parameters.
+    Expressions left as None are not filtered on.
+    """
+    clauses = []
+    params = []
+    if schema_expr:
+        if filters.get("include_schemas"):
+            clauses.append(_like_clause(schema_expr, filters["include_schemas"], False, params))
+        if filters.get("exclude_schemas"):
+            clauses.append(_like_clause(schema_expr, filters["exclude_schemas"], True, params))
+    if name_expr:
+        include_key, exclude_key = name_keys
+        if filters.get(include_key):
+            clauses.append(_like_clause(name_expr, filters[include_key], False, params))
+        if filters.get(exclude_key):
+            clauses.append(_like_clause(name_expr, filters[exclude_key], True, params))
+    if type_expr and filters.get("object_types"):
+        types = [str(t).strip().upper() for t in filters["object_types"]]
+        params.extend(types)
+        clauses.append(f"AND {type_expr} IN ({', '.join('?' for _ in types)})")
+    return "\n    ".join(clauses), params
+
+def apply_filters(query_sql: str, filter_sql: str) -> str:
+    """Places compiled predicates at the filter marker of a query."""
+    if not filter_sql:
+        return query_sql
+    if FILTER_MARKER not in query_sql:
+        raise ValueError("Query has no filter marker")
+    return query_sql.replace(FILTER_MARKER, filter_sql, 1)
@@ -0,0 +1,209 @@
+
+import os
+import zlib
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional, Tuple
+from .tracking import _parse_datetime_to_utc
+
+# Default history index per extraction type: <repo-root>/.versioner/<type>/history.sqlite (see filesystem.index_path)
+HISTORY_FILE = "history.sqlite"
+
+# PRAGMA user_version of the current layout; 1 = object keys carry their type folder (TYPE/db.schema.name)
+HISTORY_VERSION = 1
+
+def _migrate(db: sqlite3.Connection) -> None:
+    """
+    Brings an index up to HISTORY_VERSION. Keys written as db.schema.name get the type folder
+    from their path (src/<type>/<db>/<TYPE>/<schema>/<name>.sql), so a table type and a procedure
+    of the same name no longer share a timeline.
+    """
+    if db.execute("PRAGMA user_version").fetchone()[0] >= HISTORY_VERSION:
+        return
+    rows = db.execute("SELECT id, object_key, path FROM versions WHERE object_key NOT LIKE '%/%'").fetchall()
+    for row_id, key, rel_path in rows:
+        parts = rel_path.split("/")
+        if len(parts) >= 3:
+            db.execute("UPDATE versions SET object_key = ? WHERE id = ?", (f"{parts[-3]}/{key}", row_id))
+    db.execute(f"PRAGMA user_version = {HISTORY_VERSION}")
+    db.commit()
+
+def new_run_id() -> str:
+    """Identifies one extraction run; sortable by start time."""
+    return f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{os.getpid()}"
+
+def _iso(value) -> Optional[str]:
+    """UTC ISO text, comparable as a string across every row of the index."""
+    if value is None:
+        return None
+    return _parse_datetime_to_utc(value).isoformat()
+
+class HistoryIndex:
+    """
+    Append-only version history of every extracted object.
+    versions holds one row per observed version (object key TYPE/db.schema.name, content hash,
+    source modify_date, run id, path); blobs holds each distinct content once, compressed.
+    Used as a recorder of core.sinks.RecordingSink: a version is added when a file is written,
+    or when the object has no version with this content yet (so existing trees are picked up).
+    """
+
+    def __init__(self, path: str, run_id: Optional[str] = None):
+        self.path = path
+        self.run_id = run_id or new_run_id()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                content BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                started_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS versions (
+                id INTEGER PRIMARY KEY,
+                object_key TEXT NOT NULL COLLATE NOCASE,
+                path TEXT NOT NULL,
+                hash TEXT NOT NULL REFERENCES blobs(hash),
+                modified TEXT,
+                run_id TEXT NOT NULL REFERENCES runs(run_id),
+                recorded_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_versions_key ON versions (object_key, recorded_at);
+            CREATE INDEX IF NOT EXISTS ix_versions_path ON versions (path, recorded_at);
+        """)
+        _migrate(self.db)
+        self.lock = threading.Lock()
+        self.started = False
+        self.last = None
+
+    def _last_hashes(self) -> dict:
+        # Latest hash per key, loaded on first use
+        if self.last is None:
+            self.last = {}
+            for key, h in self.db.execute("SELECT object_key, hash FROM versions ORDER BY id"):
+                self.last[key.lower()] = h
+        return self.last
+
+    def record(self, rel_path: str, content: str, meta: Optional[dict], written: bool) -> None:
+        if not meta or not meta.get("key"):
+            return
+        key = meta["key"]
+        h = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        with self.lock:
+            self._record(key, rel_path, h, content, meta)
+
+    def _record(self, key: str, rel_path: str, h: str, content: str, meta: dict) -> None:
+        last = self._last_hashes()
+        if last.get(key.lower()) == h:
+            return
+
+        now = datetime.now(timezone.utc).isoformat()
+        if not self.started:
+            self.db.execute("INSERT OR IGNORE INTO runs (run_id, started_at) VALUES (?, ?)", (self.run_id, now))
+            self.started = True
+        self.db.execute(
+            "INSERT OR IGNORE INTO blobs (hash, content) VALUES (?, ?)",
+            (h, zlib.compress(content.encode("utf-8")))
+        )
+        self.db.execute(
+            "INSERT INTO versions (object_key, path, hash, modified, run_id, recorded_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, rel_path.replace(os.sep, "/"), h, _iso(meta.get("modified")), self.run_id, now)
+        )
+        last[key.lower()] = h
+
+    def close(self) -> None:
+        self.db.commit()
+        self.db.close()
+
+
+def _open(path: str) -> sqlite3.Connection:
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"History index {path} does not exist")
+    db = sqlite3.connect(path)
+    _migrate(db)
+    return db
+
+def _content(db: sqlite3.Connection, h: str) -> str:
+    row = db.execute("SELECT content FROM blobs WHERE hash = ?", (h,)).fetchone()
+    return zlib.decompress(row[0]).decode("utf-8") if row else ""
+
+def _where_object(db: sqlite3.Connection, obj: str) -> Tuple[str, tuple]:
+    """
+    Matches an object key (TYPE/db.schema.name, case-insensitive) or a tree path.
+    db.schema.name is accepted when only one type has that name; otherwise a ValueError names the candidates.
+    """
+    if "/" not in obj:
+        keys = sorted({k for (k,) in db.execute(
+            "SELECT DISTINCT object_key FROM versions WHERE object_key LIKE ? ESCAPE '\\'",
+            ("%/" + obj.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_"),)
+        )}, key=str.lower)
+        if len({k.lower() for k in keys}) > 1:
+            raise ValueError(f"{obj} is ambiguous; use one of {', '.join(keys)}")
+        if keys:
+            obj = keys[0]
+    return "(object_key = ? OR path = ?)", (obj, obj.replace(os.sep, "/"))
+
+def timeline(path: str, obj: str) -> List[dict]:
+    """Every recorded version of an object, oldest first."""
+    db = _open(path)
+    try:
+        where, params = _where_object(db, obj)
+        rows = db.execute(
+            f"SELECT object_key, path, hash, modified, run_id, recorded_at FROM versions WHERE {where} ORDER BY id",
+            params
+        ).fetchall()
+    finally:
+        db.close()
+    return [dict(zip(("key", "path", "hash", "modified", "run_id", "recorded_at"), r)) for r in rows]
+
+def version_at(path: str, obj: str, at=None) -> Optional[Tuple[dict, str]]:
+    """
+    The version of an object as of a point in time (latest if at is None), with its content.
+    Versions are placed in time by source modify_date, or by when they were recorded if that is unknown.
+    """
+    db = _open(path)
+    try:
+        where, params = _where_object(db, obj)
+        sql = f"SELECT object_key, path, hash, modified, run_id, recorded_at FROM versions WHERE {where}"
+        if at is not None:
+            sql += " AND COALESCE(modified, recorded_at) <= ?"
+            params += (_iso(at),)
+        row = db.execute(sql + " ORDER BY COALESCE(modified, recorded_at) DESC, id DESC LIMIT 1", params).fetchone()
+        if not row:
+            return None
+        info = dict(zip(("key", "path", "hash", "modified", "run_id", "recorded_at"), row))
+        return info, _content(db, info["hash"])
+    finally:
+        db.close()
+
+def snapshot(path: str, at=None, prefix: Optional[str] = None) -> Iterator[Tuple[str, str]]:
+    """Yields (tree path, content) of every path as it was at a point in time, optionally below a prefix."""
+    db = _open(path)
+    try:
+        params = []
+        where = []
+        if at is not None:
+            where.append("COALESCE(modified, recorded_at) <= ?")
+            params.append(_iso(at))
+        if prefix:
+            where.append("path LIKE ? ESCAPE '\\'")
+            escaped = prefix.replace(os.sep, "/").replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(escaped.rstrip("/") + "/%")
+        sql = f"""
+            SELECT path, hash FROM (
+                SELECT path, hash, ROW_NUMBER() OVER (
+                    PARTITION BY path ORDER BY COALESCE(modified, recorded_at) DESC, id DESC
+                ) AS rn
+                FROM versions
+                {"WHERE " + " AND ".join(where) if where else ""}
+            ) WHERE rn = 1
+            ORDER BY path
+        """
+        for rel_path, h in db.execute(sql, params).fetchall():
+            yield rel_path, _content(db, h)
+    finally:
+        db.close()
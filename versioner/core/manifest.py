@@ -0,0 +1,61 @@
+
+import os
+import json
+import hashlib
+from typing import Optional, Tuple
+from .filesystem import json_text, write_json
+
+# Per-database manifest stored alongside the object folders:
+# <repo-root>/src/<type>/<sanitised-db-name>/_manifest.json
+MANIFEST_FILE = "_manifest.json"
+
+# Bumped when the key format changes; older manifests are discarded and fill in again on the next run
+MANIFEST_VERSION = 2
+
+def definition_hash(definition: str) -> str:
+    """
+    Hashes an object definition exactly like HASHBYTES('SHA2_256', <nvarchar>) does on the server,
+    so repository and server hashes can be compared directly.
+    """
+    return hashlib.sha256(definition.encode("utf-16-le")).hexdigest()
+
+def manifest_key(schema: str, name: str, type_folder: str) -> str:
+    """TYPE/schema.name: a table type and a procedure may share schema and name."""
+    return f"{type_folder}/{schema}.{name}"
+
+def split_manifest_key(key: str) -> Tuple[str, str, str]:
+    """Returns (type_folder, schema, name) of a manifest key."""
+    type_folder, _, rest = key.partition("/")
+    schema, _, name = rest.partition(".")
+    return type_folder, schema, name
+
+def load_manifest(path: str, db_name: Optional[str] = None, sink=None) -> dict:
+    """
+    Loads a per-database manifest; returns an empty manifest if it does not exist.
+    With a sink (core.sinks), path is relative to its root and read through it, e.g. from a bundle.
+    """
+    data = None
+    try:
+        if sink is not None:
+            text = sink.read_state(path)
+            data = json.loads(text) if text else None
+        elif os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+    except Exception as e:
+        print(f"WARN: Failed to read manifest {path}: {e}")
+    data = data or {}
+    if data.get("objects") and data.get("version") != MANIFEST_VERSION:
+        print(f"WARN: Manifest {path} predates type-qualified keys; its entries are ignored until an extraction rewrites it.")
+        data["objects"] = {}
+    data["version"] = MANIFEST_VERSION
+    data.setdefault("database", db_name)
+    data.setdefault("objects", {})
+    return data
+
+def save_manifest(path: str, data: dict, sink=None) -> None:
+    """Atomically writes a per-database manifest, through the sink when given."""
+    if sink is not None:
+        sink.write_state(path, json_text(data))
+    else:
+        write_json(path, data)
@@ -0,0 +1,277 @@
+
+import os
+import sys
+import time
+import pstats
+import cProfile
+import pkgutil
+import importlib
+import threading
+import functools
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Union
+from .filesystem import sanitise_filename
+
+# Functions in versioner.extractors with these prefixes become phases without any registration
+PHASE_PREFIXES = ("extract_", "run_")
+EXTRACTOR_PACKAGE = "versioner.extractors"
+
+# Stack sampling interval for the collapsed-stack output (seconds)
+SAMPLE_INTERVAL = 0.005
+
+# Extra phases outside the extractors: "module:function" -> phase name
+_registered: Dict[str, Optional[str]] = {"versioner.core.connection:list_databases": None}
+_active: Optional["Profiler"] = None
+
+# Allocation snapshots cost time proportional to live memory; only this many calls per phase take them
+SNAPSHOT_CALLS = 5
+
+# The profiler's own frames are left out of stacks and allocation reports
+_OWN_FILES = (os.path.basename(__file__), "contextlib.py", "tracemalloc.py")
+
+
+class PhaseStats:
+    """Everything collected for one phase name, over all of its calls."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.profile = cProfile.Profile()
+        self.calls = 0
+        self.wall = 0.0
+        self.peak = 0
+        self.allocs: Dict[str, List[int]] = {}
+        self.snapshots = 0
+        self.stacks: Counter = Counter()
+
+
+class Profiler:
+    """
+    Profiles a run by phase: cProfile for hot functions, tracemalloc for allocations,
+    and a sampling thread for flamegraph stacks. Nested phases pause the enclosing one,
+    so each function's time is counted in the innermost phase only.
+    Only the thread that enters a phase is profiled; run with one worker.
+    """
+
+    def __init__(self, out_dir: str, top: int = 40):
+        self.out_dir = out_dir
+        self.top = top
+        self.phases: Dict[str, PhaseStats] = {}
+        self.local = threading.local()
+        self.current: Dict[int, PhaseStats] = {}
+        self.stop_event = threading.Event()
+        self.sampler = None
+
+    def start(self) -> None:
+        tracemalloc.start()
+        self.sampler = threading.Thread(target=self._sample, name="versioner-profiler", daemon=True)
+        self.sampler.start()
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        while not self.stop_event.wait(SAMPLE_INTERVAL):
+            frames = sys._current_frames()
+            for tid, stats in list(self.current.items()):
+                frame = frames.get(tid)
+                if tid == own or frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    file_name = os.path.basename(code.co_filename)
+                    if file_name not in _OWN_FILES:
+                        stack.append(f"{file_name}:{code.co_name}")
+                    frame = frame.f_back
+                stats.stacks[";".join(reversed(stack))] += 1
+
+    @contextmanager
+    def phase(self, name: str):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        tid = threading.get_ident()
+        outer = stack[-1] if stack else None
+        if outer:
+            outer[0].profile.disable()
+            outer[1] = max(outer[1], tracemalloc.get_traced_memory()[1])
+
+        stats = self.phases.get(name)
+        if stats is None:
+            stats = self.phases[name] = PhaseStats(name)
+        entry = [stats, 0]
+        stack.append(entry)
+        self.current.pop(tid, None)
+
+        before = tracemalloc.take_snapshot() if stats.snapshots < SNAPSHOT_CALLS else None
+        tracemalloc.reset_peak()
+        self.current[tid] = stats
+        started = time.perf_counter()
+        stats.profile.enable()
+        try:
+            yield stats
+        finally:
+            stats.profile.disable()
+            stats.wall += time.perf_counter() - started
+            stats.calls += 1
+            self.current.pop(tid, None)
+            peak = max(entry[1], tracemalloc.get_traced_memory()[1])
+            stats.peak = max(stats.peak, peak)
+            if before is not None:
+                stats.snapshots += 1
+                for diff in tracemalloc.take_snapshot().compare_to(before, "lineno"):
+                    where = diff.traceback[0].filename
+                    if (diff.size_diff or diff.count_diff) and os.path.basename(where) not in _OWN_FILES:
+                        totals = stats.allocs.setdefault(str(diff.traceback), [0, 0])
+                        totals[0] += diff.size_diff
+                        totals[1] += diff.count_diff
+
+            stack.pop()
+            if outer:
+                outer[1] = max(outer[1], peak)
+                self.current[tid] = outer[0]
+                tracemalloc.reset_peak()
+                outer[0].profile.enable()
+            else:
+                self.current.pop(tid, None)
+
+    def stop(self) -> str:
+        """Stops sampling and tracing and writes the reports; returns the summary path."""
+        self.stop_event.set()
+        if self.sampler:
+            self.sampler.join()
+        tracemalloc.stop()
+        return self.write_reports()
+
+    def write_reports(self) -> str:
+        """
+        Per phase, in out_dir:
+          <phase>.prof       raw cProfile stats (pstats, snakeviz)
+          <phase>.txt        hot functions by own time and by cumulative time
+          <phase>.alloc.txt  top source lines by memory still allocated at phase end
+          <phase>.collapsed  sampled stacks, input for flamegraph.pl / speedscope
+        plus summary.txt over all phases.
+        """
+        os.makedirs(self.out_dir, exist_ok=True)
+        summary = [f"{'phase':<40} {'calls':>7} {'wall s*':>10} {'samples':>8} {'net KiB':>10} {'peak KiB':>10}"]
+
+        for name, stats in sorted(self.phases.items(), key=lambda kv: -kv[1].wall):
+            base = os.path.join(self.out_dir, sanitise_filename(name))
+            stats.profile.dump_stats(base + ".prof")
+
+            with open(base + ".txt", "w", encoding="utf-8") as f:
+                f.write(f"Phase {name}: {stats.calls} calls, {stats.wall:.3f}s wall\n\n")
+                try:
+                    ps = pstats.Stats(stats.profile, stream=f)
+                    ps.strip_dirs()
+                    for key in ("tottime", "cumulative"):
+                        f.write(f"=== sorted by {key} ===\n")
+                        ps.sort_stats(key).print_stats(self.top)
+                except TypeError:
+                    f.write("No profile data.\n")
+
+            allocs = sorted(stats.allocs.items(), key=lambda kv: -kv[1][0])
+            with open(base + ".alloc.txt", "w", encoding="utf-8") as f:
+                f.write(f"Phase {name}: peak traced memory {stats.peak / 1024:.1f} KiB\n")
+                f.write(
+                    f"Net allocations still alive at the end of the phase, by source line "
+                    f"(first {stats.snapshots} of {stats.calls} calls):\n\n"
+                )
+                for where, (size, count) in allocs[:self.top]:
+                    f.write(f"{size / 1024:>12.1f} KiB {count:>9} blocks  {where}\n")
+
+            with open(base + ".collapsed", "w", encoding="utf-8") as f:
+                for stack, count in sorted(stats.stacks.items()):
+                    f.write(f"{stack} {count}\n")
+
+            net = sum(size for size, _ in stats.allocs.values())
+            summary.append(
+                f"{name:<40} {stats.calls:>7} {stats.wall:>10.3f} {sum(stats.stacks.values()):>8} "
+                f"{net / 1024:>10.1f} {stats.peak / 1024:>10.1f}"
+            )
+
+        summary.append("")
+        summary.append("* wall time and allocations include nested phases; profiles and stacks do not.")
+        path = os.path.join(self.out_dir, "summary.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(summary) + "\n")
+        return path
+
+
+def register_phase(target: Union[str, Callable], name: Optional[str] = None) -> None:
+    """
+    Hook API: profiles a function outside the extractors as its own phase.
+    target is "module:function" or the function itself; name defaults to the function name.
+    """
+    if callable(target):
+        target = f"{target.__module__}:{target.__name__}"
+    _registered[target] = name
+
+def profiled(name: Optional[str] = None):
+    """Decorator form of register_phase; the function runs as a phase whenever profiling is on."""
+    def decorate(fn):
+        phase_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return fn(*args, **kwargs)
+            with _active.phase(phase_name):
+                return fn(*args, **kwargs)
+        wrapper.__profiled__ = True
+        return wrapper
+    return decorate
+
+def _rebind(original: Callable, wrapped: Callable) -> None:
+    """Points every reference in the loaded versioner modules at the wrapped function."""
+    for mod_name, module in list(sys.modules.items()):
+        if module is None or not (mod_name == "versioner" or mod_name.startswith("versioner.")):
+            continue
+        for attr, value in list(vars(module).items()):
+            if value is original:
+                setattr(module, attr, wrapped)
+
+def instrument() -> List[str]:
+    """
+    Wraps every extract_*/run_* function of the extractor modules, and the registered hooks,
+    as phases. New extractors are picked up by name. Returns the phase names.
+    """
+    package = importlib.import_module(EXTRACTOR_PACKAGE)
+    targets = []
+    for info in pkgutil.iter_modules(package.__path__):
+        module = importlib.import_module(f"{EXTRACTOR_PACKAGE}.{info.name}")
+        for attr, value in vars(module).items():
+            if callable(value) and attr.startswith(PHASE_PREFIXES) and getattr(value, "__module__", None) == module.__name__:
+                targets.append((value, None))
+    for spec, name in _registered.items():
+        mod_name, _, attr = spec.partition(":")
+        value = getattr(importlib.import_module(mod_name), attr, None)
+        if callable(value):
+            targets.append((value, name))
+
+    names = []
+    for fn, name in targets:
+        if getattr(fn, "__profiled__", False):
+            continue
+        wrapped = profiled(name)(fn)
+        _rebind(fn, wrapped)
+        names.append(name or fn.__name__)
+    return names
+
+def start_profiling(out_dir: str, verbose: bool = False) -> Profiler:
+    """Instruments the extractors and starts a profiler for this process."""
+    global _active
+    names = instrument()
+    if verbose:
+        print(f"DEBUG: profiling phases: {', '.join(sorted(names))}")
+    _active = Profiler(out_dir)
+    _active.start()
+    return _active
+
+def stop_profiling() -> Optional[str]:
+    """Stops the active profiler and writes its reports; returns the summary path."""
+    global _active
+    if _active is None:
+        return None
+    profiler, _active = _active, None
+    return profiler.stop()
@@ -0,0 +1,138 @@
+
+import re
+from datetime import datetime
+from typing import Optional
+from .utils import bracket_ident
+
+TRAILING_WS = re.compile(r"[ \t]+$", re.MULTILINE)
+
+def normalize_text(text: str) -> str:
+    """
+    Canonical text form for everything written to the repository:
+    no BOM, LF line endings, no trailing whitespace, exactly one final newline.
+    """
+    if text.startswith("\ufeff"):
+        text = text[1:]
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = TRAILING_WS.sub("", text)
+    return text.rstrip("\n") + "\n"
+
+# Generated parts of a rendered script (see render_sql_object), in the order they are written
+HEADER_PATTERN = re.compile(r"\A-- =+\n(?:-- .*\n)*?-- =+\n\n+")
+DROP_PATTERN = re.compile(r"\AIF (?:OBJECT_ID|TYPE_ID|EXISTS )\(.*\nGO\n\n+")
+
+def strip_rendering(text: str) -> str:
+    """The definition inside a rendered object script: the --header block and the DROP are removed."""
+    text = normalize_definition(text)
+    text = HEADER_PATTERN.sub("", text, count=1)
+    return DROP_PATTERN.sub("", text, count=1)
+
+def normalize_definition(text: str) -> str:
+    """
+    Canonical form of an object body: no BOM, LF line endings, one final newline.
+    Whitespace inside the body is kept, as it may be part of string literals (e.g. dynamic SQL)
+    and a redeployed script must reproduce the source definition.
+    """
+    if text.startswith("\ufeff"):
+        text = text[1:]
+    return text.replace("\r\n", "\n").rstrip() + "\n"
+
+def format_datetime(value) -> str:
+    """Stable textual form of a source timestamp (no sub-second noise)."""
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ", timespec="seconds")
+    return "" if value is None else str(value)
+
+def drop_statement(schema_name: str, object_name: str, type_code: str, type_folder: str) -> str:
+    """Guarded DROP for one object; type_folder doubles as the DDL keyword of schema-scoped objects."""
+    schema_q = bracket_ident(schema_name)
+    object_q = bracket_ident(object_name)
+    qualified = f"{schema_q}.{object_q}".replace("'", "''")
+    if type_code == "DT":
+        # Database-level DDL triggers have no schema and no OBJECT_ID name resolution
+        name = object_name.replace("'", "''")
+        return (
+            f"IF EXISTS (SELECT 1 FROM sys.triggers WHERE parent_class = 0 AND name = N'{name}') "
+            f"DROP TRIGGER {object_q} ON DATABASE;"
+        )
+    if type_code == "TT":
+        return f"IF TYPE_ID(N'{qualified}') IS NOT NULL DROP TYPE {schema_q}.{object_q};"
+    return f"IF OBJECT_ID(N'{qualified}', '{type_code}') IS NOT NULL DROP {type_folder} {schema_q}.{object_q};"
+
+def render_sql_object(
+    db_name: str,
+    schema_name: str,
+    object_name: str,
+    type_code: str,
+    type_folder: str,
+    definition: str,
+    modified: Optional[datetime] = None,
+    definition_hash: Optional[str] = None,
+    include_drop: bool = False,
+    include_header: bool = False
+) -> str:
+    """
+    Renders one object script. Only source facts are embedded (modify_date, definition hash),
+    so the output is byte-identical until the definition itself changes.
+    The generated header and DROP are fully normalised, the definition only by normalize_definition.
+    """
+    parts = []
+    if include_header:
+        parts.append(f"""-- =============================================================
+-- Database: {db_name}
+-- Schema: {schema_name}
+-- Object: {object_name}
+-- Type: {type_folder}
+-- Modified: {format_datetime(modified)}
+-- Definition SHA256: {definition_hash or ""}
+-- =============================================================
+
+""")
+    if include_drop:
+        parts.append(drop_statement(schema_name, object_name, type_code, type_folder) + "\nGO\n\n")
+    body = normalize_definition(definition)
+    if not parts:
+        return body
+    return TRAILING_WS.sub("", "\n".join(parts)) + "\n" + body
+
+def render_agent_job(job, steps) -> str:
+    """
+    Renders one agent job and its steps as the text file layout.
+    date_modified is left out: msdb bumps it for schedule, owner or notification
+    changes that are not part of this file, which would otherwise rewrite it.
+    """
+    content_parts = []
+    content_parts.append("=" * 60)
+    content_parts.append(f"SQL Agent Job: {job.name}")
+    content_parts.append("=" * 60)
+    content_parts.append(f"JobID: {str(job.job_id).upper()}")
+    content_parts.append(f"Enabled: {'Yes' if job.enabled else 'No'}")
+    content_parts.append(f"Description: {job.description or ''}")
+    content_parts.append(f"Date Created: {format_datetime(job.date_created)}")
+    content_parts.append("=" * 60)
+
+    if steps:
+        content_parts.append(f"Total Steps: {len(steps)}")
+        content_parts.append("")
+
+        for step in sorted(steps, key=lambda x: x.step_id):
+            content_parts.append("-" * 60)
+            content_parts.append(f"Step {step.step_id}: {step.step_name}")
+            content_parts.append("-" * 60)
+            content_parts.append(f"Subsystem: {step.subsystem}")
+            content_parts.append(f"Database: {step.database}")
+            content_parts.append(f"On Success Action: {step.on_success_action}")
+            content_parts.append(f"On Fail Action: {step.on_fail_action}")
+            content_parts.append(f"Retry Attempts: {step.retry_attempts}")
+            content_parts.append(f"Retry Interval: {step.retry_interval}")
+            content_parts.append("")
+            content_parts.append("Command")
+            content_parts.append("-" * 40)
+            content_parts.append(step.command.rstrip())
+            content_parts.append("-" * 40)
+            content_parts.append("")
+    else:
+        content_parts.append("No steps found")
+        content_parts.append("")
+
+    return normalize_text("\n".join(content_parts))
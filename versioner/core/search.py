@@ -0,0 +1,122 @@
+
+import os
+import sqlite3
+import hashlib
+import threading
+from typing import List, Optional
+
+# Default search index per extraction type: <repo-root>/.versioner/<type>/search.sqlite (see filesystem.index_path)
+SEARCH_FILE = "search.sqlite"
+
+# Identifiers keep their underscores; dots, brackets and whitespace separate tokens
+TOKENIZER = "unicode61 tokenchars '_'"
+
+def _connect(path: str) -> sqlite3.Connection:
+    db = sqlite3.connect(path, check_same_thread=False)
+    try:
+        db.executescript(f"""
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE,
+                object_key TEXT,
+                server TEXT COLLATE NOCASE,
+                database TEXT COLLATE NOCASE,
+                schema_name TEXT COLLATE NOCASE,
+                name TEXT,
+                type TEXT COLLATE NOCASE,
+                hash TEXT NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(name, body, tokenize="{TOKENIZER}");
+        """)
+    except sqlite3.OperationalError as e:
+        db.close()
+        raise RuntimeError(f"SQLite at {path} has no FTS5 support: {e}")
+    return db
+
+class SearchIndex:
+    """
+    Full-text index over object definitions and agent job files (SQLite FTS5).
+    Used as a recorder of core.sinks.RecordingSink: a document is (re)indexed when its file is written,
+    or when the index does not hold this content for the path yet (so existing trees are picked up).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = _connect(path)
+        self.lock = threading.Lock()
+        self.indexed = {p: (i, h) for i, p, h in self.db.execute("SELECT id, path, hash FROM documents")}
+        self.updated = 0
+
+    def record(self, rel_path: str, content: str, meta: Optional[dict], written: bool) -> None:
+        meta = meta or {}
+        path = rel_path.replace(os.sep, "/")
+        h = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        with self.lock:
+            existing = self.indexed.get(path)
+            if existing and existing[1] == h:
+                return
+            row = (
+                meta.get("key"), meta.get("server"), meta.get("database"), meta.get("schema"),
+                meta.get("name"), (meta.get("type") or "").strip(), h
+            )
+            if existing:
+                doc_id = existing[0]
+                self.db.execute(
+                    "UPDATE documents SET object_key = ?, server = ?, database = ?, schema_name = ?, name = ?, type = ?, hash = ? WHERE id = ?",
+                    row + (doc_id,)
+                )
+                self.db.execute("DELETE FROM documents_fts WHERE rowid = ?", (doc_id,))
+            else:
+                doc_id = self.db.execute(
+                    "INSERT INTO documents (path, object_key, server, database, schema_name, name, type, hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (path,) + row
+                ).lastrowid
+            self.db.execute(
+                "INSERT INTO documents_fts (rowid, name, body) VALUES (?, ?, ?)",
+                (doc_id, meta.get("name") or "", content)
+            )
+            self.indexed[path] = (doc_id, h)
+            self.updated += 1
+
+    def close(self) -> None:
+        self.db.commit()
+        self.db.close()
+
+
+def phrase_query(text: str) -> str:
+    """Turns free text into an FTS5 phrase, so input like dbo.Sales or [srv].db needs no escaping."""
+    return '"' + text.replace('"', '""') + '"'
+
+def search(
+    path: str,
+    query: str,
+    server: Optional[str] = None,
+    database: Optional[str] = None,
+    schema: Optional[str] = None,
+    object_type: Optional[str] = None,
+    limit: int = 50
+) -> List[dict]:
+    """Runs an FTS5 query, best matches first, with optional exact (case-insensitive) filters."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Search index {path} does not exist")
+    db = sqlite3.connect(path)
+    try:
+        where = ["documents_fts MATCH ?"]
+        params = [query]
+        for column, value in (("server", server), ("database", database), ("schema_name", schema), ("type", object_type)):
+            if value:
+                where.append(f"d.{column} = ?")
+                params.append(value)
+        rows = db.execute(f"""
+            SELECT d.path, d.object_key, d.server, d.database, d.type,
+                   snippet(documents_fts, 1, '>>', '<<', '...', 16)
+            FROM documents_fts
+            JOIN documents d ON d.id = documents_fts.rowid
+            WHERE {" AND ".join(where)}
+            ORDER BY bm25(documents_fts)
+            LIMIT ?
+        """, params + [limit]).fetchall()
+    finally:
+        db.close()
+    return [dict(zip(("path", "key", "server", "database", "type", "snippet"), r)) for r in rows]
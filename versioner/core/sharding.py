@@ -0,0 +1,186 @@
+
+import os
+import re
+import glob
+import hashlib
+import yaml
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from .tracking import _parse_datetime_to_utc, read_last_run, write_last_run, write_yaml
+
+# Work unit name used for a server's SQL Agent jobs
+AGENT_JOBS_UNIT = "SQL_AGENT_JOBS"
+# Seconds spent per work unit in previous sharded runs, maintained by merge-state
+COSTS_FILE = "run_costs.yaml"
+
+def resolve_run_id(value: Optional[str] = None) -> Optional[str]:
+    """Identifies the run the shards belong to: --run-id, else GITHUB_RUN_ID. Safe for file names."""
+    value = value or os.environ.get("GITHUB_RUN_ID")
+    return re.sub(r"[^\w.-]", "_", str(value)) if value else None
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """Parses 'i/n' (1-based) into (index, count)."""
+    m = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", spec or "")
+    if not m or not (1 <= int(m.group(1)) <= int(m.group(2))):
+        raise ValueError(f"Invalid shard '{spec}', expected i/n with 1 <= i <= n")
+    return int(m.group(1)), int(m.group(2))
+
+def unit_key(server: str, unit: str) -> str:
+    """Key of a (server, database) or (server, AGENT_JOBS_UNIT) work unit."""
+    return f"{server}/{unit}".lower()
+
+def stable_bucket(key: str, count: int) -> int:
+    return int(hashlib.sha1(key.encode("utf-8")).hexdigest(), 16) % count
+
+def read_costs(path: str = COSTS_FILE) -> Dict[str, float]:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return {str(k).lower(): float(v) for k, v in (yaml.safe_load(f) or {}).items()}
+    except Exception as e:
+        print(f"WARN: Failed to read cost history {path}: {e}")
+        return {}
+
+class ShardPlan:
+    """
+    Deterministic assignment of work units to shards.
+    'hash' buckets each unit by a stable hash of its key. 'cost' balances units found in the cost
+    history across shards (longest first); units without history fall back to the hash bucket.
+    Every shard computes the same assignment from the same inputs.
+    """
+
+    def __init__(self, index: int, count: int, strategy: str = "hash", costs: Optional[Dict[str, float]] = None, run_id: Optional[str] = None):
+        self.index = index
+        self.count = count
+        self.strategy = strategy
+        self.run_id = run_id
+        self.assigned: Dict[str, int] = {}
+        if strategy == "cost" and costs:
+            loads = [0.0] * count
+            units = [0] * count
+            for key, cost in sorted(costs.items(), key=lambda kv: (-kv[1], kv[0])):
+                # Ties (e.g. many near-zero costs) go to the shard with fewer units
+                shard = min(range(count), key=lambda i: (loads[i], units[i], i))
+                self.assigned[key] = shard
+                loads[shard] += cost
+                units[shard] += 1
+
+    @property
+    def label(self) -> str:
+        return f"{self.index}/{self.count}"
+
+    def owns(self, server: str, unit: str) -> bool:
+        key = unit_key(server, unit)
+        shard = self.assigned.get(key)
+        if shard is None:
+            shard = stable_bucket(key, self.count)
+        return shard == self.index - 1
+
+def build_shard_plan(args, costs_path: str = COSTS_FILE) -> Optional[ShardPlan]:
+    """Returns the ShardPlan requested on the command line, or None for an unsharded run."""
+    if not getattr(args, "shard", None):
+        return None
+    index, count = parse_shard(args.shard)
+    costs = read_costs(costs_path) if args.shard_by == "cost" else None
+    return ShardPlan(index, count, args.shard_by, costs, run_id=resolve_run_id(getattr(args, "run_id", None)))
+
+def fragment_path(state_dir: str, key: str, run_id: str, index: int, count: int) -> str:
+    return os.path.join(state_dir or ".", f"last_run.{key}.{run_id}.shard-{index}-of-{count}.yaml")
+
+def write_fragment(
+    state_dir: str,
+    key: str,
+    plan: ShardPlan,
+    base_dt: datetime,
+    max_seen: datetime,
+    costs: Dict[str, float],
+    failed: Optional[List[str]] = None
+) -> str:
+    """
+    Records the outcome of one shard; merge-state combines the fragments into last_run.yaml.
+    failed lists the units that did not extract, which holds the watermark back for the whole run.
+    """
+    path = fragment_path(state_dir, key, plan.run_id, plan.index, plan.count)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    write_yaml(path, {
+        "key": key,
+        "run_id": plan.run_id,
+        "shard": plan.index,
+        "count": plan.count,
+        "base": base_dt.astimezone(timezone.utc).isoformat(),
+        "max_seen": max_seen.astimezone(timezone.utc).isoformat(),
+        "costs": {k: round(v, 1) for k, v in sorted(costs.items())},
+        "failed": sorted(failed or []),
+    })
+    return path
+
+def merge_state(
+    state_dir: str,
+    key: str,
+    last_run_path: str = "last_run.yaml",
+    costs_path: str = COSTS_FILE,
+    keep: bool = False,
+    verbose: bool = False,
+    run_id: Optional[str] = None
+) -> bool:
+    """
+    Combines the shard fragments of one run (run_id, default GITHUB_RUN_ID) into last_run.yaml and
+    the cost history. Refuses to merge unless every shard of that run reported, so a failed shard never
+    advances the watermark past changes it did not extract; fragments left over from other runs are never used.
+    """
+    run_id = resolve_run_id(run_id)
+    paths = sorted(glob.glob(os.path.join(state_dir or ".", f"last_run.{key}.*shard-*-of-*.yaml")))
+    fragments = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            fragments.append((path, yaml.safe_load(f) or {}))
+
+    run_ids = sorted({str(frag.get("run_id")) for _, frag in fragments})
+    if run_id is None and len(run_ids) > 1:
+        print(f"ERROR: Fragments for {key} come from runs {', '.join(run_ids)}; pass --run-id")
+        return False
+    if run_id is not None:
+        stale = [path for path, frag in fragments if str(frag.get("run_id")) != run_id]
+        if stale and verbose:
+            print(f"Ignoring {len(stale)} fragment(s) of other runs: {', '.join(stale)}")
+        fragments = [(path, frag) for path, frag in fragments if str(frag.get("run_id")) == run_id]
+    if not fragments:
+        print(f"ERROR: No shard fragments for {key}{f' run {run_id}' if run_id else ''} in {state_dir}")
+        return False
+
+    counts = {frag.get("count") for _, frag in fragments}
+    bases = {frag.get("base") for _, frag in fragments}
+    if len(counts) != 1 or len(bases) != 1:
+        print(f"ERROR: Fragments for {key} come from different runs (counts {counts}, bases {bases})")
+        return False
+    count = counts.pop()
+    missing = sorted(set(range(1, count + 1)) - {frag.get("shard") for _, frag in fragments})
+    if missing:
+        print(f"ERROR: Missing fragments for {key} shard(s) {', '.join(f'{i}/{count}' for i in missing)}")
+        return False
+
+    current = read_last_run(last_run_path, key)
+    base = _parse_datetime_to_utc(bases.pop())
+    if current > base:
+        print(f"WARN: {last_run_path} {key} moved past the fragments' base ({current.isoformat()} > {base.isoformat()})")
+    merged = max(_parse_datetime_to_utc(frag["max_seen"]) for _, frag in fragments)
+    failed = sorted(unit for _, frag in fragments for unit in (frag.get("failed") or []))
+    if failed:
+        print(f"WARN: {len(failed)} failed in this run ({', '.join(failed)}); {key} is not advanced.")
+    elif merged > current:
+        write_last_run(last_run_path, key, merged)
+        print(f"Updated {last_run_path} {key} = {merged.isoformat()}")
+    elif verbose:
+        print(f"{last_run_path} {key} unchanged ({current.isoformat()})")
+
+    costs = read_costs(costs_path)
+    for _, frag in fragments:
+        costs.update({str(k).lower(): float(v) for k, v in (frag.get("costs") or {}).items()})
+    if costs:
+        write_yaml(costs_path, dict(sorted(costs.items())))
+
+    if not keep:
+        for path, _ in fragments:
+            os.remove(path)
+    return True
@@ -0,0 +1,401 @@
+
+import os
+import zlib
+import shutil
+import sqlite3
+import json
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterator, Optional, Tuple
+from .filesystem import write_if_changed, is_different, write_json, index_path
+from .rendering import normalize_text
+
+# Default bundle location per extraction type: <repo-root>/.versioner/<type>/bundle.sqlite (see filesystem.index_path)
+BUNDLE_FILE = "bundle.sqlite"
+
+# Content-addressed store per extraction type: <repo-root>/src/<type>/_store/<hh>/<sha256>
+STORE_DIR = "_store"
+# Store without links: <repo-root>/src/<type>/<db or server>/_refs.json maps paths to content hashes
+REFS_FILE = "_refs.json"
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+class FileSink:
+    """
+    Classic output: one file per object below the repository root.
+    With compare_normalized, existing files that differ only in line endings,
+    trailing whitespace or a BOM count as unchanged.
+    """
+
+    def __init__(self, root: str, compare_normalized: bool = False):
+        self.root = root
+        self.normalize = normalize_text if compare_normalized else None
+
+    def full_path(self, rel_path: str) -> str:
+        return os.path.join(self.root, rel_path)
+
+    def describe(self, rel_path: str) -> str:
+        return self.full_path(rel_path)
+
+    def list_dir(self, rel_dir: str) -> set:
+        """Returns the normcased file names in a folder (empty if it does not exist)."""
+        try:
+            return {os.path.normcase(n) for n in os.listdir(self.full_path(rel_dir))}
+        except OSError:
+            return set()
+
+    def exists(self, rel_path: str) -> bool:
+        return os.path.exists(self.full_path(rel_path))
+
+    def is_different(self, rel_path: str, content: str) -> bool:
+        return is_different(self.full_path(rel_path), content, self.normalize)
+
+    def write_if_changed(self, rel_path: str, content: str, meta: Optional[dict] = None) -> bool:
+        return write_if_changed(self.full_path(rel_path), content, self.normalize)
+
+    def read_state(self, rel_path: str) -> Optional[str]:
+        """Reads a state file (manifest, dependency index) kept next to the objects, or None."""
+        try:
+            with open(self.full_path(rel_path), "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write_state(self, rel_path: str, content: str) -> bool:
+        """Writes a state file; unlike objects, state files are not reported to recorders."""
+        return write_if_changed(self.full_path(rel_path), content)
+
+    def close(self) -> None:
+        pass
+
+
+class BundleSink:
+    """
+    Single-file output: every object of an extraction in one SQLite database.
+    objects maps tree paths to content hashes; blobs holds each distinct content once, compressed.
+    Writes are committed every COMMIT_EVERY changes and on close(), so a run that fails keeps what it wrote.
+    Safe to share between the worker threads of one run.
+    """
+
+    COMMIT_EVERY = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                content BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS objects (
+                path TEXT PRIMARY KEY,
+                hash TEXT NOT NULL REFERENCES blobs(hash),
+                updated_at TEXT NOT NULL
+            );
+        """)
+        # The whole index is small enough to keep in memory for the run
+        self.index = dict(self.db.execute("SELECT path, hash FROM objects"))
+        self.pending = 0
+        self.dirs = {}
+        for p in self.index:
+            d, _, name = p.rpartition("/")
+            self.dirs.setdefault(d, set()).add(os.path.normcase(name))
+
+    @staticmethod
+    def key(rel_path: str) -> str:
+        return rel_path.replace(os.sep, "/")
+
+    @staticmethod
+    def content_hash(content: str) -> str:
+        return content_hash(content)
+
+    def describe(self, rel_path: str) -> str:
+        return f"{self.path}:{self.key(rel_path)}"
+
+    def list_dir(self, rel_dir: str) -> set:
+        return self.dirs.get(self.key(rel_dir), set())
+
+    def exists(self, rel_path: str) -> bool:
+        return self.key(rel_path) in self.index
+
+    def is_different(self, rel_path: str, content: str) -> bool:
+        return self.index.get(self.key(rel_path)) != self.content_hash(content)
+
+    def write_if_changed(self, rel_path: str, content: str, meta: Optional[dict] = None) -> bool:
+        key = self.key(rel_path)
+        h = self.content_hash(content)
+        if self.index.get(key) == h:
+            return False
+        blob = zlib.compress(content.encode("utf-8"))
+        with self.lock:
+            self.db.execute("INSERT OR IGNORE INTO blobs (hash, content) VALUES (?, ?)", (h, blob))
+            self.db.execute(
+                "INSERT OR REPLACE INTO objects (path, hash, updated_at) VALUES (?, ?, ?)",
+                (key, h, datetime.now(timezone.utc).isoformat())
+            )
+            self.index[key] = h
+            d, _, name = key.rpartition("/")
+            self.dirs.setdefault(d, set()).add(os.path.normcase(name))
+            self.pending += 1
+            if self.pending >= self.COMMIT_EVERY:
+                self.db.commit()
+                self.pending = 0
+        return True
+
+    def read_state(self, rel_path: str) -> Optional[str]:
+        h = self.index.get(self.key(rel_path))
+        if h is None:
+            return None
+        with self.lock:
+            row = self.db.execute("SELECT content FROM blobs WHERE hash = ?", (h,)).fetchone()
+        return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+    def write_state(self, rel_path: str, content: str) -> bool:
+        # Kept in the bundle like an object, so an exported tree has it too
+        return self.write_if_changed(rel_path, content)
+
+    def close(self) -> None:
+        self.db.execute("DELETE FROM blobs WHERE hash NOT IN (SELECT hash FROM objects)")
+        self.db.commit()
+        self.db.close()
+
+
+class StoreSink:
+    """
+    Content-addressed output: each distinct file content is kept once in src/<type>/_store.
+    With links (default) the per-database tree is made of hard links into the store, so
+    every tool reading src/ keeps working; without links no tree is written and each folder
+    below src/<type> gets a compact _refs.json mapping its paths to content hashes.
+    """
+
+    def __init__(self, root: str, type_str: str, links: bool = True, compare_normalized: bool = False):
+        self.root = root
+        self.type_rel = os.path.join("src", type_str or "")
+        self.store_dir = os.path.join(root, self.type_rel, STORE_DIR)
+        self.links = links
+        self.files = FileSink(root, compare_normalized)
+        self.refs = {}
+        self.dirty = set()
+        self.link_failed = False
+
+    def describe(self, rel_path: str) -> str:
+        if self.links:
+            return self.files.describe(rel_path)
+        unit, inner = self._split(rel_path)
+        return f"{os.path.join(self.root, self.type_rel, unit, REFS_FILE)}:{inner}"
+
+    def blob_path(self, h: str) -> str:
+        return os.path.join(self.store_dir, h[:2], h)
+
+    def _split(self, rel_path: str) -> Tuple[str, str]:
+        """Splits a path below src/<type> into (database or server folder, path inside it)."""
+        parts = os.path.relpath(rel_path, self.type_rel).split(os.sep)
+        return parts[0], "/".join(parts[1:])
+
+    def _refs(self, unit: str) -> dict:
+        refs = self.refs.get(unit)
+        if refs is None:
+            refs = {}
+            path = os.path.join(self.root, self.type_rel, unit, REFS_FILE)
+            if os.path.exists(path):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        refs = json.load(f)
+                except Exception as e:
+                    print(f"WARN: Failed to read {path}: {e}")
+            self.refs[unit] = refs
+        return refs
+
+    def _store(self, content: str) -> str:
+        h = content_hash(content)
+        blob = self.blob_path(h)
+        if not os.path.exists(blob):
+            write_if_changed(blob, content)
+        return h
+
+    def _linked(self, rel_path: str, h: str) -> bool:
+        try:
+            return os.path.samefile(self.files.full_path(rel_path), self.blob_path(h))
+        except OSError:
+            return False
+
+    def list_dir(self, rel_dir: str) -> set:
+        if self.links:
+            return self.files.list_dir(rel_dir)
+        unit, inner = self._split(rel_dir)
+        prefix = inner + "/" if inner else ""
+        return {
+            os.path.normcase(p[len(prefix):]) for p in self._refs(unit)
+            if p.startswith(prefix) and "/" not in p[len(prefix):]
+        }
+
+    def exists(self, rel_path: str) -> bool:
+        if self.links:
+            return self.files.exists(rel_path)
+        unit, inner = self._split(rel_path)
+        return inner in self._refs(unit)
+
+    def is_different(self, rel_path: str, content: str) -> bool:
+        h = content_hash(content)
+        if self.links:
+            return not self._linked(rel_path, h) and self.files.is_different(rel_path, content)
+        unit, inner = self._split(rel_path)
+        return self._refs(unit).get(inner) != h
+
+    def write_if_changed(self, rel_path: str, content: str, meta: Optional[dict] = None) -> bool:
+        if not self.links:
+            unit, inner = self._split(rel_path)
+            refs = self._refs(unit)
+            h = content_hash(content)
+            if refs.get(inner) == h:
+                return False
+            self._store(content)
+            refs[inner] = h
+            self.dirty.add(unit)
+            return True
+
+        h = content_hash(content)
+        if self._linked(rel_path, h):
+            return False
+        # Plain files with the same content are turned into links but not reported as changed
+        changed = self.files.is_different(rel_path, content)
+        self._store(content)
+        if self.link_failed:
+            self.files.write_if_changed(rel_path, content)
+            return changed
+
+        full = self.files.full_path(rel_path)
+        dirn = os.path.dirname(full)
+        os.makedirs(dirn, exist_ok=True)
+        tmppath = os.path.join(dirn, f".tmp_{os.getpid()}_{os.path.basename(full)}")
+        try:
+            os.link(self.blob_path(h), tmppath)
+            os.replace(tmppath, full)
+        except OSError as e:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            print(f"WARN: Hard links not available below {self.root} ({e}); writing plain files.")
+            self.link_failed = True
+            self.files.write_if_changed(rel_path, content)
+        return changed
+
+    def read_state(self, rel_path: str) -> Optional[str]:
+        return self.files.read_state(rel_path)
+
+    def write_state(self, rel_path: str, content: str) -> bool:
+        # State changes every run; it stays a plain file next to the tree or _refs.json instead of filling the store
+        return self.files.write_state(rel_path, content)
+
+    def close(self) -> None:
+        for unit in sorted(self.dirty):
+            write_json(os.path.join(self.root, self.type_rel, unit, REFS_FILE), self.refs[unit])
+        self.dirty.clear()
+
+
+class RecordingSink:
+    """
+    Passes every write through to a sink and reports it to recorders (history, search index).
+    Recorders get record(rel_path, content, meta, written) for each object the run rendered,
+    where meta describes the object (key, server, database, schema, name, type, modified).
+    """
+
+    def __init__(self, sink, recorders: list):
+        self.sink = sink
+        self.recorders = recorders
+
+    def __getattr__(self, name):
+        return getattr(self.sink, name)
+
+    def write_if_changed(self, rel_path: str, content: str, meta: Optional[dict] = None) -> bool:
+        written = self.sink.write_if_changed(rel_path, content, meta)
+        for recorder in self.recorders:
+            recorder.record(rel_path, content, meta, written)
+        return written
+
+    def close(self) -> None:
+        self.sink.close()
+        for recorder in self.recorders:
+            recorder.close()
+
+
+def iter_store(type_dir: str) -> Iterator[Tuple[str, str]]:
+    """Yields (tree path, content) for every path referenced by the _refs.json files of src/<type>."""
+    type_rel = "src/" + os.path.basename(os.path.normpath(type_dir))
+    for unit in sorted(os.listdir(type_dir)):
+        refs_path = os.path.join(type_dir, unit, REFS_FILE)
+        if not os.path.isfile(refs_path):
+            continue
+        with open(refs_path, "r", encoding="utf-8") as f:
+            refs = json.load(f)
+        for inner, h in sorted(refs.items()):
+            with open(os.path.join(type_dir, STORE_DIR, h[:2], h), "r", encoding="utf-8") as f:
+                yield f"{type_rel}/{unit}/{inner}", f.read()
+
+def iter_bundle(path: str, prefix: Optional[str] = None) -> Iterator[Tuple[str, str]]:
+    """Yields (tree path, content) for every object in a bundle, optionally below a path prefix."""
+    db = sqlite3.connect(path)
+    try:
+        sql = "SELECT o.path, b.content FROM objects o JOIN blobs b ON b.hash = o.hash"
+        params = ()
+        if prefix:
+            sql += " WHERE o.path LIKE ? ESCAPE '\\'"
+            escaped = prefix.replace(os.sep, "/").replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params = (escaped.rstrip("/") + "/%",)
+        for path, content in db.execute(sql + " ORDER BY o.path", params):
+            yield path, zlib.decompress(content).decode("utf-8")
+    finally:
+        db.close()
+
+@contextmanager
+def bundle_tree(path: str, prefix: Optional[str] = None) -> Iterator[str]:
+    """
+    Exports a bundle (optionally only below a path prefix) into a temporary folder, for commands that
+    read the file layout (drift, deploy). Yields the folder holding src/; it is removed afterwards.
+    """
+    tmp = tempfile.mkdtemp(prefix="versioner_bundle_")
+    try:
+        for rel_path, content in iter_bundle(path, prefix):
+            write_if_changed(os.path.join(tmp, *rel_path.split("/")), content)
+        yield tmp
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def is_bundle(path: str) -> bool:
+    """True if path is a SQLite file (as written with --output bundle)."""
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as f:
+        return f.read(16) == b"SQLite format 3\x00"
+
+def _base_sink(args, repo_root: str, type_str: str):
+    if getattr(args, "output", "files") == "bundle":
+        # Outside src/, which the scheduled jobs commit; like the local indexes it is git-ignored
+        path = getattr(args, "bundle", None) or index_path(repo_root, type_str, BUNDLE_FILE)
+        return BundleSink(path)
+    if getattr(args, "output", "files") == "store":
+        return StoreSink(
+            repo_root, type_str,
+            links=not getattr(args, "store_refs", False),
+            compare_normalized=getattr(args, "compare_normalized", False)
+        )
+    return FileSink(repo_root, compare_normalized=getattr(args, "compare_normalized", False))
+
+def open_sink(args, repo_root: str, type_str: str):
+    """Creates the output sink selected on the command line, with the requested recorders attached."""
+    sink = _base_sink(args, repo_root, type_str)
+    recorders = []
+    if getattr(args, "history", False):
+        from .history import HistoryIndex, HISTORY_FILE
+        path = getattr(args, "history_db", None) or index_path(repo_root, type_str, HISTORY_FILE)
+        recorders.append(HistoryIndex(path))
+    if getattr(args, "search_index", False):
+        from .search import SearchIndex, SEARCH_FILE
+        path = getattr(args, "search_db", None) or index_path(repo_root, type_str, SEARCH_FILE)
+        recorders.append(SearchIndex(path))
+    return RecordingSink(sink, recorders) if recorders else sink
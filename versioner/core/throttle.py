@@ -0,0 +1,220 @@
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+# Program name of low-impact sessions; a Resource Governor classifier can route on APP_NAME()
+LOW_IMPACT_APP = "versioner-low-impact"
+
+# "Lock request time out period exceeded", raised by a read that hit SET LOCK_TIMEOUT
+LOCK_TIMEOUT_ERROR = 1222
+
+# environments.<env>.low_impact defaults
+LOW_IMPACT_DEFAULTS = {
+    "lock_timeout_ms": 5000,
+    "max_workers": 4,
+    "max_active_requests": 20,
+    "max_blocked_requests": 5,
+    "sample_seconds": 5.0,
+    "pause_seconds": 10.0,
+    # Consecutive pauses on a busy server before work goes on at one worker regardless
+    "max_pauses": 6,
+    # Retries of a database whose catalog read hit the lock timeout, waiting retry_seconds, then twice as long, ...
+    "lock_retries": 3,
+    "retry_seconds": 5.0,
+}
+
+def low_impact_settings(args, env_config: dict) -> Optional[dict]:
+    """
+    Resolves low-impact settings from --low-impact / environments.<env>.low_impact, or None when off.
+    --workers overrides max_workers.
+    """
+    section = (env_config or {}).get("low_impact")
+    if not getattr(args, "low_impact", False) and not section:
+        return None
+    settings = dict(LOW_IMPACT_DEFAULTS)
+    if isinstance(section, dict):
+        settings.update({k: v for k, v in section.items() if v is not None})
+    if getattr(args, "workers", None):
+        settings["max_workers"] = args.workers
+    return settings
+
+def low_impact_conn_str(conn_str: str) -> str:
+    """Tags the connection with the low-impact program name, unless it already names one."""
+    if "app=" in conn_str.lower():
+        return conn_str
+    return conn_str.rstrip(";") + f";APP={LOW_IMPACT_APP};"
+
+def prepare_session(conn, settings: Optional[dict]) -> None:
+    """Makes catalog reads give way: fail fast on locks instead of queueing, and lose any deadlock."""
+    if not settings:
+        return
+    cur = conn.cursor()
+    cur.execute(f"SET LOCK_TIMEOUT {int(settings['lock_timeout_ms'])}; SET DEADLOCK_PRIORITY LOW;")
+
+def is_lock_timeout(exc: Exception) -> bool:
+    """True when a query gave up waiting for a lock (error 1222)."""
+    return f"({LOCK_TIMEOUT_ERROR})" in str(exc)
+
+def with_lock_retries(fn: Callable[[], object], settings: Optional[dict], label: str = "") -> object:
+    """
+    Runs fn(), and runs it again with a doubling delay while it fails on the lock timeout,
+    at most lock_retries times. Any other error, or the last lock timeout, is raised.
+    """
+    if not settings:
+        return fn()
+    retries = int(settings.get("lock_retries", 0))
+    delay = float(settings.get("retry_seconds", 0))
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= retries or not is_lock_timeout(e):
+                raise
+            attempt += 1
+            print(f"WARN: {label}lock timeout, retrying in {delay:.0f}s ({attempt}/{retries})")
+            time.sleep(delay)
+            delay *= 2
+
+def load_sampler(connect: Callable[[], object]) -> Callable[[], Optional[Tuple[int, int]]]:
+    """
+    Returns a function sampling (active requests, blocked requests) over one monitoring connection,
+    or None once the signal turns out to be unavailable (e.g. no VIEW SERVER STATE).
+    """
+    query_path = os.path.join(os.path.dirname(__file__), "..", "queries", "server_load.sql")
+    with open(query_path, "r", encoding="utf-8") as f:
+        query_sql = f.read()
+    state = {"conn": None, "disabled": False}
+
+    def sample() -> Optional[Tuple[int, int]]:
+        if state["disabled"]:
+            return None
+        try:
+            if state["conn"] is None:
+                state["conn"] = connect()
+            row = state["conn"].cursor().execute(query_sql).fetchone()
+            return int(row.ActiveRequests or 0), int(row.BlockedRequests or 0)
+        except Exception as e:
+            print(f"WARN: Load signal unavailable, keeping a fixed concurrency: {e}")
+            state["disabled"] = True
+            return None
+
+    def close() -> None:
+        if state["conn"] is not None:
+            try:
+                state["conn"].close()
+            except Exception:
+                pass
+            state["conn"] = None
+
+    sample.close = close
+    return sample
+
+
+class LoadThrottle:
+    """
+    Gates work items on a server by a concurrency limit adapted to its load.
+    Each sample interval the limit grows by one while the server is quiet and halves when
+    active or blocked requests cross their thresholds; at one worker it pauses new work instead,
+    at most max_pauses times in a row, so a server that never quietens down cannot stall the run.
+    Without a sampler the limit stays at max_workers.
+    """
+
+    def __init__(self, max_workers: int = 1, sampler: Optional[Callable] = None, settings: Optional[dict] = None, verbose: bool = False):
+        settings = settings or LOW_IMPACT_DEFAULTS
+        self.max_workers = max(1, int(max_workers))
+        self.sampler = sampler
+        self.max_active = int(settings["max_active_requests"])
+        self.max_blocked = int(settings["max_blocked_requests"])
+        self.interval = max(0.1, float(settings["sample_seconds"]))
+        self.pause = float(settings["pause_seconds"])
+        self.max_pauses = int(settings["max_pauses"])
+        self.pauses = 0
+        self.verbose = verbose
+        self.limit = 1 if sampler else self.max_workers
+        self.active = 0
+        self.last_sample = None
+        self.paused_until = 0.0
+        self.cond = threading.Condition()
+
+    def _adjust(self) -> None:
+        """Samples the load if due and moves the limit (or pauses new work)."""
+        now = time.monotonic()
+        if self.sampler is None or (self.last_sample is not None and now - self.last_sample < self.interval):
+            return
+        self.last_sample = now
+        load = self.sampler()
+        if load is None:
+            self.sampler = None
+            self.limit = self.max_workers
+            return
+        active, blocked = load
+        busy = active > self.max_active or blocked > self.max_blocked
+        previous = self.limit
+        if busy:
+            self.limit = max(1, self.limit // 2)
+        elif active <= self.max_active // 2:
+            self.limit = min(self.max_workers, self.limit + 1)
+        if self.verbose and self.limit != previous:
+            print(f"DEBUG: load {active} active/{blocked} blocked requests, concurrency {previous} -> {self.limit}")
+        if not busy:
+            self.pauses = 0
+        elif previous == 1 and self.pauses < self.max_pauses:
+            self.pauses += 1
+            if self.verbose:
+                print(f"DEBUG: load {active} active/{blocked} blocked requests, pausing {self.pause:.0f}s ({self.pauses}/{self.max_pauses})")
+            self.paused_until = now + self.pause
+        elif previous == 1 and self.pauses == self.max_pauses:
+            self.pauses += 1
+            print(f"WARN: Server still busy after {self.max_pauses} pauses; continuing with one database at a time.")
+
+    def acquire(self) -> None:
+        with self.cond:
+            while True:
+                self._adjust()
+                wait = self.paused_until - time.monotonic()
+                if wait > 0:
+                    self.cond.wait(timeout=wait)
+                    continue
+                if self.active < self.limit:
+                    self.active += 1
+                    return
+                self.cond.wait(timeout=self.interval)
+
+    def release(self) -> None:
+        with self.cond:
+            self.active -= 1
+            self.cond.notify_all()
+
+    def map(self, fn: Callable, items: Iterable) -> Iterator[Tuple[object, object]]:
+        """
+        Runs fn(item) for every item within the throttle and yields (item, result) in item order.
+        Runs inline when at most one worker is allowed.
+        """
+        items = list(items)
+        if self.max_workers <= 1 or len(items) <= 1:
+            for item in items:
+                self.acquire()
+                try:
+                    result = fn(item)
+                finally:
+                    self.release()
+                yield item, result
+            return
+
+        def run(item):
+            try:
+                return fn(item)
+            finally:
+                self.release()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = []
+            for item in items:
+                self.acquire()
+                futures.append((item, pool.submit(run, item)))
+            for item, future in futures:
+                yield item, future.result()
@@ -65,6 +65,12 @@ def _parse_datetime_to_utc(value) -> datetime:
     raise ValueError(f"Unrecognised date format: {value}")
 
 
+# last_run.yaml key per environment type
+LAST_RUN_KEYS = {"fabric": "Fabric", "onprem": "On-Prem"}
+
+# Folder below src/ per --type
+SOURCE_TYPES = {"fabric": "Fabric", "onprem": "OnPrem"}
+
 def read_last_run(path: str = "last_run.yaml", key: str = "Fabric") -> datetime:
     """Reads the last run timestamp for the given key."""
     if not os.path.exists(path):
@@ -96,6 +102,11 @@ def write_last_run(path: str, key: str, dt: Optional[datetime] = None) -> None:
             data = {}
             
     data[key] = dt.astimezone(timezone.utc).isoformat()
+    write_yaml(path, data)
+
+
+def write_yaml(path: str, data: dict) -> None:
+    """Atomically writes a state file."""
     dirn = os.path.dirname(path) or "."
     fd, tmppath = tempfile.mkstemp(dir=dirn, prefix=".last_run_")
     try:
@@ -1,5 +1,6 @@
 
 import os
+from typing import List
 
 def load_dotenv(path: str = ".env") -> None:
     """Loads environment variables from a .env file."""
@@ -15,3 +16,32 @@ def load_dotenv(path: str = ".env") -> None:
             v = v.strip().strip("'\"")
             if k and k not in os.environ:
                 os.environ[k] = v
+
+def bracket_ident(name: str) -> str:
+    """Quotes an identifier the way QUOTENAME does."""
+    return "[" + name.replace("]", "]]") + "]"
+
+def split_ident(text: str) -> List[str]:
+    """Splits a multi-part name (db.schema.name) on dots outside [brackets] and unquotes the parts."""
+    parts, current, quoted = [], [], False
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if quoted:
+            if ch == "]" and text[i + 1:i + 2] == "]":
+                current.append("]")
+                i += 1
+            elif ch == "]":
+                quoted = False
+            else:
+                current.append(ch)
+        elif ch == "[":
+            quoted = True
+        elif ch == ".":
+            parts.append("".join(current).strip())
+            current = []
+        else:
+            current.append(ch)
+        i += 1
+    parts.append("".join(current).strip())
+    return parts
@@ -0,0 +1,77 @@
+
+import os
+import pyodbc
+from typing import Iterable, Optional, Tuple
+from ..core.filesystem import sanitise_filename
+from ..core.dependencies import DEPENDENCY_INDEX, load_dependency_index, save_dependency_index, update_dependency_index
+
+SOURCE_FOLDER = "src"
+
+def _index_path(base_repo_root: str, type_str: str, db_name: str, sink=None) -> str:
+    # Relative to the sink's root when the index is kept through a sink
+    rel = os.path.join(SOURCE_FOLDER, type_str or "", sanitise_filename(db_name), DEPENDENCY_INDEX)
+    return rel if sink is not None else os.path.join(base_repo_root, rel)
+
+def dependencies_need_refresh(base_repo_root: str, type_str: str, db_name: str, objects: Optional[Iterable[Tuple[str, str]]], sink=None) -> bool:
+    """True if extract_dependencies would query the database (no usable index yet, or objects were re-scripted)."""
+    if objects:
+        return True
+    return load_dependency_index(_index_path(base_repo_root, type_str, db_name, sink), sink=sink) is None
+
+def extract_dependencies(
+    conn: pyodbc.Connection,
+    server_name: str,
+    db_name: str,
+    base_repo_root: str,
+    type_str: str,
+    objects: Optional[Iterable[Tuple[str, str]]] = None,
+    dry_run: bool = False,
+    verbose: bool = False,
+    sink=None
+) -> int:
+    """
+    Refreshes the dependency index of a database with one bulk query.
+    Only the (schema, name) pairs in objects are updated; the index is rebuilt
+    in full when it does not exist yet or objects is None.
+    With a sink (core.sinks) the index is kept with the output, e.g. inside a bundle.
+    Returns the number of objects updated.
+    """
+    index_path = _index_path(base_repo_root, type_str, db_name, sink)
+    data = load_dependency_index(index_path, sink=sink)
+
+    if data is not None and objects is not None:
+        objects = list(objects)
+        if not objects:
+            return 0
+
+    query_path = os.path.join(os.path.dirname(__file__), "..", "queries", "sql_dependencies.sql")
+    with open(query_path, "r", encoding="utf-8") as f:
+        query_sql = f.read()
+
+    try:
+        cur = conn.cursor()
+        cur.execute(query_sql)
+        rows = cur.fetchall()
+    except Exception as e:
+        print(f"ERROR: [Server: {server_name}] dependency query failed for {db_name}: {e}")
+        if verbose:
+            import traceback
+            traceback.print_exc()
+        return 0
+
+    data, updated = update_dependency_index(
+        data,
+        db_name,
+        ((r.SchemaName, r.ObjectName, r.ObjectType, r.ReferencedServer, r.ReferencedDatabase,
+          r.ReferencedSchema, r.ReferencedName, r.ReferencedType) for r in rows),
+        objects=None if data is None else objects
+    )
+
+    if verbose:
+        print(f"DEBUG: [Server: {server_name}] {len(rows)} dependency rows, {updated} objects updated in {db_name}")
+
+    if not dry_run:
+        save_dependency_index(index_path, data, sink=sink)
+    elif verbose:
+        print(f"WOULD WRITE: {sink.describe(index_path) if sink is not None else index_path}")
+    return updated
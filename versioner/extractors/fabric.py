@@ -1,13 +1,18 @@
 
 import os
+import time
 import argparse
 from datetime import datetime, timezone
 import yaml
 import pyodbc
 from ..core.auth import AuthManager
 from ..core.connection import build_connection_string, replace_server_in_conn, replace_db_in_conn, list_databases
-from ..core.tracking import read_last_run, write_last_run
+from ..core.tracking import read_last_run, write_last_run, LAST_RUN_KEYS
+from ..core.sharding import build_shard_plan, unit_key, write_fragment
+from ..core.filters import resolve_filters, filter_databases
+from ..core.sinks import open_sink
 from .sql_objects import extract_sql_objects
+from .dependencies import extract_dependencies
 
 def run_fabric_extraction(args: argparse.Namespace, config: dict):
     """
@@ -50,135 +55,180 @@ def run_fabric_extraction(args: argparse.Namespace, config: dict):
     )
     
 
-    last_run_key = "Fabric"
+    last_run_key = LAST_RUN_KEYS["fabric"]
     last_run_dt = read_last_run(key=last_run_key)
     max_seen = last_run_dt
     
     total_changed = 0
     total_skipped = 0
+    # Units that failed; while any did, the watermark stays put so their changes are not skipped
+    failed = []
+
+    # With --shard, only this shard's (server, database) units run and state goes to a fragment
+    shard_plan = build_shard_plan(args)
+    unit_costs = {}
+    sink = open_sink(args, repo_root, "Fabric")
+
+    env_config = config.get("environments", {}).get("fabric", {}) or {}
+    do_dependencies = args.include_dependencies or bool(env_config.get("extract_dependencies"))
     
 
-    for server in servers:
-        if verbose:
-            print(f"\n{'='*60}\nProcessing server: {server}\n{'='*60}\n")
+    try:
+        for server in servers:
+            if verbose:
+                print(f"\n{'='*60}\nProcessing server: {server}\n{'='*60}\n")
             
 
-        # Initialize base connection string from args or env
-        base_conn_str = args.conn or os.environ.get("SQL_CONN")
+            # Initialize base connection string from args or env
+            base_conn_str = args.conn or os.environ.get("SQL_CONN")
 
-        # Driver Selection Logic
-        driver_to_use = args.driver
-        from ..core.connection import ensure_driver_available
-        if args.sp_fallback and not args.conn:
-             # Check if requested driver works, otherwise grab first available
-             try:
-                 ensure_driver_available(args.driver)
-             except RuntimeError:
-                 drivers = pyodbc.drivers()
-                 if drivers:
-                     driver_to_use = drivers[0]
-                     if verbose:
-                         print(f"WARN: Driver fallback enabled. Using installed driver: '{driver_to_use}'")
+            # Driver Selection Logic
+            driver_to_use = args.driver
+            from ..core.connection import ensure_driver_available
+            if args.sp_fallback and not args.conn:
+                 # Check if requested driver works, otherwise grab first available
+                 try:
+                     ensure_driver_available(args.driver)
+                 except RuntimeError:
+                     drivers = pyodbc.drivers()
+                     if drivers:
+                         driver_to_use = drivers[0]
+                         if verbose:
+                             print(f"WARN: Driver fallback enabled. Using installed driver: '{driver_to_use}'")
 
-        # If SP fallback requested, override any Interactive auth or missing credentials in default connection string
-        if args.sp_fallback and auth.has_sp_credentials() and base_conn_str:
-            conn_upper = base_conn_str.upper()
-            if "UID=" not in conn_upper or "ACTIVEDIRECTORYINTERACTIVE" in conn_upper:
-                 if verbose:
-                     print("DEBUG: SQL_CONN incompatible with --sp-fallback (Interactive or missing SP credentials). Rebuilding connection string.")
-                 base_conn_str = None # Force rebuild in the next block
+            # If SP fallback requested, override any Interactive auth or missing credentials in default connection string
+            if args.sp_fallback and auth.has_sp_credentials() and base_conn_str:
+                conn_upper = base_conn_str.upper()
+                if "UID=" not in conn_upper or "ACTIVEDIRECTORYINTERACTIVE" in conn_upper:
+                     if verbose:
+                         print("DEBUG: SQL_CONN incompatible with --sp-fallback (Interactive or missing SP credentials). Rebuilding connection string.")
+                     base_conn_str = None # Force rebuild in the next block
 
-        if not base_conn_str:
-             if args.ad_interactive:
-                 base_conn_str = build_connection_string(server=server, driver=driver_to_use, auth_interactive=True)
-             elif auth.has_sp_credentials():
-                 base_conn_str = build_connection_string(
-                     server=server, 
-                     driver=driver_to_use, 
-                     auth_sp=True, 
-                     sp_legacy=args.sp_fallback,
-                     sp_client_id=auth.client_id,
-                     sp_client_secret=auth.client_secret
-                 )
-             else:
-                 base_conn_str = build_connection_string(server=server, driver=driver_to_use)
+            if not base_conn_str:
+                 if args.ad_interactive:
+                     base_conn_str = build_connection_string(server=server, driver=driver_to_use, auth_interactive=True)
+                 elif auth.has_sp_credentials():
+                     base_conn_str = build_connection_string(
+                         server=server, 
+                         driver=driver_to_use, 
+                         auth_sp=True, 
+                         sp_legacy=args.sp_fallback,
+                         sp_client_id=auth.client_id,
+                         sp_client_secret=auth.client_secret
+                     )
+                 else:
+                     base_conn_str = build_connection_string(server=server, driver=driver_to_use)
         
-        # Ensure server name in conn string matches current loop
-        server_conn_str = replace_server_in_conn(base_conn_str, server)
+            # Ensure server name in conn string matches current loop
+            server_conn_str = replace_server_in_conn(base_conn_str, server)
         
-        # List Databases
-        dbs = []
-        # Determine strict auth manager for listing: 
-        # If using legacy fallback, DO NOT pass auth token manager to list_databases (avoids token injection mixing)
-        list_db_auth = auth if (auth.has_sp_credentials() and not args.sp_fallback) else None
+            # List Databases
+            dbs = []
+            # Determine strict auth manager for listing: 
+            # If using legacy fallback, DO NOT pass auth token manager to list_databases (avoids token injection mixing)
+            list_db_auth = auth if (auth.has_sp_credentials() and not args.sp_fallback) else None
+            server_filters = resolve_filters(env_config, server)
         
-        if args.databases_file:
-             if os.path.exists(args.databases_file):
-                 with open(args.databases_file, 'r') as f:
-                     dbs = [line.strip() for line in f if line.strip()]
-        elif args.databases:
-            dbs = [d.strip() for d in args.databases.split(',') if d.strip()]
-        elif args.all_databases:
-            dbs = list_databases(server_conn_str, auth_manager=list_db_auth, verbose=verbose)
-        elif args.database:
-            dbs = [args.database]
-        else:
-             # Try to infer from conn string
-             import re
-             m = re.search(r'(?i)\b(database|initial catalog)\s*=\s*([^;]+)', server_conn_str)
-             if m:
-                 dbs = [m.group(2)]
-             else:
-                 print(f"ERROR: No database specified for server {server}. Skipping.")
-                 continue
+            if args.databases_file:
+                 if os.path.exists(args.databases_file):
+                     with open(args.databases_file, 'r') as f:
+                         dbs = [line.strip() for line in f if line.strip()]
+            elif args.databases:
+                dbs = [d.strip() for d in args.databases.split(',') if d.strip()]
+            elif args.all_databases:
+                dbs = list_databases(server_conn_str, auth_manager=list_db_auth, verbose=verbose, filters=server_filters)
+            elif args.database:
+                dbs = [args.database]
+            else:
+                 # Try to infer from conn string
+                 import re
+                 m = re.search(r'(?i)\b(database|initial catalog)\s*=\s*([^;]+)', server_conn_str)
+                 if m:
+                     dbs = [m.group(2)]
+                 else:
+                     print(f"ERROR: No database specified for server {server}. Skipping.")
+                     continue
+
+            # Excluded databases never get a connection
+            dbs = filter_databases(server_filters, dbs, verbose=verbose)
+            if shard_plan:
+                dbs = [d for d in dbs if shard_plan.owns(server, d)]
                  
-        for db_name in dbs:
-            if verbose:
-                print(f"Processing database: {db_name}")
+            for db_name in dbs:
+                if verbose:
+                    print(f"Processing database: {db_name}")
                 
-            db_conn_str = replace_db_in_conn(server_conn_str, db_name)
+                db_conn_str = replace_db_in_conn(server_conn_str, db_name)
             
-            if args.export_env:
-                os.environ["SQL_CONN"] = db_conn_str
+                if args.export_env:
+                    os.environ["SQL_CONN"] = db_conn_str
+                started = time.perf_counter()
 
-            # Connect
-            try:
-                connect_args = {"autocommit": True}
-                # Check if we should inject token
-                # Logic: If using SP tokens (not legacy fallback)
-                if auth.has_sp_credentials() and not args.sp_fallback and not args.ad_interactive:
-                     token_bytes = auth.get_access_token()
-                     if token_bytes:
-                         connect_args["attrs_before"] = {1256: token_bytes}
+                # Connect
+                try:
+                    connect_args = {"autocommit": True}
+                    # Check if we should inject token
+                    # Logic: If using SP tokens (not legacy fallback)
+                    if auth.has_sp_credentials() and not args.sp_fallback and not args.ad_interactive:
+                         token_bytes = auth.get_access_token()
+                         if token_bytes:
+                             connect_args["attrs_before"] = {1256: token_bytes}
                 
-                with pyodbc.connect(db_conn_str, **connect_args) as conn:
-                    c, s, m = extract_sql_objects(
-                        conn=conn,
-                        server_name=server,
-                        db_name=db_name,
-                        base_repo_root=repo_root,
-                        type_str="Fabric",
-                        last_run_dt=last_run_dt,
-                        include_drop=args.include_drop,
-                        include_header=args.header,
-                        dry_run=dry_run,
-                        verbose=verbose
-                    )
-                    total_changed += c
-                    total_skipped += s
-                    if m > max_seen:
-                        max_seen = m
+                    with pyodbc.connect(db_conn_str, **connect_args) as conn:
+                        rescripted = []
+                        c, s, m = extract_sql_objects(
+                            conn=conn,
+                            server_name=server,
+                            db_name=db_name,
+                            base_repo_root=repo_root,
+                            type_str="Fabric",
+                            last_run_dt=last_run_dt,
+                            include_drop=args.include_drop,
+                            include_header=args.header,
+                            dry_run=dry_run,
+                            verbose=verbose,
+                            rescripted=rescripted,
+                            sink=sink,
+                            filters=resolve_filters(env_config, server, db_name)
+                        )
+                        if do_dependencies:
+                            extract_dependencies(
+                                conn=conn,
+                                server_name=server,
+                                db_name=db_name,
+                                base_repo_root=repo_root,
+                                type_str="Fabric",
+                                objects=rescripted,
+                                dry_run=dry_run,
+                                verbose=verbose,
+                                sink=sink
+                            )
+                        total_changed += c
+                        total_skipped += s
+                        if m > max_seen:
+                            max_seen = m
                         
-            except Exception as e:
-                print(f"ERROR: [Server: {server}] Failed to process database {db_name}: {e}")
-                if verbose:
-                    import traceback
-                    traceback.print_exc()
-
+                except Exception as e:
+                    failed.append(unit_key(server, db_name))
+                    print(f"ERROR: [Server: {server}] Failed to process database {db_name}: {e}")
+                    if verbose:
+                        import traceback
+                        traceback.print_exc()
+                unit_costs[unit_key(server, db_name)] = time.perf_counter() - started
+    finally:
+        # Commits what was written so far even if the run stops early (e.g. a bundle)
+        sink.close()
     print(f"Total changed: {total_changed}, skipped: {total_skipped}")
+    if failed:
+        print(f"WARN: {len(failed)} failed ({', '.join(failed)}); {last_run_key} stays at {last_run_dt.isoformat()} so the next run picks up their changes.")
+        max_seen = last_run_dt
     
     # Update Last Run
-    if max_seen > last_run_dt and not dry_run:
+    if shard_plan:
+        if not dry_run:
+            path = write_fragment(args.state_dir, last_run_key, shard_plan, last_run_dt, max_seen, unit_costs, failed)
+            print(f"Shard {shard_plan.label} state written to {path}; combine with 'merge-state'.")
+    elif max_seen > last_run_dt and not dry_run:
         write_last_run("last_run.yaml", last_run_key, max_seen)
         if verbose:
             print(f"Updated last_run.yaml {last_run_key} = {max_seen.isoformat()}")
@@ -1,11 +1,17 @@
 
 import os
+import time
 import argparse
 from datetime import datetime, timezone
-from ..core.connection import build_connection_string, replace_server_in_conn, replace_db_in_conn, list_databases
-from ..core.tracking import read_last_run, write_last_run
-from .sql_objects import extract_sql_objects
+from ..core.connection import build_connection_string, build_onprem_connection_string, replace_server_in_conn, replace_db_in_conn, list_databases
+from ..core.tracking import read_last_run, write_last_run, LAST_RUN_KEYS
+from ..core.sharding import AGENT_JOBS_UNIT, build_shard_plan, unit_key, write_fragment
+from ..core.filters import resolve_filters, filter_databases
+from ..core.sinks import open_sink
+from ..core.throttle import LoadThrottle, low_impact_settings, low_impact_conn_str, prepare_session, load_sampler, with_lock_retries
+from .sql_objects import extract_sql_objects, extract_server_sql_objects
 from .sql_agent import extract_sql_agent_jobs
+from .dependencies import extract_dependencies, dependencies_need_refresh
 
 def run_onprem_extraction(args: argparse.Namespace, config: dict):
     """
@@ -33,78 +39,176 @@ def run_onprem_extraction(args: argparse.Namespace, config: dict):
         return
 
     
-    last_run_key = "On-Prem"
+    last_run_key = LAST_RUN_KEYS["onprem"]
     last_run_dt = read_last_run(key=last_run_key)
     max_seen = last_run_dt
     
     total_changed = 0
     total_skipped = 0
+    # Units that failed; while any did, the watermark stays put so their changes are not skipped
+    failed = []
+
+    # With --shard, only this shard's (server, database) units run and state goes to a fragment
+    shard_plan = build_shard_plan(args)
+    unit_costs = {}
+    sink = open_sink(args, repo_root, "OnPrem")
+
+    env_config = config.get("environments", {}).get("onprem", {}) or {}
+    do_dependencies = args.include_dependencies or bool(env_config.get("extract_dependencies"))
+    server_wide = args.server_wide or bool(env_config.get("server_wide"))
+
+    # Low-impact mode: give way on locks, and adapt concurrency to the server's load
+    low_impact = low_impact_settings(args, env_config)
+    workers = low_impact["max_workers"] if low_impact else (args.workers or 1)
+    if low_impact:
+        print(f"Low-impact mode: lock timeout {low_impact['lock_timeout_ms']} ms, up to {workers} databases in parallel per server.")
+
+    def connect(conn_str: str):
+        import pyodbc
+        if low_impact:
+            conn_str = low_impact_conn_str(conn_str)
+        conn = pyodbc.connect(conn_str, autocommit=True)
+        prepare_session(conn, low_impact)
+        return conn
     
    
-    for server in servers:
-        if verbose:
-            print(f"\n{'='*60}\nProcessing server: {server}\n{'='*60}\n")
+    try:
+        for server in servers:
+            if verbose:
+                print(f"\n{'='*60}\nProcessing server: {server}\n{'='*60}\n")
             
         
-        base_conn_str = f"DRIVER={{{args.driver}}};SERVER={server};Trusted_Connection=yes;Encrypt=yes;TrustServerCertificate=yes;"
-        if args.conn:
-             base_conn_str = replace_server_in_conn(args.conn, server)
-
-        dbs = []
-        if args.all_databases:
-            dbs = list_databases(base_conn_str, verbose=verbose)
-        elif args.databases:
-             dbs = [d.strip() for d in args.databases.split(',') if d.strip()]
-        elif args.database:
-             dbs = [args.database]
-        else:
-             pass
+            base_conn_str = build_onprem_connection_string(server, args.driver)
+            if args.conn:
+                 base_conn_str = replace_server_in_conn(args.conn, server)
+
+            server_filters = resolve_filters(env_config, server)
+
+            dbs = []
+            if args.all_databases:
+                dbs = list_databases(base_conn_str, verbose=verbose, filters=server_filters)
+            elif args.databases:
+                 dbs = [d.strip() for d in args.databases.split(',') if d.strip()]
+            elif args.database:
+                 dbs = [args.database]
+            else:
+                 pass
+
+            # Excluded databases never get a connection
+            dbs = filter_databases(server_filters, dbs, verbose=verbose)
+            if shard_plan:
+                dbs = [d for d in dbs if shard_plan.owns(server, d)]
 
         
         
-        do_agent_jobs = False
-        if args.include_sql_agent_jobs:
-            do_agent_jobs = True
-        elif config.get("environments", {}).get("onprem", {}).get("extract_agent_jobs"):
-            do_agent_jobs = True
+            do_agent_jobs = False
+            if args.include_sql_agent_jobs:
+                do_agent_jobs = True
+            elif config.get("environments", {}).get("onprem", {}).get("extract_agent_jobs"):
+                do_agent_jobs = True
             
-        import pyodbc
-        
-        # SQL Agent Jobs
-        if do_agent_jobs:
-            try:
-                msdb_conn_str = replace_db_in_conn(base_conn_str, "msdb")
-                with pyodbc.connect(msdb_conn_str, autocommit=True) as conn:
-                    c, s, m = extract_sql_agent_jobs(
-                        conn=conn,
-                        server_name=server,
-                        base_repo_root=repo_root,
-                        type_str="OnPrem",
-                        last_run_dt=last_run_dt,
-                        dry_run=dry_run,
-                        verbose=verbose
-                    )
+            # SQL Agent Jobs
+            if do_agent_jobs and shard_plan and not shard_plan.owns(server, AGENT_JOBS_UNIT):
+                do_agent_jobs = False
+
+            if do_agent_jobs:
+                started = time.perf_counter()
+                def extract_agent_jobs():
+                    msdb_conn_str = replace_db_in_conn(base_conn_str, "msdb")
+                    with connect(msdb_conn_str) as conn:
+                        return extract_sql_agent_jobs(
+                            conn=conn,
+                            server_name=server,
+                            base_repo_root=repo_root,
+                            type_str="OnPrem",
+                            last_run_dt=last_run_dt,
+                            dry_run=dry_run,
+                            verbose=verbose,
+                            filters=server_filters,
+                            sink=sink
+                        )
+
+                try:
+                    c, s, m = with_lock_retries(extract_agent_jobs, low_impact, f"[Server: {server}] Agent jobs: ")
                     total_changed += c
                     total_skipped += s
                     if m > max_seen:
                         max_seen = m
-            except Exception as e:
-                print(f"ERROR: [Server: {server}] Agent Job extraction failed: {e}")
-                if verbose:
-                    import traceback
-                    traceback.print_exc()
+                except Exception as e:
+                    failed.append(unit_key(server, AGENT_JOBS_UNIT))
+                    print(f"ERROR: [Server: {server}] Agent Job extraction failed: {e}")
+                    if verbose:
+                        import traceback
+                        traceback.print_exc()
+                unit_costs[unit_key(server, AGENT_JOBS_UNIT)] = time.perf_counter() - started
 
-        # SQL Objects (Views/Procs)
-        if dbs:
-            for db_name in dbs:
+            # Server-wide mode: one catalog round trip for all databases; failed batches fall back to per-database
+            if dbs and server_wide:
+                started = time.perf_counter()
+                results = {}
+                try:
+                    with connect(base_conn_str) as conn:
+                        results = extract_server_sql_objects(
+                            conn=conn,
+                            server_name=server,
+                            db_names=dbs,
+                            base_repo_root=repo_root,
+                            type_str="OnPrem",
+                            last_run_dt=last_run_dt,
+                            include_drop=args.include_drop,
+                            include_header=args.header,
+                            dry_run=dry_run,
+                            verbose=verbose,
+                            filters_by_db={d: resolve_filters(env_config, server, d) for d in dbs},
+                            sink=sink
+                        )
+                except Exception as e:
+                    print(f"ERROR: [Server: {server}] Server-wide extraction failed: {e}")
+                    if verbose:
+                        import traceback
+                        traceback.print_exc()
+                elapsed = time.perf_counter() - started
+
+                for db_name, (c, s, m, rescripted) in results.items():
+                    total_changed += c
+                    total_skipped += s
+                    if m > max_seen:
+                        max_seen = m
+                    unit_costs[unit_key(server, db_name)] = elapsed / len(results)
+                    if do_dependencies and dependencies_need_refresh(repo_root, "OnPrem", db_name, rescripted, sink=sink):
+                        try:
+                            with connect(replace_db_in_conn(base_conn_str, db_name)) as conn:
+                                extract_dependencies(
+                                    conn=conn,
+                                    server_name=server,
+                                    db_name=db_name,
+                                    base_repo_root=repo_root,
+                                    type_str="OnPrem",
+                                    objects=rescripted,
+                                    dry_run=dry_run,
+                                    verbose=verbose,
+                                    sink=sink
+                                )
+                        except Exception as e:
+                            failed.append(unit_key(server, db_name))
+                            print(f"ERROR: [Server: {server}] Dependency extraction failed for {db_name}: {e}")
+
+                dbs = [d for d in dbs if d not in results]
+                if dbs:
+                    print(f"WARN: [Server: {server}] Falling back to per-database extraction for {len(dbs)} databases.")
+
+            # SQL Objects (Views/Procs)
+            def extract_database(db_name: str):
                 if verbose:
                     print(f"Processing database: {db_name}")
-                
+
                 db_conn_str = replace_db_in_conn(base_conn_str, db_name)
-                
-                try:
-                    with pyodbc.connect(db_conn_str, autocommit=True) as conn:
-                        c, s, m = extract_sql_objects(
+                started = time.perf_counter()
+
+                def attempt():
+                    with connect(db_conn_str) as conn:
+                        rescripted = []
+                        result = extract_sql_objects(
                             conn=conn,
                             server_name=server,
                             db_name=db_name,
@@ -114,22 +218,65 @@ def run_onprem_extraction(args: argparse.Namespace, config: dict):
                             include_drop=args.include_drop,
                             include_header=args.header,
                             dry_run=dry_run,
-                            verbose=verbose
+                            verbose=verbose,
+                            rescripted=rescripted,
+                            sink=sink,
+                            filters=resolve_filters(env_config, server, db_name)
                         )
-                        total_changed += c
-                        total_skipped += s
-                        if m > max_seen:
-                            max_seen = m
+                        if do_dependencies:
+                            extract_dependencies(
+                                conn=conn,
+                                server_name=server,
+                                db_name=db_name,
+                                base_repo_root=repo_root,
+                                type_str="OnPrem",
+                                objects=rescripted,
+                                dry_run=dry_run,
+                                verbose=verbose,
+                                sink=sink
+                            )
+                        return result
+
+                try:
+                    c, s, m = with_lock_retries(attempt, low_impact, f"[Server: {server}] {db_name}: ")
+                    ok = True
                 except Exception as e:
+                    c, s, m, ok = 0, 0, last_run_dt, False
                     print(f"ERROR: [Server: {server}] DB extraction failed for {db_name}: {e}")
                     if verbose:
                         import traceback
                         traceback.print_exc()
+                return c, s, m, ok, time.perf_counter() - started
 
+            if dbs:
+                sampler = load_sampler(lambda: connect(replace_db_in_conn(base_conn_str, "master"))) if low_impact else None
+                throttle = LoadThrottle(workers, sampler=sampler, settings=low_impact, verbose=verbose)
+                try:
+                    for db_name, (c, s, m, ok, elapsed) in throttle.map(extract_database, dbs):
+                        if not ok:
+                            failed.append(unit_key(server, db_name))
+                        total_changed += c
+                        total_skipped += s
+                        if m > max_seen:
+                            max_seen = m
+                        unit_costs[unit_key(server, db_name)] = elapsed
+                finally:
+                    if sampler:
+                        sampler.close()
+    finally:
+        # Commits what was written so far even if the run stops early (e.g. a bundle)
+        sink.close()
     print(f"Total changed: {total_changed}, skipped: {total_skipped}")
+    if failed:
+        print(f"WARN: {len(failed)} failed ({', '.join(failed)}); {last_run_key} stays at {last_run_dt.isoformat()} so the next run picks up their changes.")
+        max_seen = last_run_dt
 
     # Update Last Run
-    if max_seen > last_run_dt and not dry_run:
+    if shard_plan:
+        if not dry_run:
+            path = write_fragment(args.state_dir, last_run_key, shard_plan, last_run_dt, max_seen, unit_costs, failed)
+            print(f"Shard {shard_plan.label} state written to {path}; combine with 'merge-state'.")
+    elif max_seen > last_run_dt and not dry_run:
         write_last_run("last_run.yaml", last_run_key, max_seen)
         if verbose:
              print(f"Updated last_run.yaml {last_run_key} = {max_seen.isoformat()}")
@@ -0,0 +1,147 @@
+
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Tuple
+from ..core.connection import build_connection_string, build_onprem_connection_string, replace_db_in_conn, replace_server_in_conn, open_connection
+from ..core.catalog import KEY_LOOKUP_CHUNK
+from ..core.sinks import FileSink
+from ..core.utils import split_ident
+from ..core.tracking import SOURCE_TYPES
+from .sql_objects import extract_sql_objects
+from .sql_agent import extract_sql_agent_jobs
+from .dependencies import extract_dependencies
+
+# Passed as the watermark so every requested object is rendered; the result decides what gets written
+RESCRIPT_ALL = datetime(1900, 1, 1, tzinfo=timezone.utc)
+
+def parse_object_names(objects: Iterable[str], db_name: Optional[str] = None, default_schema: str = "dbo") -> List[Tuple[str, str]]:
+    """
+    Turns name, schema.name or db.schema.name (brackets allowed) into (schema, name) pairs.
+    Three-part names must refer to db_name.
+    """
+    out = []
+    for text in objects:
+        parts = split_ident(text)
+        if len(parts) == 1:
+            parts = [default_schema] + parts
+        elif len(parts) == 3:
+            if db_name and parts[0].lower() != db_name.lower():
+                raise ValueError(f"{text} is not in database {db_name}")
+            parts = parts[1:]
+        if len(parts) != 2 or not all(parts):
+            raise ValueError(f"Cannot parse object name {text}")
+        out.append((parts[0], parts[1]))
+    return out
+
+def _connect(server: str, database: str, source: str, conn_str: Optional[str], auth_manager, driver: str):
+    if conn_str:
+        conn_str = replace_server_in_conn(conn_str, server)
+    elif source == "fabric":
+        conn_str = build_connection_string(server=server, driver=driver)
+        if auth_manager is None:
+            from ..core.auth import AuthManager
+            auth_manager = AuthManager()
+    else:
+        conn_str = build_onprem_connection_string(server, driver)
+    return open_connection(replace_db_in_conn(conn_str, database), auth_manager=auth_manager)
+
+def refresh(
+    server: str,
+    database: Optional[str] = None,
+    objects: Optional[Iterable[str]] = None,
+    jobs: Optional[Iterable[str]] = None,
+    source: str = "onprem",
+    repo_root: str = ".",
+    conn_str: Optional[str] = None,
+    auth_manager=None,
+    driver: str = "ODBC Driver 17 for SQL Server",
+    include_drop: bool = False,
+    include_header: bool = False,
+    include_dependencies: bool = False,
+    dry_run: bool = False,
+    verbose: bool = False,
+    sink=None
+) -> dict:
+    """
+    Re-scripts the given objects of one database and/or agent jobs of the server, e.g. right after a deployment.
+    Objects are fetched with one parameterised key-list catalog query (per 1000 objects), jobs with one msdb query,
+    and written through the same rendering and write_if_changed path as a full extraction.
+    last_run.yaml is not touched. sink defaults to files below repo_root (it is closed only if created here).
+    Returns {"changed", "skipped", "missing"}; missing lists requested objects and jobs that were not found
+    (dropped, disabled, encrypted or without permission).
+    """
+    if source not in SOURCE_TYPES:
+        raise ValueError(f"Unknown source {source}; expected one of {', '.join(SOURCE_TYPES)}")
+    type_str = SOURCE_TYPES[source]
+    pairs = parse_object_names(objects or [], database)
+    job_names = list(dict.fromkeys(jobs or []))
+    if pairs and not database:
+        raise ValueError("Refreshing objects needs a database")
+
+    own_sink = sink is None
+    sink = sink or FileSink(repo_root)
+    changed = 0
+    skipped = 0
+    missing = []
+    try:
+        if pairs:
+            rescripted = []
+            with _connect(server, database, source, conn_str, auth_manager, driver) as conn:
+                for i in range(0, len(pairs), KEY_LOOKUP_CHUNK):
+                    c, s, _ = extract_sql_objects(
+                        conn=conn,
+                        server_name=server,
+                        db_name=database,
+                        base_repo_root=repo_root,
+                        type_str=type_str,
+                        last_run_dt=RESCRIPT_ALL,
+                        include_drop=include_drop,
+                        include_header=include_header,
+                        dry_run=dry_run,
+                        verbose=verbose,
+                        rescripted=rescripted,
+                        sink=sink,
+                        objects=pairs[i:i + KEY_LOOKUP_CHUNK]
+                    )
+                    changed += c
+                    skipped += s
+                if include_dependencies and rescripted:
+                    extract_dependencies(
+                        conn=conn,
+                        server_name=server,
+                        db_name=database,
+                        base_repo_root=repo_root,
+                        type_str=type_str,
+                        objects=rescripted,
+                        dry_run=dry_run,
+                        verbose=verbose,
+                        sink=sink
+                    )
+            found = {(s.lower(), n.lower()) for s, n in rescripted}
+            missing.extend(f"{s}.{n}" for s, n in pairs if (s.lower(), n.lower()) not in found)
+
+        if job_names:
+            rescripted_jobs = []
+            with _connect(server, "msdb", source, conn_str, auth_manager, driver) as conn:
+                c, s, _ = extract_sql_agent_jobs(
+                    conn=conn,
+                    server_name=server,
+                    base_repo_root=repo_root,
+                    type_str=type_str,
+                    last_run_dt=RESCRIPT_ALL,
+                    dry_run=dry_run,
+                    verbose=verbose,
+                    sink=sink,
+                    names=job_names,
+                    rescripted=rescripted_jobs
+                )
+                changed += c
+                skipped += s
+            found = {j.lower() for j in rescripted_jobs}
+            missing.extend(f"job {j}" for j in job_names if j.lower() not in found)
+    finally:
+        if own_sink:
+            sink.close()
+
+    for name in missing:
+        print(f"WARN: [Server: {server}] {name} not found; nothing re-scripted for it.")
+    return {"changed": changed, "skipped": skipped, "missing": missing}
@@ -1,13 +1,39 @@
 
 import os
 import pyodbc
+from collections import namedtuple
 from datetime import datetime, timezone
-from typing import Tuple
-from ..core.filesystem import sanitise_filename, write_if_changed, is_different
+from itertools import groupby
+from typing import Iterator, List, Optional, Tuple
+from ..core.filesystem import sanitise_filename
+from ..core.sinks import FileSink
 from ..core.tracking import _parse_datetime_to_utc
+from ..core.filters import build_filter_sql, apply_filters
+from ..core.rendering import render_agent_job
 
 SOURCE_FOLDER = "src"
+FETCH_SIZE = 500
 
+# Compact records; one job and its steps are held in memory at a time
+AgentJob = namedtuple("AgentJob", "job_id name enabled description date_created date_modified")
+AgentJobStep = namedtuple(
+    "AgentJobStep",
+    "step_id step_name subsystem command database on_success_action on_fail_action retry_attempts retry_interval"
+)
+
+def _iter_rows(cur) -> Iterator:
+    """Streams cursor rows in blocks instead of materialising the whole result."""
+    while True:
+        rows = cur.fetchmany(FETCH_SIZE)
+        if not rows:
+            return
+        yield from rows
+
+def _step(row) -> AgentJobStep:
+    return AgentJobStep(
+        row.StepId, row.StepName, row.Subsystem, row.Command or '', row.DatabaseName or '',
+        row.OnSuccessAction, row.OnFailAction, row.RetryAttempts, row.RetryInterval
+    )
 
 def extract_sql_agent_jobs(
     conn: pyodbc.Connection,
@@ -16,153 +42,107 @@ def extract_sql_agent_jobs(
     type_str: str,
     last_run_dt: datetime,
     dry_run: bool = False,
-    verbose: bool = False
+    verbose: bool = False,
+    filters: Optional[dict] = None,
+    sink=None,
+    names: Optional[List[str]] = None,
+    rescripted: Optional[List[str]] = None
 ) -> Tuple[int, int, datetime]:
     """
     Extracts SQL Agent Jobs from msdb.
+    Rows are streamed and each job is written as soon as its last step arrives.
+    include_jobs/exclude_jobs from filters are applied in the query itself,
+    and names restricts it to exactly these job names.
+    If rescripted is given, the name of every job rendered in this run is appended to it.
+    sink selects the output (core.sinks); defaults to files below base_repo_root.
     Returns (changed_count, skipped_count, max_modified_dt).
     """
     query_path = os.path.join(os.path.dirname(__file__), "..", "queries", "sql_agent_jobs.sql")
     with open(query_path, "r", encoding="utf-8") as f:
         query_sql = f.read()
 
+    filter_sql, params = build_filter_sql(filters or {}, name_expr="j.name", name_keys=("include_jobs", "exclude_jobs"))
+    if names is not None:
+        params = params + list(names)
+        name_sql = f"AND j.name IN ({', '.join('?' for _ in names)})"
+        filter_sql = "\n    ".join(p for p in (filter_sql, name_sql) if p)
+    query_sql = apply_filters(query_sql, filter_sql)
+
     print(f"[{server_name}] Connecting to msdb for SQL Agent jobs...")
     
-    try:
-        cur = conn.cursor()
-        cur.execute(query_sql)
-        rows = cur.fetchall()
-    except Exception as e:
-        print(f"ERROR: [{server_name}] Failed to query msdb: {e}")
-        if verbose:
-            import traceback
-            traceback.print_exc()
-        return 0, 0, last_run_dt
+    # A failed query is raised, so the caller can retry it and hold back the watermark
+    cur = conn.cursor()
+    cur.execute(query_sql, *params)
 
-    if not rows:
-        print(f"[{server_name}] No SQL Agent job records found.")
-        return 0, 0, last_run_dt
-        
-    print(f"[{server_name}] Found {len(rows)} SQL Agent job step records.")
-
-    # Group rows by JobId
-    jobs_dict = {}
-    
+    changed = 0
+    skipped = 0
+    jobs = 0
+    step_records = 0
     max_seen = last_run_dt
-    
-    for row in rows:
-        job_id = str(row.job_id)
-        if job_id not in jobs_dict:
-            jobs_dict[job_id] = {
-                "name": row.JobName,
-                "enabled": row.IsEnabled,
-                "description": row.JobDescription,
-                "date_created": row.DateCreated,
-                "date_modified": row.DateModified,
-                "steps": []
-            }
+    sink = sink or FileSink(base_repo_root)
+    base_dir = os.path.join(SOURCE_FOLDER, type_str or "", sanitise_filename(server_name), "SQL_AGENT_JOBS")
+
+    # Rows arrive ordered by job, so each job is complete as soon as the next one starts
+    for job_id, job_rows in groupby(_iter_rows(cur), key=lambda r: str(r.job_id)):
+        first = next(job_rows)
+        job = AgentJob(job_id, first.JobName, first.IsEnabled, first.JobDescription, first.DateCreated, first.DateModified)
+        steps = [_step(first)] if first.StepId is not None else []
+        steps.extend(_step(r) for r in job_rows if r.StepId is not None)
+        jobs += 1
+        step_records += max(len(steps), 1)
 
         # Check max modified date
         try:
-            mod_dt = _parse_datetime_to_utc(row.DateModified)
+            mod_dt = _parse_datetime_to_utc(job.date_modified)
             if mod_dt and mod_dt > max_seen:
                 max_seen = mod_dt
         except Exception:
-            pass
-
-        if row.StepId is not None:
-             jobs_dict[job_id]["steps"].append({
-                "step_id": row.StepId,
-                "step_name": row.StepName,
-                "subsystem": row.Subsystem,
-                "command": row.Command or '',
-                "database": row.DatabaseName or '',
-                "on_success_action": row.OnSuccessAction,
-                "on_fail_action": row.OnFailAction,
-                "retry_attempts": row.RetryAttempts,
-                "retry_interval": row.RetryInterval
-             })
-             
-    changed = 0
-    skipped = 0
-    base_dir = os.path.join(base_repo_root, SOURCE_FOLDER, type_str or "", sanitise_filename(server_name), "SQL_AGENT_JOBS")
+            mod_dt = None
 
-    for job_id, job_data in jobs_dict.items():
-        job_name = job_data["name"]
-        date_modified = job_data["date_modified"]
-        
-        dest_file = os.path.join(base_dir, f"{sanitise_filename(job_name)}.txt")
-        file_exists = os.path.exists(dest_file)
+        dest_file = os.path.join(base_dir, f"{sanitise_filename(job.name)}.txt")
+        file_exists = sink.exists(dest_file)
         
         if file_exists:
-            try:
-                mod_dt = _parse_datetime_to_utc(date_modified)
-                if mod_dt and last_run_dt and mod_dt <= last_run_dt:
-                    if verbose:
-                        print(f"SKIP: Agent Job '{job_name}' - modified {mod_dt.isoformat()} <= last_run {last_run_dt.isoformat()}")
-                    skipped += 1
-                    continue
-            except Exception:
-                pass
+            if mod_dt and last_run_dt and mod_dt <= last_run_dt:
+                if verbose:
+                    print(f"SKIP: Agent Job '{job.name}' - modified {mod_dt.isoformat()} <= last_run {last_run_dt.isoformat()}")
+                skipped += 1
+                continue
         else:
             if verbose:
-                print(f"NEW: Agent Job '{job_name}' - file doesn't exist, will be added")
-        
-        content_parts = []
-        content_parts.append("=" * 60)
-        content_parts.append(f"SQL Agent Job: {job_name}")
-        content_parts.append("=" * 60)
-        content_parts.append(f"JobID: {job_id}")
-        content_parts.append(f"Enabled: {'Yes' if job_data['enabled'] else 'No'}")
-        content_parts.append(f"Description: {job_data['description']}")
-        content_parts.append(f"Date Created: {job_data['date_created']}")
-        content_parts.append(f"Date Modified: {date_modified}")
-        content_parts.append("=" * 60)
-
-        if job_data['steps']:
-            content_parts.append(f"Total Steps: {len(job_data['steps'])}")
-            content_parts.append("")
-
-            for step in sorted(job_data['steps'], key=lambda x: x['step_id']):
-                content_parts.append("-" * 60)
-                content_parts.append(f"Step {step['step_id']}: {step['step_name']}")
-                content_parts.append("-" * 60)
-                content_parts.append(f"Subsystem: {step['subsystem']}")
-                content_parts.append(f"Database: {step['database']}")
-                content_parts.append(f"On Success Action: {step['on_success_action']}")
-                content_parts.append(f"On Fail Action: {step['on_fail_action']}")
-                content_parts.append(f"Retry Attempts: {step['retry_attempts']}")
-                content_parts.append(f"Retry Interval: {step['retry_interval']}")
-                content_parts.append("")
-                content_parts.append("Command")
-                content_parts.append("-" * 40)
-                content_parts.append(step['command'])
-                content_parts.append("-" * 40)
-                content_parts.append("")
-        else:
-            content_parts.append("No steps found")
-            content_parts.append("")
+                print(f"NEW: Agent Job '{job.name}' - file doesn't exist, will be added")
 
-        content = "\n".join(content_parts)
+        content = render_agent_job(job, steps)
+        if rescripted is not None:
+            rescripted.append(job.name)
 
         if dry_run:
-            if is_different(dest_file, content):
+            if sink.is_different(dest_file, content):
                 changed += 1
                 if verbose:
-                    print(f"WOULD WRITE: {dest_file}")
+                    print(f"WOULD WRITE: {sink.describe(dest_file)}")
             else:
                 skipped += 1
                 if verbose:
-                    print(f"WOULD SKIP: {dest_file}")
+                    print(f"WOULD SKIP: {sink.describe(dest_file)}")
         else:
-            if write_if_changed(dest_file, content):
+            meta = {
+                "key": f"{server_name}/SQL_AGENT_JOBS/{job.name}", "server": server_name, "database": "msdb",
+                "schema": None, "name": job.name, "type": "JOB", "modified": mod_dt
+            }
+            if sink.write_if_changed(dest_file, content, meta):
                 changed += 1
                 if verbose:
-                    print(f"WROTE Agent Job: {dest_file}")
+                    print(f"WROTE Agent Job: {sink.describe(dest_file)}")
             else:
                 skipped += 1
                 if verbose:
-                    print(f"SKIPPED Agent Job: {dest_file}")
+                    print(f"SKIPPED Agent Job: {sink.describe(dest_file)}")
+
+    if not jobs:
+        print(f"[{server_name}] No SQL Agent job records found.")
+        return 0, 0, last_run_dt
 
+    print(f"[{server_name}] Processed {step_records} SQL Agent job step records across {jobs} jobs.")
     print(f"[{server_name}] Extracted agent jobs: {changed} changed, {skipped} skipped.")
     return changed, skipped, max_seen
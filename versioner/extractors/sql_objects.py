@@ -2,17 +2,141 @@
 import os
 import pyodbc
 from datetime import datetime, timezone
-from typing import Tuple
-from ..core.filesystem import sanitise_filename, write_if_changed, is_different
+from itertools import groupby, islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from ..core.filesystem import sanitise_filename
+from ..core.sinks import FileSink
 from ..core.tracking import _parse_datetime_to_utc
+from ..core.filters import build_filter_sql, apply_filters
+from ..core.rendering import render_sql_object
+from ..core.catalog import CATALOG_FILTER_EXPRS, TYPE_FOLDERS, catalog_query, key_filter_sql
+from ..core.dependencies import object_key
+from ..core.manifest import MANIFEST_FILE, definition_hash, manifest_key, load_manifest, save_manifest
 
 SOURCE_FOLDER = "src"
-VIEW_TYPE = {"V"}
-PROC_TYPE = {"P"}
-ALLOWED_TYPES = VIEW_TYPE | PROC_TYPE
 
-def bracket_ident(name: str):
-    return "[" + name.replace("]", "]]") + "]"
+# Object type code -> folder: see core.catalog.TYPE_FOLDERS
+ALLOWED_TYPES = set(TYPE_FOLDERS)
+
+# Catalog rows are fetched and filtered in blocks of this size
+FETCH_SIZE = 2000
+CATALOG_COLUMNS = ("SchemaName", "ObjectName", "ObjectType", "ObjectDefinition", "ModifiedDate")
+
+# Server-wide mode: databases per UNION ALL batch, within SQL Server's 2100 parameter limit.
+# Each database contributes one branch per object class, so batches stay small enough to compile quickly.
+SERVER_BATCH_DATABASES = 100
+SERVER_BATCH_PARAMS = 2000
+
+def _utc_naive(value) -> Optional[datetime]:
+    """Normalises a catalog date to naive UTC; None if it cannot be parsed."""
+    if type(value) is datetime and value.tzinfo is None:
+        return value
+    try:
+        return _parse_datetime_to_utc(value).replace(tzinfo=None)
+    except Exception:
+        return None
+
+def iter_catalog_blocks(cur, size: int = FETCH_SIZE) -> Iterator[Dict[str, tuple]]:
+    """Fetches catalog rows in blocks and transposes each block into column tuples."""
+    names = [d[0] for d in cur.description]
+    while True:
+        rows = cur.fetchmany(size)
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        yield {name: columns[i] for i, name in enumerate(names)}
+
+def _iter_rows(cur, size: int = FETCH_SIZE) -> Iterator:
+    while True:
+        rows = cur.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
+def _rows_to_blocks(rows: Iterable, names: List[str], size: int = FETCH_SIZE) -> Iterator[Dict[str, tuple]]:
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        columns = list(zip(*chunk))
+        yield {name: columns[i] for i, name in enumerate(names)}
+
+def build_server_catalog_batches(db_names: List[str], filters_by_db: Optional[Dict[str, dict]] = None) -> List[Tuple[List[str], str, list]]:
+    """
+    Builds UNION ALL of the catalog query over [db].sys.* for many databases,
+    each branch tagged with its DatabaseName and carrying that database's filters.
+    Returns [(db_names, sql, params)], split to stay within the parameter limit.
+    """
+    batches = []
+    dbs, branches, params = [], [], []
+    for db_name in db_names:
+        filter_sql, branch_params = build_filter_sql((filters_by_db or {}).get(db_name) or {}, **CATALOG_FILTER_EXPRS)
+        if branches and (len(dbs) >= SERVER_BATCH_DATABASES or len(params) + len(branch_params) > SERVER_BATCH_PARAMS):
+            batches.append((dbs, "\nUNION ALL\n".join(branches) + "\nORDER BY DatabaseName, SchemaName, ObjectName", params))
+            dbs, branches, params = [], [], []
+        branches.append(apply_filters(catalog_query(db_name), filter_sql))
+        params.extend(branch_params)
+        dbs.append(db_name)
+    if branches:
+        batches.append((dbs, "\nUNION ALL\n".join(branches) + "\nORDER BY DatabaseName, SchemaName, ObjectName", params))
+    return batches
+
+def extract_server_sql_objects(
+    conn: pyodbc.Connection,
+    server_name: str,
+    db_names: List[str],
+    base_repo_root: str,
+    type_str: str,
+    last_run_dt: datetime,
+    include_drop: bool = False,
+    include_header: bool = False,
+    dry_run: bool = False,
+    verbose: bool = False,
+    filters_by_db: Optional[Dict[str, dict]] = None,
+    sink=None
+) -> Dict[str, Tuple[int, int, datetime, List[Tuple[str, str]]]]:
+    """
+    Extracts SQL objects of many databases over one connection, one round trip per batch of databases.
+    The per-database layout under src/<type>/<db> is unchanged.
+    Returns {db_name: (changed_count, skipped_count, max_modified_dt, rescripted)};
+    databases of a batch that failed are missing from the result.
+    """
+    results = {}
+    cur = conn.cursor()
+    for dbs, query_sql, params in build_server_catalog_batches(db_names, filters_by_db):
+        try:
+            cur.execute(query_sql, *params)
+        except Exception as e:
+            print(f"ERROR: [Server: {server_name}] server-wide catalog query failed for {len(dbs)} databases: {e}")
+            if verbose:
+                import traceback
+                traceback.print_exc()
+            continue
+
+        names = [d[0] for d in cur.description]
+        db_index = names.index("DatabaseName")
+        for db_name in dbs:
+            results[db_name] = (0, 0, last_run_dt, [])
+        # Rows arrive ordered by database; each run of rows is written as one database
+        for db_name, rows in groupby(_iter_rows(cur), key=lambda r: r[db_index]):
+            rescripted = []
+            c, s, m = write_sql_objects(
+                _rows_to_blocks(rows, names),
+                server_name=server_name,
+                db_name=db_name,
+                base_repo_root=base_repo_root,
+                type_str=type_str,
+                last_run_dt=last_run_dt,
+                include_drop=include_drop,
+                include_header=include_header,
+                dry_run=dry_run,
+                verbose=verbose,
+                rescripted=rescripted,
+                sink=sink
+            )
+            results[db_name] = (c, s, m, rescripted)
+    return results
 
 def extract_sql_objects(
     conn: pyodbc.Connection,
@@ -24,151 +148,207 @@ def extract_sql_objects(
     include_drop: bool = False,
     include_header: bool = False,
     dry_run: bool = False,
-    verbose: bool = False
+    verbose: bool = False,
+    rescripted: Optional[List[Tuple[str, str]]] = None,
+    filters: Optional[dict] = None,
+    sink=None,
+    objects: Optional[List[Tuple[str, str]]] = None
 ) -> Tuple[int, int, datetime]:
     """
-    Extracts SQL objects (Views, Procedures) from the database.
+    Extracts SQL objects (views, procedures, functions, triggers, synonyms, sequences and
+    table types) from the database in one catalog round trip.
+    If rescripted is given, (schema, name) of every object rendered in this run is appended to it.
+    filters (see core.filters.resolve_filters) are applied in the catalog query itself.
+    objects restricts the query to these (schema, name) pairs (see core.catalog.key_filter_sql).
+    sink selects the output (core.sinks); defaults to files below base_repo_root.
     Returns (changed_count, skipped_count, max_modified_dt).
     """
-    query_path = os.path.join(os.path.dirname(__file__), "..", "queries", "sql_objects.sql")
-    with open(query_path, "r", encoding="utf-8") as f:
-        query_sql = f.read()
-
-    try:
-        cur = conn.cursor()
-        cur.execute(query_sql)
-        rows = cur.fetchall()
-    except Exception as e:
-        print(f"ERROR: [Server: {server_name}] query failed for {db_name}: {e}")
-        if verbose:
-            import traceback
-            traceback.print_exc()
-        return 0, 0, last_run_dt
+    filter_sql, params = build_filter_sql(filters or {}, **CATALOG_FILTER_EXPRS)
+    if objects is not None:
+        key_sql, key_params = key_filter_sql(objects)
+        filter_sql = "\n    ".join(p for p in (filter_sql, key_sql) if p)
+        params = params + key_params
+    query_sql = apply_filters(catalog_query(), filter_sql) + "\nORDER BY SchemaName, ObjectName"
 
-    if verbose:
-        print(f"DEBUG: [Server: {server_name}] fetched {len(rows)} rows from database {db_name}")
+    # A failed query is raised, so the caller can retry it and hold back the watermark
+    cur = conn.cursor()
+    cur.execute(query_sql, *params)
 
-    if not rows:
-        return 0, 0, last_run_dt
+    return write_sql_objects(
+        iter_catalog_blocks(cur),
+        server_name=server_name,
+        db_name=db_name,
+        base_repo_root=base_repo_root,
+        type_str=type_str,
+        last_run_dt=last_run_dt,
+        include_drop=include_drop,
+        include_header=include_header,
+        dry_run=dry_run,
+        verbose=verbose,
+        rescripted=rescripted,
+        sink=sink
+    )
 
+def write_sql_objects(
+    blocks: Iterable[Dict[str, tuple]],
+    server_name: str,
+    db_name: str,
+    base_repo_root: str,
+    type_str: str,
+    last_run_dt: datetime,
+    include_drop: bool = False,
+    include_header: bool = False,
+    dry_run: bool = False,
+    verbose: bool = False,
+    rescripted: Optional[List[Tuple[str, str]]] = None,
+    sink=None
+) -> Tuple[int, int, datetime]:
+    """
+    Writes the objects of one database from blocks of catalog columns (see iter_catalog_blocks).
+    Type and watermark filtering, max_seen and file existence are resolved per block;
+    only objects that need rendering are handled row by row.
+    Returns (changed_count, skipped_count, max_modified_dt).
+    """
     # Layout: <repo-root>/src/<type>/<sanitised-db-name>/<ObjectType>/<Schema>/<Object>.sql
     # NOTE: Original versioner.py layout:
     # base_dir = os.path.join(args.repo_root, SOURCE_FOLDER, args.type or "", sanitise_filename(db_name))
     # dest_dir = os.path.join(base_dir, obj_type_str, sanitise_filename(schema_name))
     # dest_file = os.path.join(dest_dir, f"{sanitise_filename(object_name)}.sql")
-    
-    base_dir = os.path.join(base_repo_root, SOURCE_FOLDER, type_str or "", sanitise_filename(db_name))
-    
-    changed = 0
-    skipped = 0
-    max_seen = last_run_dt
 
-    for row in rows:
-        schema_name = row.SchemaName
-        object_name = row.ObjectName
-        object_type = (row.ObjectType or "").strip()
-        object_definition = row.ObjectDefinition
-        modified_dt = row.ModifiedDate
+    sink = sink or FileSink(base_repo_root)
+    base_rel = os.path.join(SOURCE_FOLDER, type_str or "", sanitise_filename(db_name))
 
-        try:
-            mod_dt = _parse_datetime_to_utc(modified_dt)
-        except Exception:
-            mod_dt = None
+    # Definition hashes of every scripted object, used by drift comparison; kept wherever the sink writes
+    manifest_path = os.path.join(base_rel, MANIFEST_FILE)
+    manifest = load_manifest(manifest_path, db_name, sink=sink)
+    manifest_objects = manifest["objects"]
+    manifest_dirty = False
 
-        if mod_dt is not None and mod_dt > max_seen:
-            max_seen = mod_dt
+    # Watermark comparisons run on naive UTC datetimes, which is what pyodbc returns
+    watermark = last_run_dt.astimezone(timezone.utc).replace(tzinfo=None)
+    max_naive = watermark
+    dir_listings: Dict[str, set] = {}
 
-        if object_type not in ALLOWED_TYPES:
-            if verbose:
-                print(f"SKIP: {schema_name}.{object_name} - object_type '{object_type}' not in allowed types")
-            skipped += 1
-            continue
+    total = 0
+    changed = 0
+    skipped = 0
 
-        if not object_definition:
-            if verbose:
-                print(f"SKIP: {schema_name}.{object_name} - no definition or encrypted")
-            skipped += 1
-            continue
+    for block in blocks:
+        schemas = block["SchemaName"]
+        names = block["ObjectName"]
+        definitions = block["ObjectDefinition"]
+        types = [(t or "").strip() for t in block["ObjectType"]]
+        raw_dates = block["ModifiedDate"]
+        mods = [v if type(v) is datetime and v.tzinfo is None else _utc_naive(v) for v in raw_dates]
+        total += len(names)
 
-        if object_type in VIEW_TYPE:
-            obj_type_str = "VIEW"
-            obj_type_code = "V"
-        elif object_type in PROC_TYPE:
-            obj_type_str = "PROCEDURE"
-            obj_type_code = "P"
-        else:
-            skipped += 1
-            continue
+        block_max = max((m for m in mods if m is not None), default=None)
+        if block_max is not None and block_max > max_naive:
+            max_naive = block_max
 
-        dest_dir = os.path.join(base_dir, obj_type_str, sanitise_filename(schema_name))
-        dest_file = os.path.join(dest_dir, f"{sanitise_filename(object_name)}.sql")
-        
-        file_exists = os.path.exists(dest_file)
+        # Type and definition filters over the whole block
+        wanted = [i for i, t in enumerate(types) if t in ALLOWED_TYPES and definitions[i]]
+        if verbose:
+            for i, t in enumerate(types):
+                if t not in ALLOWED_TYPES:
+                    print(f"SKIP: {schemas[i]}.{names[i]} - object_type '{t}' not in allowed types")
+                elif not definitions[i]:
+                    print(f"SKIP: {schemas[i]}.{names[i]} - no definition or encrypted")
+        skipped += len(names) - len(wanted)
+
+        # Destination paths, with existence resolved from one listing per folder
+        dest_dirs = {}
+        candidates = []
+        for i in wanted:
+            dir_key = (types[i], schemas[i])
+            dest_dir = dest_dirs.get(dir_key)
+            if dest_dir is None:
+                dest_dir = dest_dirs[dir_key] = os.path.join(base_rel, TYPE_FOLDERS[types[i]], sanitise_filename(schemas[i]))
+            listing = dir_listings.get(dest_dir)
+            if listing is None:
+                listing = dir_listings[dest_dir] = sink.list_dir(dest_dir)
+            file_name = f"{sanitise_filename(names[i])}.sql"
+            file_exists = os.path.normcase(file_name) in listing
+            key = manifest_key(schemas[i], names[i], TYPE_FOLDERS[types[i]])
 
-        # Logic: if file exists, check mod date. If logic says skip, skip.
-        if file_exists:
-            if mod_dt is not None:
-                if mod_dt <= last_run_dt:
+            # Logic: if file exists, check mod date. If logic says skip, skip.
+            # Objects missing from the manifest are re-scripted once so it fills in.
+            if file_exists and key in manifest_objects:
+                mod = mods[i]
+                if mod is None:
+                    if verbose:
+                        print(f"SKIP: {schemas[i]}.{names[i]} - unable to determine ModifiedDate")
+                    skipped += 1
+                    continue
+                if mod <= watermark:
                     if verbose:
-                        print(f"SKIP: {schema_name}.{object_name} - modified {mod_dt.isoformat()} <= last_run {last_run_dt.isoformat()}")
+                        print(f"SKIP: {schemas[i]}.{names[i]} - modified {mod.replace(tzinfo=timezone.utc).isoformat()} <= last_run {last_run_dt.isoformat()}")
                     skipped += 1
                     continue
+            elif file_exists:
+                if verbose:
+                    print(f"RESCRIPT: {schemas[i]}.{names[i]} - not in manifest yet")
             else:
                 if verbose:
-                    print(f"SKIP: {schema_name}.{object_name} - unable to determine ModifiedDate")
-                skipped += 1
+                    print(f"NEW: {schemas[i]}.{names[i]} - file doesn't exist, will be added")
+            candidates.append((i, os.path.join(dest_dir, file_name), key))
+
+        for i, dest_file, key in candidates:
+            schema_name = schemas[i]
+            object_name = names[i]
+            object_definition = definitions[i]
+            obj_type_code = types[i]
+            obj_type_str = TYPE_FOLDERS[obj_type_code]
+            mod_dt = mods[i].replace(tzinfo=timezone.utc) if mods[i] is not None else None
+
+            obj_hash = definition_hash(object_definition)
+            sql = render_sql_object(
+                db_name, schema_name, object_name, obj_type_code, obj_type_str, object_definition,
+                modified=mod_dt, definition_hash=obj_hash, include_drop=include_drop, include_header=include_header
+            )
+
+            if rescripted is not None:
+                rescripted.append((schema_name, object_name))
+
+            manifest_objects[key] = {
+                "schema": schema_name,
+                "name": object_name,
+                "type": obj_type_code,
+                "hash": obj_hash,
+                "modified": mod_dt.isoformat() if mod_dt else None,
+                "path": os.path.relpath(dest_file, base_rel).replace(os.sep, "/")
+            }
+            manifest_dirty = True
+
+            if dry_run:
+                if sink.is_different(dest_file, sql):
+                    changed += 1
+                    if verbose:
+                        print(f"WOULD WRITE: {sink.describe(dest_file)}")
+                else:
+                    skipped += 1
+                    if verbose:
+                        print(f"WOULD SKIP (unchanged): {sink.describe(dest_file)}")
                 continue
-        else:
-            if verbose:
-                print(f"NEW: {schema_name}.{object_name} - file doesn't exist, will be added")
-
-        schema_q = bracket_ident(schema_name)
-        object_q = bracket_ident(object_name)
-        
-        drop_stmt = (
-            f"IF OBJECT_ID(N'{schema_q}.{object_q}', '{obj_type_code}') IS NOT NULL "
-            f"DROP {obj_type_str} {schema_q}.{object_q};\nGO\n\n"
-        ) if include_drop else ""
-
-        body = object_definition.replace("\r\n", "\n").rstrip() + "\n"
-
-        parts = []
-        if include_header:
-            header = f"""-- =============================================================
--- Script generated on {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
--- Database: {db_name}
--- Schema: {schema_name}
--- Object: {object_name}
--- Type: {obj_type_str}
--- Modified: {modified_dt}
--- =============================================================
-
-"""
-            parts.append(header)
-
-        parts.append(drop_stmt)
-        parts.append(body)
-
-        sql = "\n".join([p for p in parts if p])
-
-        if dry_run:
-            if is_different(dest_file, sql):
+
+            meta = {
+                "key": object_key(db_name, schema_name, object_name, type_folder=TYPE_FOLDERS[obj_type_code]), "server": server_name, "database": db_name,
+                "schema": schema_name, "name": object_name, "type": obj_type_code, "modified": mod_dt
+            }
+            if sink.write_if_changed(dest_file, sql, meta):
                 changed += 1
                 if verbose:
-                    print(f"WOULD WRITE: {dest_file}")
+                    print(f"WROTE: {sink.describe(dest_file)}")
             else:
                 skipped += 1
                 if verbose:
-                    print(f"WOULD SKIP (unchanged): {dest_file}")
-            continue
+                    print(f"SKIPPED (unchanged): {sink.describe(dest_file)}")
 
-        if write_if_changed(dest_file, sql):
-            changed += 1
-            if verbose:
-                print(f"WROTE: {dest_file}")
-        else:
-            skipped += 1
-            if verbose:
-                print(f"SKIPPED (unchanged): {dest_file}")
+    if verbose:
+        print(f"DEBUG: [Server: {server_name}] fetched {total} rows from database {db_name}")
+
+    if manifest_dirty and not dry_run:
+        save_manifest(manifest_path, manifest, sink=sink)
 
+    max_seen = max_naive.replace(tzinfo=timezone.utc) if max_naive > watermark else last_run_dt
     return changed, skipped, max_seen
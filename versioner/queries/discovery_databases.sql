@@ -0,0 +1,18 @@
+
+SELECT
+    d.name,
+    d.database_id,
+    d.state,
+    d.state_desc,
+    d.create_date,
+    d.compatibility_level,
+    d.is_read_only,
+    -- Same values as discovery_probe.sql, so the cached list can be validated by the probe alone
+    COUNT(*) OVER () AS DatabaseCount,
+    MAX(d.create_date) OVER () AS MaxCreateDate,
+    CHECKSUM_AGG(CHECKSUM(d.name, d.state, d.compatibility_level)) OVER () AS Signature,
+    CONVERT(nvarchar(128), SERVERPROPERTY('Edition')) AS Edition,
+    CONVERT(int, SERVERPROPERTY('EngineEdition')) AS EngineEdition,
+    CONVERT(nvarchar(128), SERVERPROPERTY('ProductVersion')) AS ProductVersion
+FROM sys.databases d
+ORDER BY d.name
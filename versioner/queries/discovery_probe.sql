@@ -0,0 +1,6 @@
+
+SELECT
+    COUNT(*) AS DatabaseCount,
+    MAX(create_date) AS MaxCreateDate,
+    CHECKSUM_AGG(CHECKSUM(name, state, compatibility_level)) AS Signature
+FROM sys.databases
@@ -0,0 +1,11 @@
+
+-- Load signal for low-impact mode: user requests running or waiting right now, and how many of them are blocked.
+-- The extractor's own sessions (APP=versioner...) are not counted. Needs VIEW SERVER STATE.
+SELECT
+    COUNT(*) AS ActiveRequests,
+    COALESCE(SUM(CASE WHEN r.blocking_session_id <> 0 THEN 1 ELSE 0 END), 0) AS BlockedRequests
+FROM sys.dm_exec_requests r
+INNER JOIN sys.dm_exec_sessions s ON s.session_id = r.session_id
+WHERE s.is_user_process = 1
+    AND r.session_id <> @@SPID
+    AND COALESCE(s.program_name, '') NOT LIKE 'versioner%'
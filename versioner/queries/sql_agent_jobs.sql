@@ -18,4 +18,5 @@ SELECT
 FROM msdb.dbo.sysjobs j
 INNER JOIN msdb.dbo.sysjobsteps s ON j.job_id = s.job_id
 WHERE j.enabled = 1 -- Only enabled jobs
+    -- @filters
 ORDER BY j.name, s.step_id
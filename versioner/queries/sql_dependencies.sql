@@ -0,0 +1,19 @@
+
+SELECT
+    DB_NAME() AS DatabaseName,
+    OBJECT_SCHEMA_NAME(d.referencing_id) AS SchemaName,
+    OBJECT_NAME(d.referencing_id) AS ObjectName,
+    o.type AS ObjectType,
+    d.referenced_server_name AS ReferencedServer,
+    COALESCE(d.referenced_database_name, DB_NAME()) AS ReferencedDatabase,
+    COALESCE(d.referenced_schema_name, SCHEMA_NAME(ro.schema_id), SCHEMA_NAME(tt.schema_id), 'dbo') AS ReferencedSchema,
+    d.referenced_entity_name AS ReferencedName,
+    -- Table types live in sys.types, so a TVP parameter is a class 6 (type) reference
+    CASE WHEN tt.user_type_id IS NOT NULL THEN 'TT' ELSE ro.type END AS ReferencedType
+FROM sys.sql_expression_dependencies d
+INNER JOIN sys.objects o ON o.object_id = d.referencing_id
+LEFT JOIN sys.objects ro ON d.referenced_class = 1 AND ro.object_id = d.referenced_id
+LEFT JOIN sys.table_types tt ON d.referenced_class = 6 AND tt.user_type_id = d.referenced_id
+WHERE d.referencing_class = 1 -- Object/column references only
+    AND d.referenced_entity_name IS NOT NULL
+ORDER BY SchemaName, ObjectName
@@ -0,0 +1,10 @@
+
+SELECT
+    h.SchemaName,
+    h.ObjectName,
+    h.ObjectType,
+    HASHBYTES('SHA2_256', h.ObjectDefinition) AS DefinitionHash
+FROM (
+    -- @catalog
+) h
+ORDER BY SchemaName, ObjectName
@@ -1,13 +1,153 @@
 
+-- One pass over the catalog of a database: every scriptable object class as (schema, name, type, definition).
+-- Server-wide batches qualify the catalog views with the database name (see core.catalog.catalog_query).
 SELECT
-    DB_NAME() AS DatabaseName,
-    SCHEMA_NAME(o.schema_id) AS SchemaName,
-    o.name AS ObjectName,
-    o.type AS ObjectType,
-    COALESCE(m.definition, OBJECT_DEFINITION(o.object_id)) AS ObjectDefinition,
-    OBJECTPROPERTY(o.object_id, 'IsEncrypted') AS IsEncrypted,
-    o.modify_date AS ModifiedDate
-FROM sys.objects o
-LEFT JOIN sys.sql_modules m ON o.object_id = m.object_id
-WHERE o.type IN ('V', 'P')
-ORDER BY SchemaName, ObjectName
+    c.DatabaseName,
+    c.SchemaName,
+    c.ObjectName,
+    c.ObjectType,
+    c.ObjectDefinition,
+    c.ModifiedDate
+FROM (
+    -- Views, procedures, functions and DML triggers
+    SELECT
+        @database_name AS DatabaseName,
+        s.name COLLATE DATABASE_DEFAULT AS SchemaName,
+        o.name COLLATE DATABASE_DEFAULT AS ObjectName,
+        o.type AS ObjectType,
+        m.definition COLLATE DATABASE_DEFAULT AS ObjectDefinition,
+        o.modify_date AS ModifiedDate
+    FROM @database.sys.objects o
+    INNER JOIN @database.sys.schemas s ON s.schema_id = o.schema_id
+    LEFT JOIN @database.sys.sql_modules m ON m.object_id = o.object_id
+    WHERE o.type IN ('V', 'P', 'FN', 'IF', 'TF', 'TR')
+
+    UNION ALL
+
+    -- Database-level DDL triggers (not schema-scoped; DT is not a SQL Server type code)
+    SELECT
+        @database_name,
+        N'DATABASE' COLLATE DATABASE_DEFAULT,
+        t.name COLLATE DATABASE_DEFAULT,
+        'DT',
+        m.definition COLLATE DATABASE_DEFAULT,
+        t.modify_date
+    FROM @database.sys.triggers t
+    LEFT JOIN @database.sys.sql_modules m ON m.object_id = t.object_id
+    WHERE t.parent_class = 0
+
+    UNION ALL
+
+    -- Synonyms
+    SELECT
+        @database_name,
+        s.name COLLATE DATABASE_DEFAULT,
+        sn.name COLLATE DATABASE_DEFAULT,
+        'SN',
+        (N'CREATE SYNONYM ' + QUOTENAME(s.name) + N'.' + QUOTENAME(sn.name) + N' FOR ' + sn.base_object_name + N';') COLLATE DATABASE_DEFAULT,
+        sn.modify_date
+    FROM @database.sys.synonyms sn
+    INNER JOIN @database.sys.schemas s ON s.schema_id = sn.schema_id
+
+    UNION ALL
+
+    -- Sequences (current_value is state, not definition, and is left out)
+    SELECT
+        @database_name,
+        s.name COLLATE DATABASE_DEFAULT,
+        sq.name COLLATE DATABASE_DEFAULT,
+        'SO',
+        (N'CREATE SEQUENCE ' + QUOTENAME(s.name) + N'.' + QUOTENAME(sq.name) + NCHAR(10)
+            + N'    AS ' + CASE
+                WHEN t.is_user_defined = 1 THEN QUOTENAME(ts.name) + N'.' + QUOTENAME(t.name)
+                WHEN t.name IN (N'decimal', N'numeric') THEN t.name + N'(' + CONVERT(nvarchar(10), sq.precision) + N', 0)'
+                ELSE t.name
+            END + NCHAR(10)
+            + N'    START WITH ' + CONVERT(nvarchar(40), sq.start_value) + NCHAR(10)
+            + N'    INCREMENT BY ' + CONVERT(nvarchar(40), sq.increment) + NCHAR(10)
+            + N'    MINVALUE ' + CONVERT(nvarchar(40), sq.minimum_value) + NCHAR(10)
+            + N'    MAXVALUE ' + CONVERT(nvarchar(40), sq.maximum_value) + NCHAR(10)
+            + CASE WHEN sq.is_cycling = 1 THEN N'    CYCLE' ELSE N'    NO CYCLE' END + NCHAR(10)
+            + CASE
+                WHEN sq.is_cached = 0 THEN N'    NO CACHE'
+                WHEN sq.cache_size IS NULL THEN N'    CACHE'
+                ELSE N'    CACHE ' + CONVERT(nvarchar(20), sq.cache_size)
+            END + N';') COLLATE DATABASE_DEFAULT,
+        sq.modify_date
+    FROM @database.sys.sequences sq
+    INNER JOIN @database.sys.schemas s ON s.schema_id = sq.schema_id
+    INNER JOIN @database.sys.types t ON t.user_type_id = sq.user_type_id
+    INNER JOIN @database.sys.schemas ts ON ts.schema_id = t.schema_id
+
+    UNION ALL
+
+    -- User-defined table types: columns, then unnamed key and check constraints
+    SELECT
+        @database_name,
+        s.name COLLATE DATABASE_DEFAULT,
+        tt.name COLLATE DATABASE_DEFAULT,
+        'TT',
+        (N'CREATE TYPE ' + QUOTENAME(s.name) + N'.' + QUOTENAME(tt.name) + N' AS TABLE (' + NCHAR(10)
+            + STUFF((
+                SELECT N',' + NCHAR(10) + N'    ' + QUOTENAME(col.name) + N' ' + CASE
+                    WHEN cc.definition IS NOT NULL THEN N'AS ' + cc.definition
+                    ELSE CASE
+                            WHEN ct.is_user_defined = 1 THEN QUOTENAME(cs.name) + N'.' + QUOTENAME(ct.name)
+                            WHEN ct.name IN (N'varchar', N'char', N'varbinary', N'binary')
+                                THEN ct.name + N'(' + CASE WHEN col.max_length = -1 THEN N'max' ELSE CONVERT(nvarchar(10), col.max_length) END + N')'
+                            WHEN ct.name IN (N'nvarchar', N'nchar')
+                                THEN ct.name + N'(' + CASE WHEN col.max_length = -1 THEN N'max' ELSE CONVERT(nvarchar(10), col.max_length / 2) END + N')'
+                            WHEN ct.name IN (N'decimal', N'numeric')
+                                THEN ct.name + N'(' + CONVERT(nvarchar(10), col.precision) + N', ' + CONVERT(nvarchar(10), col.scale) + N')'
+                            WHEN ct.name IN (N'datetime2', N'time', N'datetimeoffset')
+                                THEN ct.name + N'(' + CONVERT(nvarchar(10), col.scale) + N')'
+                            ELSE ct.name
+                        END
+                        + CASE WHEN ic.column_id IS NOT NULL
+                            THEN N' IDENTITY(' + CONVERT(nvarchar(40), ic.seed_value) + N', ' + CONVERT(nvarchar(40), ic.increment_value) + N')'
+                            ELSE N'' END
+                        + CASE WHEN col.is_nullable = 1 THEN N' NULL' ELSE N' NOT NULL' END
+                        + COALESCE(N' DEFAULT ' + dc.definition, N'')
+                END
+                FROM @database.sys.columns col
+                INNER JOIN @database.sys.types ct ON ct.user_type_id = col.user_type_id
+                INNER JOIN @database.sys.schemas cs ON cs.schema_id = ct.schema_id
+                LEFT JOIN @database.sys.identity_columns ic ON ic.object_id = col.object_id AND ic.column_id = col.column_id
+                LEFT JOIN @database.sys.computed_columns cc ON cc.object_id = col.object_id AND cc.column_id = col.column_id
+                LEFT JOIN @database.sys.default_constraints dc ON dc.parent_object_id = col.object_id AND dc.parent_column_id = col.column_id
+                WHERE col.object_id = tt.type_table_object_id
+                ORDER BY col.column_id
+                FOR XML PATH(''), TYPE
+            ).value('.', 'nvarchar(max)'), 1, 2, N'')
+            + COALESCE((
+                SELECT N',' + NCHAR(10) + N'    ' + CASE WHEN kc.type = 'PK' THEN N'PRIMARY KEY ' ELSE N'UNIQUE ' END
+                    + i.type_desc COLLATE DATABASE_DEFAULT + N' ('
+                    + STUFF((
+                        SELECT N', ' + QUOTENAME(kcol.name) + CASE WHEN kic.is_descending_key = 1 THEN N' DESC' ELSE N'' END
+                        FROM @database.sys.index_columns kic
+                        INNER JOIN @database.sys.columns kcol ON kcol.object_id = kic.object_id AND kcol.column_id = kic.column_id
+                        WHERE kic.object_id = i.object_id AND kic.index_id = i.index_id AND kic.is_included_column = 0
+                        ORDER BY kic.key_ordinal
+                        FOR XML PATH(''), TYPE
+                    ).value('.', 'nvarchar(max)'), 1, 2, N'') + N')'
+                FROM @database.sys.key_constraints kc
+                INNER JOIN @database.sys.indexes i ON i.object_id = kc.parent_object_id AND i.index_id = kc.unique_index_id
+                WHERE kc.parent_object_id = tt.type_table_object_id
+                ORDER BY i.index_id
+                FOR XML PATH(''), TYPE
+            ).value('.', 'nvarchar(max)'), N'')
+            + COALESCE((
+                SELECT N',' + NCHAR(10) + N'    CHECK ' + ck.definition
+                FROM @database.sys.check_constraints ck
+                WHERE ck.parent_object_id = tt.type_table_object_id
+                ORDER BY ck.definition
+                FOR XML PATH(''), TYPE
+            ).value('.', 'nvarchar(max)'), N'')
+            + NCHAR(10) + N');') COLLATE DATABASE_DEFAULT,
+        o.modify_date
+    FROM @database.sys.table_types tt
+    INNER JOIN @database.sys.schemas s ON s.schema_id = tt.schema_id
+    INNER JOIN @database.sys.objects o ON o.object_id = tt.type_table_object_id
+) c
+WHERE 1 = 1
+    -- @filters